@@ -1,11 +1,13 @@
 import os
+import base64
+import multiprocessing
 import time
-import smtplib
-from email.message import EmailMessage
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from flask import (
     Flask,
+    g,
     render_template,
     request,
     redirect,
@@ -13,18 +15,63 @@ from flask import (
     session,
     send_from_directory,
     send_file,
+    jsonify,
+    Response,
 )
-from flask_mysqldb import MySQL
-from flask_bcrypt import Bcrypt
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from io import BytesIO
 from PIL import Image
-from requests.exceptions import RequestException  # ★ 누락되었던 부분 추가
+from mosaic_api import mosaic_image, parse_blur_strength
+from image_encoder import (
+    FORMAT_BY_MIME,
+    encode_image,
+    open_for_output,
+    output_extension,
+    parse_max_side,
+    parse_output_format,
+    parse_quality,
+    parse_target_bytes,
+    resolve_output_format,
+)
+from mosaic_backend import create_backend
+from job_queue import JobQueue, JobRunner, STATUS_QUEUED, STATUS_SUCCESS
+from result_cache import ResultCache, make_cache_key
+from uploads import (
+    StreamingRequest,
+    UploadError,
+    UploadSessionStore,
+    commit_upload,
+    commit_zip_images,
+    discard_uploads,
+    is_zip_upload,
+    parse_content_range,
+)
+from face_detect import embed_face_image
+from face_index import get_index, owner_exclusion_enabled
+from video_pipeline import parse_detect_interval
+from thumbnails import ensure_thumbnail, thumbnail_name
+from media_serving import ETagStore
+from storage import create_storage
+from batch import result_arcname, stream_results_zip
+from mail_outbox import EmailOutbox, OutboxWorker, SMTPSender
+from db_pool import PooledMySQL, PoolTimeoutError, db_now
+from password_hasher import PasswordHasher, HasherBusyError
+from schema import (
+    SchemaMigrator,
+    ensure_job_history_schema,
+    ensure_password_resets_schema,
+    media_type_for_filename,
+)
+from maintenance import MANAGED_NAME, MaintenanceScheduler, enforce_quotas, gc_uploads, purge_reset_tokens
+from user_profile import UserProfileLoader
+from metrics import LATENCY_BUCKETS, STAGE_BUCKETS, MetricsRegistry
 
 # ---------------------------
 # Flask 앱 / DB 설정
 # ---------------------------
 app = Flask(__name__)
+# 업로드 파일을 메모리/임시 파일에 모으지 않고 업로드 폴더에 바로 스트리밍한다 (uploads.py 참고).
+app.request_class = StreamingRequest
 app.secret_key = "supersecretkey"  # 적당한 랜덤 값으로 바꿔도 됨이다.
 # 이메일/SMTP 설정
 app.config["SMTP_HOST"] = os.getenv("SMTP_HOST", "smtp.gmail.com")
@@ -33,6 +80,11 @@ app.config["SMTP_USER"] = os.getenv("SMTP_USER", "")
 app.config["SMTP_PASSWORD"] = os.getenv("SMTP_PASSWORD", "")
 app.config["SMTP_SENDER"] = os.getenv("SMTP_SENDER", app.config["SMTP_USER"])
 app.config["BASE_URL"] = os.getenv("BASE_URL", "http://127.0.0.1:5000")
+# 0 이면 STARTTLS/로그인 없이 보낸다 (로컬 디버그 SMTP 서버용).
+app.config["SMTP_AUTH"] = os.getenv("SMTP_AUTH", "1") != "0"
+# 발송 실패 시 재시도 횟수와 첫 재시도 간격(초)이다. 간격은 시도마다 두 배로 늘어난다.
+app.config["MAIL_MAX_ATTEMPTS"] = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+app.config["MAIL_RETRY_DELAY"] = float(os.getenv("MAIL_RETRY_DELAY", "30"))
 
 # MariaDB 연결 설정
 app.config["MYSQL_HOST"] = "211.253.27.46"
@@ -40,9 +92,36 @@ app.config["MYSQL_USER"] = "root"
 app.config["MYSQL_PASSWORD"] = "gkrcjf0821"
 app.config["MYSQL_DB"] = "mozik_db"
 # app.config["MYSQL_CURSORCLASS"] = "DictCursor"  # auth.py에서 dict 접근 쓸 거면 주석 해제하면 됨이다.
-
-mysql = MySQL(app)
-bcrypt = Bcrypt(app)
+# 프로세스당 연결 풀 설정이다 (db_pool.py 참고). 풀 크기는 gunicorn 스레드 수 정도로 둔다.
+app.config["MYSQL_POOL_SIZE"] = int(os.getenv("MYSQL_POOL_SIZE", "10"))
+# 풀이 모두 사용 중일 때 연결을 기다리는 최대 시간(초)이다. 넘으면 503 을 돌려준다.
+app.config["MYSQL_POOL_TIMEOUT"] = float(os.getenv("MYSQL_POOL_TIMEOUT", "5"))
+# 이 시간(초)보다 오래된 연결은 새로 만든다. 서버 wait_timeout 보다 짧아야 한다.
+app.config["MYSQL_POOL_RECYCLE"] = float(os.getenv("MYSQL_POOL_RECYCLE", "1800"))
+# 이 시간(초) 이상 놀던 연결은 빌려주기 전에 ping 으로 확인한다.
+app.config["MYSQL_POOL_PING_IDLE"] = float(os.getenv("MYSQL_POOL_PING_IDLE", "5"))
+app.config["MYSQL_CONNECT_TIMEOUT"] = int(os.getenv("MYSQL_CONNECT_TIMEOUT", "10"))
+# 이 시간(초)을 넘는 쿼리는 경고 로그를 남긴다. 0 이면 끈다.
+app.config["MYSQL_SLOW_QUERY_SECONDS"] = float(os.getenv("MYSQL_SLOW_QUERY_SECONDS", "0.5"))
+# 값이 있으면 MariaDB 대신 이 경로의 SQLite 파일을 쓴다 (로컬 테스트/부하 시험용).
+app.config["DB_SQLITE_PATH"] = os.getenv("DB_SQLITE_PATH", "")
+
+mysql = PooledMySQL(app)
+
+# bcrypt 설정 (password_hasher.py 참고)
+# cost 를 바꾸면 기존 사용자는 다음 로그인 때 새 cost 로 다시 저장된다.
+app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+# 해시 전용 스레드 수이다. 로그인이 몰려도 이 개수만큼의 코어만 bcrypt 에 쓴다.
+app.config["BCRYPT_WORKERS"] = int(os.getenv("BCRYPT_WORKERS", "2"))
+# 이보다 많이 기다리고 있으면 바로 503 으로 거절한다.
+app.config["BCRYPT_MAX_QUEUE"] = int(os.getenv("BCRYPT_MAX_QUEUE", "32"))
+app.config["BCRYPT_TIMEOUT"] = float(os.getenv("BCRYPT_TIMEOUT", "10"))
+bcrypt = PasswordHasher(
+    rounds=app.config["BCRYPT_LOG_ROUNDS"],
+    workers=app.config["BCRYPT_WORKERS"],
+    max_queue=app.config["BCRYPT_MAX_QUEUE"],
+    timeout=app.config["BCRYPT_TIMEOUT"],
+)
 
 # 세션 설정: 브라우저를 닫으면 세션이 사라지도록 설정
 app.config["SESSION_COOKIE_HTTPONLY"] = True
@@ -53,14 +132,408 @@ app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 # 업로드 폴더 설정
 # ---------------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+# 부하 시험(loadtest.py)처럼 저장소 밖의 임시 폴더를 쓸 때는 UPLOAD_FOLDER 로 바꾼다.
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# 받는 중인 업로드 임시 파일 위치이다. 업로드 폴더와 같은 파일시스템이어야 rename 만으로 옮겨진다.
+app.config["UPLOAD_INCOMING_DIR"] = os.path.join(UPLOAD_FOLDER, ".incoming")
+os.makedirs(app.config["UPLOAD_INCOMING_DIR"], exist_ok=True)
+
+# 요청 본문 크기 제한이다. Content-Length 가 넘으면 본문을 읽기 전에 413 으로 끊는다.
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(1024 ** 3)))
+# 사진 업로드(/image, /api/mosaic, /register_face)는 훨씬 작게 제한한다.
+app.config["MAX_IMAGE_UPLOAD_BYTES"] = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(50 * 1024 ** 2)))
+# 이어 올리기(조각 업로드)로 받을 수 있는 동영상 전체 크기와 조각 하나의 최대 크기이다.
+app.config["MAX_RESUMABLE_UPLOAD_BYTES"] = int(os.getenv("MAX_RESUMABLE_UPLOAD_BYTES", str(16 * 1024 ** 3)))
+app.config["UPLOAD_CHUNK_MAX_BYTES"] = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(64 * 1024 ** 2)))
+# /batch 한 번에 처리할 수 있는 사진 수와, 결과 ZIP 을 보내면서 작업이 끝나길 기다리는 최대 시간(초)이다.
+app.config["MAX_BATCH_FILES"] = int(os.getenv("MAX_BATCH_FILES", "200"))
+app.config["BATCH_WAIT_TIMEOUT"] = float(os.getenv("BATCH_WAIT_TIMEOUT", "600"))
+# 썸네일 브라우저 캐시 시간(초)이다. 결과 파일 이름이 작업마다 고유하므로 길게 잡아도 된다.
+app.config["THUMBNAIL_MAX_AGE"] = int(os.getenv("THUMBNAIL_MAX_AGE", str(365 * 24 * 3600)))
+# 결과 파일 전송 방식이다. 비우면 Flask 가 직접 보내고(Range 지원),
+# x-sendfile(Apache/lighttpd) 또는 x-accel(nginx)이면 헤더만 주고 앞단 프록시가 파일을 보낸다.
+app.config["MEDIA_SENDFILE"] = os.getenv("MEDIA_SENDFILE", "").lower()
+# x-accel 일 때 UPLOAD_FOLDER 를 가리키는 nginx internal location 경로이다.
+app.config["MEDIA_ACCEL_PREFIX"] = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-uploads/")
+
+# ---------------------------
+# 지표 (/metrics, metrics.py 참고)
+# ---------------------------
+# 저장소 업로드, 작업 완료 콜백, 요청 훅이 모두 지표를 쓰므로 그보다 먼저 설정과 레지스트리를 만든다.
+# 프로세스 안의 값(DB 풀, 결과 캐시 등)을 모으는 collector 는 그 객체들을 만든 뒤에 등록한다.
+app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "1") != "0"
+# 프로세스별 지표 파일 위치이다. 모든 gunicorn 워커가 같은 디렉터리를 봐야 한다.
+app.config["METRICS_DIR"] = os.getenv("METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+# 프로세스별 값을 파일로 내보내는 간격(초)이다. 다른 워커 값은 이만큼 늦을 수 있다.
+app.config["METRICS_FLUSH_INTERVAL"] = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# 값이 있으면 /metrics 요청에 "Authorization: Bearer <값>" 헤더가 있어야 한다.
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+
+metrics = MetricsRegistry(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+metrics.counter("http_requests_total", "라우트/메서드/상태 코드별 요청 수")
+metrics.histogram("http_request_duration_seconds", "라우트별 응답 시간(스트리밍 응답은 본문 시작까지)", LATENCY_BUCKETS)
+metrics.histogram("upload_receive_seconds", "업로드 본문을 받는 데 걸린 시간", STAGE_BUCKETS)
+metrics.histogram("mosaic_stage_seconds", "모자이크 작업 단계별 시간 (decode/detect/mosaic/encode/write/thumbnail)", STAGE_BUCKETS)
+metrics.histogram("storage_upload_seconds", "결과/업로드 파일을 원격 저장소에 올리는 데 걸린 시간", STAGE_BUCKETS)
+metrics.counter("mosaic_jobs_finished_total", "종류/결과별 끝난 모자이크 작업 수")
+metrics.gauge("mosaic_jobs", "작업 큐의 상태별 작업 수")
+metrics.gauge("mosaic_worker_queue_depth", "프로세스 풀에서 워커 배정을 기다리는 작업 수")
+metrics.histogram("db_query_seconds", "DB 쿼리 실행 시간", LATENCY_BUCKETS)
+metrics.histogram("db_pool_wait_seconds", "DB 연결 풀에서 연결을 기다린 시간", LATENCY_BUCKETS)
+metrics.counter("db_pool_timeouts_total", "DB 연결 풀 대기 시간 초과 횟수")
+metrics.counter("db_connects_total", "새로 연 DB 연결 수")
+metrics.counter("db_reconnects_total", "끊긴 연결을 다시 연 횟수")
+metrics.gauge("db_pool_connections", "상태별 DB 연결 수")
+metrics.gauge("bcrypt_queue_depth", "실행 중이거나 기다리는 bcrypt 작업 수")
+metrics.counter("result_cache_hits_total", "결과 캐시 적중 수")
+metrics.counter("result_cache_misses_total", "결과 캐시 실패 수")
+metrics.counter("result_cache_evictions_total", "용량 초과로 지운 결과 캐시 항목 수")
+metrics.gauge("result_cache_hit_ratio", "결과 캐시 누적 적중률")
+metrics.gauge("result_cache_bytes", "결과 캐시 파일 합계 크기")
+metrics.counter("user_profile_cache_hits_total", "사용자 프로필 캐시 적중 수")
+metrics.counter("user_profile_cache_misses_total", "사용자 프로필 캐시 실패 수 (DB 조회)")
+metrics.gauge("mail_outbox_messages", "메일 발송함의 상태별 메일 수")
+
+# 업로드/결과 파일 저장소 (storage.py 참고)
+# local(기본)은 UPLOAD_FOLDER/ab/cd/<이름> 으로 나눠 저장하고,
+# s3 는 S3 호환 저장소(MinIO 등은 S3_ENDPOINT_URL 로 지정)에 올리고 UPLOAD_FOLDER 를 캐시로 쓴다.
+app.config["STORAGE_BACKEND"] = os.getenv("STORAGE_BACKEND", "local").lower()
+app.config["S3_BUCKET"] = os.getenv("S3_BUCKET", "")
+app.config["S3_PREFIX"] = os.getenv("S3_PREFIX", "")
+app.config["S3_ENDPOINT_URL"] = os.getenv("S3_ENDPOINT_URL", "")
+app.config["S3_REGION"] = os.getenv("S3_REGION", "")
+# 이 크기보다 큰 파일은 이 크기 조각으로 multipart 전송한다.
+app.config["S3_MULTIPART_CHUNK"] = int(os.getenv("S3_MULTIPART_CHUNK", str(16 * 1024 ** 2)))
+storage = create_storage(app.config)
+# 원격 저장소로 올리는 일은 요청/작업 스레드를 막지 않도록 따로 돌린다.
+storage_uploads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage")
+
+
+def _save_to_storage(key: str) -> None:
+    try:
+        started = time.perf_counter()
+        storage.save(key)
+        if app.config["METRICS_ENABLED"]:
+            metrics.observe("storage_upload_seconds", time.perf_counter() - started)
+    except Exception as e:
+        app.logger.error(f"저장소 업로드 실패 ({key}): {e}")
+
+
+def _publish(*keys) -> None:
+    """로컬에 쓴 파일을 원격 저장소에 올린다. 로컬 저장소면 할 일이 없다."""
+    if not storage.remote:
+        return
+    for key in keys:
+        storage_uploads.submit(_save_to_storage, key)
+
+# 모자이크 백엔드 설정
+# process(기본) / inprocess / http 중에서 고른다. 자세한 건 mosaic_backend.py 참고이다.
+app.config["MOSAIC_BACKEND"] = os.getenv("MOSAIC_BACKEND", "process")
+# 작업 하나당 제한 시간(초)이다. 넘기면 해당 워커를 재시작한다.
+app.config["MOSAIC_TIMEOUT"] = float(os.getenv("MOSAIC_TIMEOUT", "60"))
+# 동영상 작업 하나당 제한 시간(초)이다. 프레임 단위 스트리밍이라 길게 잡아도 메모리는 일정하다.
+app.config["MOSAIC_VIDEO_TIMEOUT"] = float(os.getenv("MOSAIC_VIDEO_TIMEOUT", "3600"))
+# gunicorn 워커(웹 프로세스) 수이다. gunicorn 도 이 환경 변수를 기본 워커 수로 읽으므로 둘을 같게 둔다.
+app.config["WEB_CONCURRENCY"] = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# 웹 프로세스 하나의 모자이크 워커 프로세스(그리고 JobRunner 스레드) 수이다.
+# 웹 프로세스마다 자기 풀을 띄우므로 호스트 전체로는 WEB_CONCURRENCY 배가 된다.
+# 그래서 비워 두면 CPU 코어를 웹 프로세스 수로 나눠서 호스트 전체의 CPU 작업 프로세스 수가 코어 수를 넘지 않게 한다.
+app.config["MOSAIC_WORKERS"] = int(os.getenv("MOSAIC_WORKERS", "0")) or max(
+    1, (os.cpu_count() or 1) // app.config["WEB_CONCURRENCY"]
+)
+# http 백엔드일 때만 쓰는 원격 모자이크 서버 주소이다.
+app.config["MOSAIC_API_URL"] = os.getenv(
+    "MOSAIC_API_URL", "http://127.0.0.1:5000/api/mosaic"
+)
+
+mosaic_backend = create_backend(app.config)
+
+if not owner_exclusion_enabled():
+    # 흑백 패치 임베딩으로는 사람을 구별할 수 없으므로 본인 얼굴도 모자이크한다 (face_index.py 참고).
+    app.logger.warning("FACE_EMBEDDER_MODEL 이 없어 본인 얼굴 제외를 끈다. 모든 얼굴을 모자이크한다.")
+
+# 비동기 작업 큐 (로컬 SQLite 파일)
+app.config["JOB_QUEUE_PATH"] = os.getenv("JOB_QUEUE_PATH", os.path.join(BASE_DIR, "jobs.db"))
+job_queue = JobQueue(
+    app.config["JOB_QUEUE_PATH"],
+    # running 상태로 이 시간보다 오래 남은 작업은 처리하던 워커가 죽은 것으로 보고 재처리한다.
+    # 종류마다 자기 제한 시간을 기준으로 잡아서 사진 작업이 동영상 기준으로 오래 묶이지 않게 한다.
+    lease_seconds=app.config["MOSAIC_TIMEOUT"] * 2 + 30,
+    kind_lease_seconds={"video": app.config["MOSAIC_VIDEO_TIMEOUT"] * 2 + 30},
+)
+
+# 결과 캐시 (업로드 SHA-256 + 모자이크 파라미터 → 결과 파일)
+app.config["RESULT_CACHE_DIR"] = os.getenv("RESULT_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+app.config["RESULT_CACHE_MAX_BYTES"] = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+result_cache = ResultCache(
+    app.config["RESULT_CACHE_DIR"],
+    app.config["JOB_QUEUE_PATH"],
+    app.config["RESULT_CACHE_MAX_BYTES"],
+)
+
+# 이어 올리기 세션 (진행 상황은 작업 큐와 같은 SQLite 파일에 둔다)
+upload_sessions = UploadSessionStore(
+    app.config["JOB_QUEUE_PATH"],
+    app.config["UPLOAD_INCOMING_DIR"],
+    app.config["MAX_RESUMABLE_UPLOAD_BYTES"],
+)
+
+# 결과 파일 ETag (내용 SHA-256, 파일당 한 번만 계산)
+media_etags = ETagStore(app.config["JOB_QUEUE_PATH"])
+
+# 작업 기록 한 페이지에 보여줄 개수이다.
+app.config["HISTORY_PAGE_SIZE"] = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+
+# 사용자 프로필 캐시 유지 시간(초)이다. 워커 프로세스마다 따로 캐시하므로 짧게 둔다 (user_profile.py 참고).
+app.config["USER_PROFILE_TTL"] = float(os.getenv("USER_PROFILE_TTL", "30"))
+user_profiles = UserProfileLoader(ttl=app.config["USER_PROFILE_TTL"])
+
+# 필요한 컬럼/인덱스가 없으면 프로세스의 첫 요청에서 한 번 추가하고,
+# users 테이블 기능(face_image 컬럼 유무)도 이때 한 번만 확인한다 (schema.py 참고).
+schema_migrator = SchemaMigrator(
+    [ensure_job_history_schema, ensure_password_resets_schema, user_profiles.detect_features]
+)
+
+# 로그인 전에도 DB 를 쓰는 비밀번호 재설정 화면은 스키마(token_hash)가 필요하다.
+SCHEMA_ENDPOINTS = {"forgot_password", "reset_password"}
+
 
-# 모자이크 API 서버 주소
-# 같은 Flask 앱의 /api/mosaic 엔드포인트를 호출하는 구조이다.
-MOSAIC_API_URL = "http://127.0.0.1:5000/api/mosaic"
+@app.before_request
+def _ensure_schema():
+    if not schema_migrator.done and ("user_id" in session or request.endpoint in SCHEMA_ENDPOINTS):
+        schema_migrator.run(lambda: mysql.connection, app.logger)
+
+
+@app.teardown_request
+def _discard_unclaimed_uploads(exc):
+    # 검증에 실패했거나 중간에 끊긴 업로드 임시 파일을 지운다.
+    discard_uploads(request)
+
+
+@app.errorhandler(UploadError)
+def handle_upload_error(e):
+    return str(e), e.status
+
+
+@app.errorhandler(HasherBusyError)
+def handle_hasher_busy(e):
+    app.logger.warning(f"비밀번호 처리 대기열 초과: {e}")
+    return "요청이 많아 잠시 후 다시 시도해주세요.", 503, {"Retry-After": "2"}
+
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(e):
+    # DB 연결이 모두 사용 중이면 500 대신 잠시 뒤 다시 시도하라고 알려준다.
+    app.logger.error(f"DB 연결 풀 대기 시간 초과: {e}")
+    return "요청이 많아 잠시 후 다시 시도해주세요.", 503, {"Retry-After": "1"}
+
+
+def _on_job_finished(job: dict, status: str, error) -> None:
+    """
+    작업이 끝나면 job_history 의 processing 행을 success/failed 로 갱신한다.
+    러너 스레드에서 불리므로 앱 컨텍스트를 직접 연다.
+    """
+    if app.config["METRICS_ENABLED"]:
+        metrics.inc("mosaic_jobs_finished_total", kind=job["kind"], status=status)
+        for stage, seconds in ((job.get("result") or {}).get("timings") or {}).items():
+            metrics.observe("mosaic_stage_seconds", max(0.0, seconds), kind=job["kind"], stage=stage)
+    if error:
+        app.logger.error("모자이크 작업 실패 (job=%s): %s", job["id"], error)
+    elif job.get("result", {}).get("fps"):
+        app.logger.info(
+            "동영상 작업 완료 (job=%s): %s프레임, %.2f fps",
+            job["id"],
+            job["result"]["frames"],
+            job["result"]["fps"],
+        )
+    if status == STATUS_SUCCESS and job["params"].get("cache_key"):
+        try:
+            result_cache.store(job["params"]["cache_key"], job["output_path"])
+        except OSError as e:
+            app.logger.error(f"결과 캐시 저장 실패: {e}")
+    if status == STATUS_SUCCESS:
+        try:
+            # 첫 다운로드 요청이 전체 파일 해시를 기다리지 않도록 ETag 를 미리 계산해 둔다.
+            media_etags.get(job["output_path"])
+        except OSError as e:
+            app.logger.error(f"ETag 계산 실패: {e}")
+        keys = [os.path.basename(job["input_path"]), os.path.basename(job["output_path"])]
+        # 워커가 결과와 함께 썸네일도 만들어 두었으면 같이 올린다.
+        if (job.get("result") or {}).get("thumbnail"):
+            keys.append(job["result"]["thumbnail"])
+        _publish(*keys)
+    if not job.get("history_id"):
+        return
+    with app.app_context():
+        try:
+            cur = mysql.connection.cursor()
+            cur.execute(
+                "UPDATE job_history SET status = %s WHERE id = %s",
+                (status, job["history_id"]),
+            )
+            mysql.connection.commit()
+            cur.close()
+        except Exception as e:
+            app.logger.error(f"작업 상태 갱신 실패: {e}")
+
+
+# 풀 크기만큼 러너 스레드를 두어 워커가 놀지 않게 한다 (MOSAIC_WORKERS 는 호스트 코어를 웹 프로세스 수로 나눈 값).
+job_runner = JobRunner(
+    job_queue,
+    mosaic_backend,
+    on_finish=_on_job_finished,
+    threads=app.config["MOSAIC_WORKERS"],
+    logger=app.logger,
+)
+# 메일 발송함은 작업 큐와 같은 로컬 SQLite 파일에 둔다 (mail_outbox.py 참고).
+mail_outbox = EmailOutbox(
+    app.config["JOB_QUEUE_PATH"],
+    max_attempts=app.config["MAIL_MAX_ATTEMPTS"],
+    base_delay=app.config["MAIL_RETRY_DELAY"],
+)
+mail_worker = OutboxWorker(
+    mail_outbox,
+    SMTPSender(
+        app.config["SMTP_HOST"],
+        app.config["SMTP_PORT"],
+        app.config["SMTP_USER"],
+        app.config["SMTP_PASSWORD"],
+        app.config["SMTP_SENDER"],
+        use_auth=app.config["SMTP_AUTH"],
+    ),
+    logger=app.logger,
+)
+# ---------------------------
+# 정기 정리 작업 (maintenance.py 참고)
+# ---------------------------
+app.config["MAINTENANCE_ENABLED"] = os.getenv("MAINTENANCE_ENABLED", "1") != "0"
+# 참조 없는 업로드 파일을 지우기 전에 기다리는 시간(초)이다.
+app.config["UPLOAD_GC_GRACE"] = float(os.getenv("UPLOAD_GC_GRACE", str(6 * 3600)))
+# 사용자별 작업 파일 합계 한도(바이트)이다. 0 이면 제한하지 않는다.
+app.config["USER_QUOTA_BYTES"] = int(os.getenv("USER_QUOTA_BYTES", str(5 * 1024 ** 3)))
+
+maintenance = MaintenanceScheduler(app.config["JOB_QUEUE_PATH"], logger=app.logger)
+
+
+def _forget_etag(path: str) -> None:
+    media_etags.forget(path)
+
+
+def _maintenance_task(func):
+    # 스케줄러 스레드에서 불리므로 앱 컨텍스트를 열고, 스키마 보강이 안 됐으면 먼저 한다.
+    def run():
+        with app.app_context():
+            schema_migrator.run(lambda: mysql.connection, app.logger)
+            return func(mysql.connection)
+    return run
+
+
+maintenance.add("purge_reset_tokens", 3600, _maintenance_task(purge_reset_tokens))
+maintenance.add(
+    "gc_uploads",
+    6 * 3600,
+    _maintenance_task(
+        lambda conn: gc_uploads(conn, storage, app.config["UPLOAD_GC_GRACE"], on_delete=_forget_etag)
+    ),
+)
+maintenance.add(
+    "enforce_quotas",
+    6 * 3600,
+    _maintenance_task(
+        lambda conn: enforce_quotas(conn, storage, app.config["USER_QUOTA_BYTES"], on_delete=_forget_etag)
+    ),
+)
+maintenance.add("purge_upload_sessions", 3600, upload_sessions.purge_stale)
+maintenance.add("purge_mail_outbox", 3600, mail_outbox.purge)
+# 샤드 도입 전에 UPLOAD_FOLDER 에 바로 저장된 파일을 조금씩 샤드 위치로 옮긴다.
+maintenance.add(
+    "migrate_flat_uploads",
+    3600,
+    lambda: storage.migrate_flat(min_age=app.config["UPLOAD_GC_GRACE"], managed=MANAGED_NAME.match),
+)
+if storage.remote:
+    # 버킷에 올라간 뒤 하루 동안 쓰지 않은 로컬 캐시 파일을 지운다.
+    maintenance.add("trim_storage_cache", 3600, storage.trim_cache)
+
+# ---------------------------
+# 지표 수집 (레지스트리는 위 "지표" 설정에서 만든다)
+# ---------------------------
+def _process_metrics() -> list:
+    # 프로세스 안에서 따로 누적되는 값을 지표 파일에 함께 쓴다.
+    db = mysql.metrics.stats()
+    samples = [
+        ("db_query_seconds", {}, db["query"]),
+        ("db_pool_wait_seconds", {}, db["pool_wait"]),
+        ("db_pool_timeouts_total", {}, db["timeouts"]),
+        ("db_connects_total", {}, db["connects"]),
+        ("db_reconnects_total", {}, db["reconnects"]),
+        ("bcrypt_queue_depth", {}, bcrypt.queue_depth()),
+        ("user_profile_cache_hits_total", {}, user_profiles.hits),
+        ("user_profile_cache_misses_total", {}, user_profiles.misses),
+    ]
+    pool = mysql.pool.status()
+    samples.append(("db_pool_connections", {"state": "in_use"}, pool["in_use"]))
+    samples.append(("db_pool_connections", {"state": "idle"}, pool["idle"]))
+    worker_pool = getattr(mosaic_backend, "pool", None)
+    if worker_pool is not None:
+        samples.append(("mosaic_worker_queue_depth", {}, worker_pool.queue_depth()))
+    return samples
+
+
+metrics.collector(_process_metrics)
+
+
+def _shared_metrics() -> list:
+    # SQLite 파일에 있어서 이미 모든 프로세스 합계인 값이다.
+    samples = [("mosaic_jobs", {"status": status}, count) for status, count in job_queue.counts().items()]
+    cache = result_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    samples += [
+        ("result_cache_hits_total", {}, cache["hits"]),
+        ("result_cache_misses_total", {}, cache["misses"]),
+        ("result_cache_evictions_total", {}, cache["evictions"]),
+        ("result_cache_hit_ratio", {}, cache["hits"] / lookups if lookups else 0),
+        ("result_cache_bytes", {}, cache["bytes"]),
+    ]
+    samples += [("mail_outbox_messages", {"status": status}, count) for status, count in mail_outbox.counts().items()]
+    return samples
+
+
+@app.before_request
+def _start_timer():
+    g._request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.pop("_request_started", None)
+    if app.config["METRICS_ENABLED"] and started is not None:
+        # 경로 대신 URL 규칙(/jobs/<int:job_id>)을 라벨로 써서 라벨 종류가 늘어나지 않게 한다.
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, route=route, method=request.method)
+        metrics.inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not app.config["METRICS_ENABLED"]:
+        return "지표가 꺼져 있음이다.", 404
+    token = app.config["METRICS_TOKEN"]
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return "인증이 필요함이다.", 401
+    return Response(metrics.render(_shared_metrics()), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+# spawn 된 모자이크 워커가 이 모듈을 다시 import 할 때는 러너를 띄우지 않는다.
+if multiprocessing.parent_process() is None:
+    job_runner.start()
+    mail_worker.start()
+    if app.config["MAINTENANCE_ENABLED"]:
+        maintenance.start()
 
 
 # ---------------------------
@@ -93,64 +566,261 @@ def upload_video():
     if file.filename == "":
         return "선택된 파일이 없음이다.", 400
 
-    # 파일 이름 안전하게 변환 후 저장
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(input_path)
+    upload = commit_upload(file, storage, "video")
+    return _enqueue_mosaic_job("video", upload)
 
-    # ---------------------------
-    # 모자이크 API 호출
-    # ---------------------------
-    try:
-        with open(input_path, "rb") as f:
-            resp = requests.post(
-                MOSAIC_API_URL,
-                files={"file": f},
-                timeout=60,
-            )
-    except RequestException as e:
-        app.logger.exception("모자이크 API 서버 호출 중 예외 발생")
-        return f"모자이크 API 서버 호출 중 예외 발생: {e}", 502
-
-    # 정상 응답(200)이 아니면 실패로 처리한다.
-    if resp.status_code != 200:
-        app.logger.error(
-            "모자이크 API 호출 실패: status=%s, body=%s",
-            resp.status_code,
-            resp.text[:200],
-        )
-        return (
-            f"모자이크 API 호출 실패임이다. "
-            f"status={resp.status_code}, body={resp.text}",
-            502,
-        )
 
-    # 모자이크 API가 이미지 바이너리를 바로 돌려준다고 가정한다.
-    out_name = "mosaic_" + filename
-    output_path = os.path.join(app.config["UPLOAD_FOLDER"], out_name)
-    with open(output_path, "wb") as out_f:
-        out_f.write(resp.content)
+def _prepare_mosaic_job(kind: str, upload: dict, form, user_id) -> dict:
+    """
+    저장된 업로드(commit_upload / upload_sessions.finish 결과)와 폼 옵션으로 작업 하나를 준비한다.
+    결과 파일 이름/경로와 캐시 키를 정하고, 같은 내용 + 같은 옵션의 결과가 캐시에 있으면 결과 자리에 바로 링크한다.
+    """
+    # 업로드는 받으면서 이미 고유한 이름으로 저장되고 SHA-256 도 계산되어 있다.
+    content_hash = upload["sha256"]
+    if app.config["METRICS_ENABLED"] and upload.get("receive_seconds") is not None:
+        metrics.observe("upload_receive_seconds", upload["receive_seconds"], kind=kind)
+
+    blur_strength = form.get("blur_strength", "0")
+    # 체크박스가 꺼져 있으면 폼에 값이 오지 않으므로 전체 프레임 모자이크로 처리한다.
+    face_only = bool(form.get("face_only"))
+    detect_interval = parse_detect_interval(form.get("detect_interval"))
+    # 사진 출력 옵션: 형식(기본은 입력 형식 유지), 품질, 목표 크기(KB), 결과 긴 변 길이
+    output_options = {}
+    out_name = "mosaic_" + upload["stored_name"]
+    if kind == "image":
+        output_options = {
+            "output_format": parse_output_format(form.get("output_format")),
+            "quality": parse_quality(form.get("quality")),
+            "target_bytes": parse_target_bytes(form.get("target_kb")),
+            "max_side": parse_max_side(form.get("max_side")),
+        }
+        # 파일 이름의 확장자와 실제 저장 형식이 항상 같게 한다.
+        ext = output_extension(output_options["output_format"], FORMAT_BY_MIME.get(upload["mime"]))
+        out_name = os.path.splitext(out_name)[0] + ext
+    output_path = storage.work_path(out_name)
+
+    # 결과가 달라지는 값만 캐시 키에 넣는다.
+    cache_params = {"blur_strength": parse_blur_strength(blur_strength), "face_only": face_only}
+    cache_params.update(output_options)
+    if face_only:
+        # 본인 얼굴 제외 결과는 등록 얼굴에 따라 달라진다 (얼굴 인식 모델이 없으면 제외하지 않으므로 상관없음).
+        if owner_exclusion_enabled():
+            cache_params["owner_face"] = get_index().fingerprint(user_id)
+        if kind == "video":
+            cache_params["detect_interval"] = detect_interval
+    cache_key = make_cache_key(content_hash, kind, cache_params, os.path.splitext(out_name)[1])
+
+    return {
+        "kind": kind,
+        "upload": upload,
+        "out_name": out_name,
+        "output_path": output_path,
+        "blur_strength": blur_strength,
+        "cache_hit": result_cache.lookup(cache_key, output_path),
+        "params": {
+            "blur_strength": blur_strength,
+            "face_only": face_only,
+            # 등록해 둔 본인 얼굴은 모자이크하지 않는다.
+            "exclude_user_id": user_id,
+            # 동영상만 쓰는 값: 몇 프레임마다 얼굴을 탐지할지 (품질/속도 조절)
+            "detect_interval": detect_interval,
+            **output_options,
+            "cache_key": cache_key,
+        },
+    }
+
 
-    # 작업 기록 DB에 저장
-    user_id = session.get("user_id")
-    blur_strength = request.form.get("blur_strength", "0")
-    
+def _record_history(user_id, jobs: list) -> list:
+    """
+    준비된 작업들의 job_history 행을 INSERT 한 번으로 넣고 각 행의 id 목록을 돌려준다 (실패하면 None).
+    캐시 적중이면 바로 success, 아니면 processing 으로 넣는다.
+    """
+    if not jobs:
+        return []
     try:
         cur = mysql.connection.cursor()
         cur.execute(
-            "INSERT INTO job_history (user_id, original_filename, output_filename, blur_strength, status) VALUES (%s, %s, %s, %s, %s)",
-            (user_id, filename, out_name, blur_strength, "success"),
+            "INSERT INTO job_history (user_id, original_filename, output_filename, blur_strength, status, media_type) VALUES "
+            + ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(jobs)),
+            [
+                value
+                for job in jobs
+                for value in (
+                    user_id,
+                    job["upload"]["filename"],
+                    job["out_name"],
+                    job["blur_strength"],
+                    "success" if job["cache_hit"] else "processing",
+                    job["kind"],
+                )
+            ],
         )
+        if len(jobs) == 1:
+            ids = {jobs[0]["out_name"]: cur.lastrowid}
+        else:
+            # 여러 행 INSERT 의 AUTO_INCREMENT 값은 연속이라는 보장이 없으므로 고유한 결과 파일 이름으로 다시 찾는다.
+            cur.execute(
+                "SELECT id, output_filename FROM job_history WHERE user_id = %s AND output_filename IN ("
+                + ", ".join(["%s"] * len(jobs))
+                + ")",
+                [user_id] + [job["out_name"] for job in jobs],
+            )
+            ids = {row[1]: row[0] for row in cur.fetchall()}
         mysql.connection.commit()
         cur.close()
     except Exception as e:
         app.logger.error(f"작업 기록 저장 실패: {e}")
+        return [None] * len(jobs)
+    return [ids.get(job["out_name"]) for job in jobs]
+
+
+def _submit_jobs(user_id, jobs: list) -> list:
+    """준비된 작업들을 job_history 에 기록하고 작업 큐에 한 번에 넣은 뒤 작업 id 목록을 돌려준다."""
+    history_ids = _record_history(user_id, jobs)
+    job_ids = job_queue.enqueue_many(
+        [
+            {
+                "kind": job["kind"],
+                "input_path": job["upload"]["path"],
+                "output_path": job["output_path"],
+                "user_id": user_id,
+                "history_id": history_id,
+                "params": job["params"],
+                "status": STATUS_SUCCESS if job["cache_hit"] else STATUS_QUEUED,
+                "result": {"cached": True} if job["cache_hit"] else None,
+            }
+            for job, history_id in zip(jobs, history_ids)
+        ]
+    )
+    for job in jobs:
+        if job["cache_hit"]:
+            # 캐시에서 하드링크한 결과와 입력은 처리 없이 바로 저장소에 올린다.
+            _publish(job["upload"]["stored_name"], job["out_name"])
+    if not all(job["cache_hit"] for job in jobs):
+        job_runner.notify()
+    return job_ids
+
 
-    # 결과 페이지 렌더링 (모자이크된 이미지 보여주기)
+def _enqueue_mosaic_job(kind: str, upload: dict):
+    """
+    업로드 하나를 job_history 에 기록하고 작업 큐에 등록한다.
+    처리가 끝나길 기다리지 않고 바로 결과 페이지(상태 폴링)를 돌려준다.
+    """
+    job = _prepare_mosaic_job(kind, upload, request.form, session.get("user_id"))
+    job_id = _submit_jobs(session.get("user_id"), [job])[0]
+
+    # 결과 페이지 렌더링 (처리 상태를 폴링하다가 끝나면 결과를 보여준다)
     return render_template(
         "result.html",
-        image_url=url_for("uploaded_file", filename=out_name),
-    )
+        job_id=job_id,
+        status_url=url_for("job_status", job_id=job_id),
+        image_url=url_for("uploaded_file", filename=job["out_name"]),
+        file_type=kind,
+    ), (200 if job["cache_hit"] else 202)
+
+
+# ---------------------------
+# 이어 올리기 (수 GB 동영상 조각 업로드) 라우트
+# ---------------------------
+# POST /uploads/sessions                  {filename, size} → 세션 생성 (201)
+# GET  /uploads/sessions/<id>             → 지금까지 받은 offset (끊긴 뒤 이어 올릴 위치)
+# PUT  /uploads/sessions/<id>             Content-Range 헤더 + 조각 본문 → 새 offset
+# POST /uploads/sessions/<id>/complete    모자이크 옵션 폼 → 작업 등록 후 결과 페이지
+def _get_upload_session(upload_id):
+    upload = upload_sessions.get(upload_id)
+    if upload is None or upload["user_id"] != session.get("user_id"):
+        return None
+    return upload
+
+
+def _upload_session_payload(upload: dict) -> dict:
+    return {
+        "id": upload["id"],
+        "offset": upload["received"],
+        "size": upload["size"],
+        "upload_url": url_for("upload_session_chunk", upload_id=upload["id"]),
+        "complete_url": url_for("upload_session_complete", upload_id=upload["id"]),
+    }
+
+
+@app.route("/uploads/sessions", methods=["POST"])
+def create_upload_session():
+    if "user_id" not in session:
+        return jsonify({"error": "로그인이 필요합니다."}), 401
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        size = int(data.get("size", 0))
+    except (TypeError, ValueError):
+        size = 0
+    try:
+        upload = upload_sessions.create(session.get("user_id"), "video", data.get("filename", ""), size)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(_upload_session_payload(upload)), 201
+
+
+@app.route("/uploads/sessions/<upload_id>", methods=["GET", "PUT"])
+def upload_session_chunk(upload_id):
+    if "user_id" not in session:
+        return jsonify({"error": "로그인이 필요합니다."}), 401
+
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return jsonify({"error": "업로드를 찾을 수 없습니다."}), 404
+    if request.method == "GET":
+        return jsonify(_upload_session_payload(upload))
+
+    # 조각 하나의 크기 제한이다. 본문은 request.stream 으로 조금씩 읽어 바로 파일에 붙인다.
+    request.max_content_length = app.config["UPLOAD_CHUNK_MAX_BYTES"]
+    try:
+        start, _, total = parse_content_range(request.headers.get("Content-Range"))
+        upload["received"] = upload_sessions.append(upload, start, total, request.stream)
+    except UploadError as e:
+        payload = {"error": str(e)}
+        if e.status == 409:
+            payload["offset"] = upload["received"]
+        return jsonify(payload), e.status
+    return jsonify(_upload_session_payload(upload))
+
+
+@app.route("/uploads/sessions/<upload_id>/complete", methods=["POST"])
+def upload_session_complete(upload_id):
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+
+    upload = _get_upload_session(upload_id)
+    if upload is None:
+        return "업로드를 찾을 수 없음이다.", 404
+    return _enqueue_mosaic_job(upload["kind"], upload_sessions.finish(upload, storage))
+
+
+# ---------------------------
+# 작업 상태 조회 라우트
+# ---------------------------
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    """
+    작업 상태(queued/running/success/failed)를 JSON 으로 돌려준다.
+    """
+    if "user_id" not in session:
+        return jsonify({"error": "로그인이 필요합니다."}), 401
+
+    job = job_queue.get(job_id)
+    if job is None or job["user_id"] != session.get("user_id"):
+        return jsonify({"error": "작업을 찾을 수 없습니다."}), 404
+
+    payload = {"id": job["id"], "kind": job["kind"], "status": job["status"]}
+    if job["status"] == STATUS_SUCCESS:
+        payload["output_url"] = url_for(
+            "uploaded_file", filename=os.path.basename(job["output_path"])
+        )
+    if job["result"]:
+        # 동영상이면 frames / seconds / fps(처리 속도)가 들어 있다.
+        payload["result"] = job["result"]
+    if job["error"]:
+        payload["error"] = job["error"]
+    return jsonify(payload)
 
 
 # ---------------------------
@@ -167,84 +837,110 @@ def upload_image():
         return render_template("image.html")
 
     # POST 요청 (폼에서 파일 업로드)
+    # 여러 장이나 ZIP 도 받을 수 있으므로 요청 전체는 MAX_CONTENT_LENGTH 로 두고,
+    # 사진 크기 한도(MAX_IMAGE_UPLOAD_BYTES)는 commit_upload 에서 파일마다 적용한다.
     if "file" not in request.files:
         return "파일이 전송되지 않았음이다.", 400
 
-    file = request.files["file"]
-
-    if file.filename == "":
+    files = [f for f in request.files.getlist("file") if f.filename]
+    if not files:
         return "선택된 파일이 없음이다.", 400
 
-    # 파일 이름 안전하게 변환 후 저장
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(input_path)
+    # 여러 장이나 ZIP 은 첫 장만 처리하고 나머지를 버리지 않도록 이미 받은 파일로 /batch 처럼 처리한다.
+    if len(files) > 1 or is_zip_upload(files[0]):
+        return _batch_response(files)
 
-    # ---------------------------
-    # 모자이크 API 호출
-    # ---------------------------
-    try:
-        with open(input_path, "rb") as f:
-            resp = requests.post(
-                MOSAIC_API_URL,
-                files={"file": f},
-                timeout=60,
-            )
-    except RequestException as e:
-        app.logger.exception("모자이크 API 서버 호출 중 예외 발생")
-        return f"모자이크 API 서버 호출 중 예외 발생: {e}", 502
-
-    # 정상 응답(200)이 아니면 실패로 처리한다.
-    if resp.status_code != 200:
-        app.logger.error(
-            "모자이크 API 호출 실패: status=%s, body=%s",
-            resp.status_code,
-            resp.text[:200],
-        )
-        return (
-            f"모자이크 API 호출 실패임이다. "
-            f"status={resp.status_code}, body={resp.text}",
-            502,
-        )
+    upload = commit_upload(files[0], storage, "image", max_bytes=app.config["MAX_IMAGE_UPLOAD_BYTES"])
+    return _enqueue_mosaic_job("image", upload)
 
-    # 모자이크 API가 이미지 바이너리를 바로 돌려준다고 가정한다.
-    out_name = "mosaic_" + filename
-    output_path = os.path.join(app.config["UPLOAD_FOLDER"], out_name)
-    with open(output_path, "wb") as out_f:
-        out_f.write(resp.content)
 
-    # 작업 기록 DB에 저장
-    user_id = session.get("user_id")
-    blur_strength = request.form.get("blur_strength", "0")
-    
+# ---------------------------
+# 여러 장 한 번에 처리 (batch.py 참고)
+# ---------------------------
+@app.route("/batch", methods=["POST"])
+def upload_batch():
+    """
+    사진 여러 장(file 필드 여러 개) 또는 사진을 담은 ZIP 을 받아 한꺼번에 작업 큐에 넣고,
+    끝나는 순서대로 결과를 담은 ZIP 을 스트리밍으로 돌려준다. 모자이크 옵션은 /image 와 같다.
+    """
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+
+    files = [f for f in request.files.getlist("file") if f.filename]
+    if not files:
+        return "선택된 파일이 없음이다.", 400
+    return _batch_response(files)
+
+
+def _batch_response(files: list):
+    """
+    받은 파일 목록(사진 여러 장 / ZIP)을 작업 큐에 넣고 결과 ZIP 스트리밍 응답을 만든다 (/batch, /image 공용).
+    사진 크기 한도는 파일(ZIP 은 항목)마다 적용하고, 넘는 파일은 건너뛴 목록에 넣는다.
+    """
+    max_files = app.config["MAX_BATCH_FILES"]
+    max_bytes = app.config["MAX_IMAGE_UPLOAD_BYTES"]
+    uploads, skipped = [], []
     try:
-        cur = mysql.connection.cursor()
-        cur.execute(
-            "INSERT INTO job_history (user_id, original_filename, output_filename, blur_strength, status) VALUES (%s, %s, %s, %s, %s)",
-            (user_id, filename, out_name, blur_strength, "success"),
-        )
-        mysql.connection.commit()
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"작업 기록 저장 실패: {e}")
+        for file in files:
+            if is_zip_upload(file):
+                found, missed = commit_zip_images(file, storage, max_files - len(uploads), max_bytes)
+                uploads.extend(found)
+                skipped.extend(missed)
+                continue
+            if len(uploads) >= max_files:
+                raise UploadError(f"한 번에 최대 {max_files}장까지 올릴 수 있습니다.", 413)
+            try:
+                uploads.append(commit_upload(file, storage, "image", max_bytes=max_bytes))
+            except UploadError:
+                skipped.append(file.filename)
+    except UploadError:
+        for upload in uploads:
+            storage.delete(upload["stored_name"])
+        raise
+    if not uploads:
+        return "처리할 사진이 없음이다.", 415
 
-    # 결과 페이지 렌더링 (모자이크된 이미지 보여주기)
-    return render_template(
-        "result.html",
-        image_url=url_for("uploaded_file", filename=out_name),
+    user_id = session.get("user_id")
+    jobs = [_prepare_mosaic_job("image", upload, request.form, user_id) for upload in uploads]
+    # job_history 는 INSERT 한 번, 작업 큐도 트랜잭션 한 번으로 넣는다.
+    job_ids = _submit_jobs(user_id, jobs)
+
+    used = set()
+    entries = {
+        job_id: result_arcname(job["upload"]["filename"], job["out_name"], used)
+        for job_id, job in zip(job_ids, jobs)
+    }
+    # 요청 컨텍스트를 잡아 두지 않는다 (DB 연결은 응답 시작과 함께 풀로 돌아간다).
+    body = stream_results_zip(
+        job_queue,
+        storage,
+        entries,
+        wait=job_runner.wait_finished,
+        timeout=app.config["BATCH_WAIT_TIMEOUT"],
+        skipped=skipped,
+    )
+    return Response(
+        body,
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=mosaic_batch.zip",
+            # 앞단 프록시(nginx)가 결과를 모아서 보내지 않고 바로 흘려 보내게 한다.
+            "X-Accel-Buffering": "no",
+        },
     )
 
 
 # ---------------------------
-# 내부 모자이크 API (테스트용)
+# 모자이크 API (http 백엔드용 원격 엔드포인트)
 # ---------------------------
 @app.route("/api/mosaic", methods=["POST"])
 def api_mosaic():
     """
     업로드된 이미지를 받아서 모자이크 처리 후 다시 돌려주는 API이다.
-    지금은 테스트용으로 '원본 그대로' 돌려준다.
-    나중에 여기 안에 실제 모자이크 처리 코드를 넣으면 된다.
+    blur_strength(0~100) 폼 값에 따라 블록 크기를 정해 픽셀화한다.
+    output_format / quality / target_kb / max_side 로 결과 형식과 크기를 고를 수 있다 (기본은 입력 형식 유지).
     """
+    request.max_content_length = app.config["MAX_IMAGE_UPLOAD_BYTES"]
     if "file" not in request.files:
         return "file 필드가 없음이다.", 400
 
@@ -253,17 +949,29 @@ def api_mosaic():
         return "파일명이 비어 있음이다.", 400
 
     try:
-        # 업로드된 파일을 PIL 이미지로 열기
-        img = Image.open(up_file.stream).convert("RGB")
+        # 업로드된 파일을 PIL 이미지로 열기 (작은 결과만 필요하면 JPEG 은 줄여서 디코드한다)
+        img = open_for_output(up_file.stream, parse_max_side(request.form.get("max_side")))
+        fmt, progressive = resolve_output_format(request.form.get("output_format"), img.format)
+        icc_profile = img.info.get("icc_profile")
 
-        # TODO: 여기에서 img에 모자이크 처리 로직을 적용하면 됨이다.
-        # 예: img = do_mosaic(img)
+        # NumPy 블록 평균 픽셀화 적용
+        blur_strength = parse_blur_strength(request.form.get("blur_strength", "0"))
+        face_only = bool(request.form.get("face_only"))
+        img = mosaic_image(img, blur_strength, face_only)
 
         # 다시 바이너리로 변환해서 응답
         buf = BytesIO()
-        img.save(buf, format="JPEG")
+        encode_image(
+            img,
+            buf,
+            fmt,
+            progressive,
+            quality=parse_quality(request.form.get("quality")),
+            target_bytes=parse_target_bytes(request.form.get("target_kb")),
+            icc_profile=icc_profile,
+        )
         buf.seek(0)
-        return send_file(buf, mimetype="image/jpeg")
+        return send_file(buf, mimetype=Image.MIME[fmt])
     except Exception as e:
         return f"모자이크 처리 중 오류 발생임이다: {e}", 500
 
@@ -271,7 +979,42 @@ def api_mosaic():
 # 업로드된 파일을 직접 서빙하는 라우트
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    # 받는 중인 업로드 임시 파일(.incoming)은 내보내지 않는다.
+    if filename.startswith("."):
+        return "파일을 찾을 수 없음이다.", 404
+    return storage.serve(
+        filename,
+        media_etags,
+        mode=app.config["MEDIA_SENDFILE"],
+        accel_prefix=app.config["MEDIA_ACCEL_PREFIX"],
+    )
+
+
+# 작업 기록 화면용 썸네일 (결과 파일 이름으로 요청)
+@app.route("/thumbs/<path:filename>")
+def thumbnail(filename):
+    # 썸네일이 이미 있으면 결과 파일을 (원격 저장소에서) 받지 않고 바로 보낸다.
+    thumb_path = storage.local_path(thumbnail_name(filename))
+    if thumb_path is None:
+        output_path = storage.local_path(filename)
+        if output_path is None:
+            return "파일을 찾을 수 없음이다.", 404
+        try:
+            # 보통 작업 워커가 미리 만들어 두고, 캐시 적중 결과나 예전 작업은 처음 요청 때 만든다.
+            thumb_path = ensure_thumbnail(output_path)
+        except Exception as e:
+            app.logger.error(f"썸네일 생성 실패 ({filename}): {e}")
+            return "썸네일을 만들 수 없음이다.", 404
+        _publish(thumbnail_name(filename))
+    response = send_from_directory(
+        os.path.dirname(thumb_path),
+        os.path.basename(thumb_path),
+        mimetype="image/webp",
+        max_age=app.config["THUMBNAIL_MAX_AGE"],
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 # ---------------------------
@@ -280,6 +1023,7 @@ def uploaded_file(filename):
 def send_reset_email(to_email: str, token: str) -> None:
     """
     비밀번호 재설정 링크를 포함한 이메일을 발송한다.
+    메일은 발송함에 넣기만 하고 OutboxWorker 가 백그라운드에서 보낸다.
     SMTP 설정이 비어 있으면 로깅만 수행한다.
     """
     reset_url = f"{app.config['BASE_URL']}/reset-password/{token}"
@@ -292,23 +1036,17 @@ def send_reset_email(to_email: str, token: str) -> None:
         "링크는 1시간 후 만료됩니다.\n"
     )
 
-    if not app.config["SMTP_USER"] or not app.config["SMTP_PASSWORD"]:
+    if app.config["SMTP_AUTH"] and (not app.config["SMTP_USER"] or not app.config["SMTP_PASSWORD"]):
         app.logger.warning("SMTP 설정이 비어 있어 이메일을 보내지 못했습니다.")
         return
 
-    message = EmailMessage()
-    message["Subject"] = subject
-    message["From"] = app.config["SMTP_SENDER"]
-    message["To"] = to_email
-    message.set_content(body)
-
+    # 실제 발송은 발송함 워커가 한다. 요청은 SMTP 서버를 기다리지 않는다.
     try:
-        with smtplib.SMTP(app.config["SMTP_HOST"], app.config["SMTP_PORT"]) as smtp:
-            smtp.starttls()
-            smtp.login(app.config["SMTP_USER"], app.config["SMTP_PASSWORD"])
-            smtp.send_message(message)
+        mail_outbox.enqueue(to_email, subject, body)
     except Exception as exc:
-        app.logger.exception("비밀번호 재설정 메일 전송 실패: %s", exc)
+        app.logger.exception("비밀번호 재설정 메일 저장 실패: %s", exc)
+        return
+    mail_worker.notify()
 
 
 from auth import *  # auth.py에서 /signup, /login, /logout 등을 정의한다고 가정함이다.
@@ -317,6 +1055,37 @@ from auth import *  # auth.py에서 /signup, /login, /logout 등을 정의한다
 # ---------------------------
 # 작업 기록 조회 라우트
 # ---------------------------
+def _encode_history_cursor(created_at, job_id) -> str:
+    """다음 페이지 커서: 마지막 행의 (created_at, id) 를 URL 에 넣기 좋게 인코딩한다."""
+    raw = f"{created_at.isoformat()}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_history_cursor(value):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode("utf-8")
+        created_at, job_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except (ValueError, UnicodeDecodeError):
+        # 잘못된 커서는 첫 페이지로 본다.
+        return None
+
+
+def _load_user_info(user_id) -> dict:
+    """화면 상단/마이페이지에 쓰는 사용자 정보이다. 조회에 실패하면 기본값을 돌려준다."""
+    return user_profiles.load(lambda: mysql.connection, user_id, app.logger)
+
+
+# 작업 기록 날짜 필터 → 기간이다.
+HISTORY_DATE_RANGES = {
+    "24h": timedelta(hours=24),
+    "week": timedelta(days=7),
+    "month": timedelta(days=30),
+}
+
+
 @app.route("/history")
 def history():
     # 로그인 여부 확인
@@ -327,71 +1096,51 @@ def history():
     if not user_id:
         return redirect(url_for("login"))
     
-    # 사용자 정보 조회
-    user_info = {
-        "id": user_id,
-        "email": "",
-        "name": "사용자",
-        "plan": "Free",
-        "credits": 0,
-    }
-    try:
-        cur = mysql.connection.cursor()
-        cur.execute(
-            "SELECT id, email, created_at FROM users WHERE id = %s",
-            (user_id,),
-        )
-        user_data = cur.fetchone()
-        if user_data:
-            # 이메일에서 이름 추출 (이메일 앞부분 사용)
-            email = user_data[1] if user_data[1] else ""
-            user_name = email.split("@")[0] if email else "사용자"
-            user_info = {
-                "id": user_data[0],
-                "email": email,
-                "name": user_name,
-                "plan": "Free",  # 기본값
-                "credits": 0,  # 기본값
-            }
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"사용자 정보 조회 실패: {e}")
-        # 기본값 유지
+    # 사용자 정보 조회 (요청/TTL 캐시)
+    user_info = _load_user_info(user_id)
     
     # 필터 파라미터
     filter_type = request.args.get("filter", "all")  # all, editing, completed
     date_filter = request.args.get("date", "all")  # all, 24h, week, month
     tab_type = request.args.get("tab", "all")  # all, video, image
+    cursor = _decode_history_cursor(request.args.get("cursor"))
+    page_size = app.config["HISTORY_PAGE_SIZE"]
+    next_cursor = None
     
     # 사용자의 작업 기록 조회
     try:
         cur = mysql.connection.cursor()
         
-        # 기본 쿼리
-        query = "SELECT id, original_filename, output_filename, blur_strength, status, created_at FROM job_history WHERE user_id = %s"
+        # 기본 쿼리 (인덱스 (user_id, media_type, created_at, id) / (user_id, created_at, id) 를 탄다)
+        query = "SELECT id, original_filename, output_filename, blur_strength, status, created_at, media_type FROM job_history WHERE user_id = %s"
         params = [user_id]
         
+        # 파일 타입 필터 (INSERT 때 저장한 media_type 컬럼)
+        if tab_type in ("video", "image"):
+            query += " AND media_type = %s"
+            params.append(tab_type)
+        
         # 상태 필터
         if filter_type == "editing":
             query += " AND status = 'processing'"
         elif filter_type == "completed":
             query += " AND status = 'success'"
         
-        # 날짜 필터
-        if date_filter == "24h":
-            query += " AND created_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)"
-        elif date_filter == "week":
-            query += " AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)"
-        elif date_filter == "month":
-            query += " AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)"
+        # 날짜 필터: 기준 시각은 예전 DATE_SUB(NOW(), ...) 처럼 DB 의 NOW() 에서 뺀다 (created_at 과 같은 시계/시간대).
+        # 뺀 값을 파라미터로 넘기므로 INTERVAL 문법이 없는 SQLite 대용품에서도 같은 SQL 을 쓴다.
+        if date_filter in HISTORY_DATE_RANGES:
+            query += " AND created_at >= %s"
+            params.append(db_now(cur) - HISTORY_DATE_RANGES[date_filter])
         
-        # 파일 타입 필터 (파일 확장자로 판단)
-        if tab_type == "video":
-            query += " AND (original_filename LIKE '%.mp4' OR original_filename LIKE '%.avi' OR original_filename LIKE '%.mov' OR original_filename LIKE '%.mkv' OR original_filename LIKE '%.MP4' OR original_filename LIKE '%.AVI' OR original_filename LIKE '%.MOV' OR original_filename LIKE '%.MKV')"
-        elif tab_type == "image":
-            query += " AND (original_filename LIKE '%.jpg' OR original_filename LIKE '%.jpeg' OR original_filename LIKE '%.png' OR original_filename LIKE '%.gif' OR original_filename LIKE '%.JPG' OR original_filename LIKE '%.JPEG' OR original_filename LIKE '%.PNG' OR original_filename LIKE '%.GIF')"
+        # 키셋 페이지네이션: 이전 페이지 마지막 행 (created_at, id) 보다 앞선 행만 읽는다.
+        # OFFSET 과 달리 몇 번째 페이지든 인덱스에서 바로 찾아 들어가므로 조회 시간이 일정하다.
+        if cursor:
+            query += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+            params.extend([cursor[0], cursor[0], cursor[1]])
         
-        query += " ORDER BY created_at DESC"
+        # 다음 페이지가 있는지 알려고 한 행 더 읽는다.
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        params.append(page_size + 1)
         
         try:
             cur.execute(query, tuple(params))
@@ -404,14 +1153,14 @@ def history():
         finally:
             cur.close()
         
+        if len(jobs) > page_size:
+            jobs = jobs[:page_size]
+            next_cursor = _encode_history_cursor(jobs[-1][5], jobs[-1][0])
+        
         # 튜플을 딕셔너리 형태로 변환
         job_list = []
         for job in jobs:
             try:
-                # 파일 타입 판단
-                filename = job[1] if job[1] else ""
-                file_type = "image" if any(filename.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif']) else "video"
-                
                 job_list.append({
                     "id": job[0],
                     "original_filename": job[1] if job[1] else "알 수 없음",
@@ -419,7 +1168,7 @@ def history():
                     "blur_strength": job[3] if job[3] is not None else "0",
                     "status": job[4] if job[4] else "unknown",
                     "created_at": job[5],  # datetime 객체 또는 None
-                    "file_type": file_type,
+                    "file_type": job[6] or media_type_for_filename(job[1]),
                 })
             except Exception as job_error:
                 app.logger.error(f"작업 데이터 변환 실패: {job_error}")
@@ -443,6 +1192,7 @@ def history():
             filter_type=filter_type,
             date_filter=date_filter,
             tab_type=tab_type,
+            next_cursor=next_cursor,
         )
     except Exception as template_error:
         import traceback
@@ -464,48 +1214,8 @@ def mypage():
     
     user_id = session.get("user_id")
     
-    # 사용자 정보 조회
-    user_info = {
-        "id": user_id,
-        "email": "",
-        "name": "사용자",
-        "plan": "Free",
-        "credits": 0,
-        "face_image": None,
-    }
-    try:
-        cur = mysql.connection.cursor()
-        # face_image 컬럼이 있는지 확인하고 조회
-        cur.execute("SHOW COLUMNS FROM users LIKE 'face_image'")
-        has_face_image = cur.fetchone()
-        
-        if has_face_image:
-            cur.execute(
-                "SELECT id, email, face_image FROM users WHERE id = %s",
-                (user_id,),
-            )
-        else:
-            cur.execute(
-                "SELECT id, email FROM users WHERE id = %s",
-                (user_id,),
-            )
-        
-        user_data = cur.fetchone()
-        if user_data:
-            email = user_data[1] if user_data[1] else ""
-            user_name = email.split("@")[0] if email else "사용자"
-            face_image = user_data[2] if has_face_image and len(user_data) > 2 else None
-            user_info = {
-                "id": user_data[0],
-                "email": email,
-                "name": user_name,
-                "plan": "Free",
-                "credits": 0,
-                "face_image": face_image,
-            }
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"사용자 정보 조회 실패: {e}")
+    # 사용자 정보 조회 (요청/TTL 캐시)
+    user_info = _load_user_info(user_id)
     
     return render_template("mypage.html", user_info=user_info, messages=[])
 
@@ -523,7 +1233,7 @@ def change_email():
     
     if not new_email or not password:
         messages.append({"type": "error", "text": "이메일과 비밀번호를 모두 입력해주세요."})
-        return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+        return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
     
     try:
         cur = mysql.connection.cursor()
@@ -531,21 +1241,22 @@ def change_email():
         # 현재 비밀번호 확인
         cur.execute("SELECT password FROM users WHERE id = %s", (user_id,))
         user = cur.fetchone()
-        if not user or not bcrypt.check_password_hash(user[0], password):
+        if not user or not bcrypt.check(user[0], password):
             messages.append({"type": "error", "text": "비밀번호가 올바르지 않습니다."})
             cur.close()
-            return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+            return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
         
         # 이메일 중복 확인
         cur.execute("SELECT id FROM users WHERE email = %s AND id != %s", (new_email, user_id))
         if cur.fetchone():
             messages.append({"type": "error", "text": "이미 사용 중인 이메일입니다."})
             cur.close()
-            return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+            return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
         
         # 이메일 변경
         cur.execute("UPDATE users SET email = %s WHERE id = %s", (new_email, user_id))
         mysql.connection.commit()
+        user_profiles.invalidate(user_id)
         messages.append({"type": "success", "text": "이메일이 성공적으로 변경되었습니다."})
         cur.close()
     except Exception as e:
@@ -554,28 +1265,7 @@ def change_email():
         messages.append({"type": "error", "text": f"이메일 변경 중 오류가 발생했습니다: {e}"})
     
     # 사용자 정보 다시 조회
-    try:
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT id, email, COALESCE(face_image, '') as face_image FROM users WHERE id = %s", (user_id,))
-        user_data = cur.fetchone()
-        if user_data:
-            email = user_data[1] if user_data[1] else ""
-            user_name = email.split("@")[0] if email else "사용자"
-            face_image = user_data[2] if len(user_data) > 2 and user_data[2] else None
-            user_info = {
-                "id": user_data[0],
-                "email": email,
-                "name": user_name,
-                "plan": "Free",
-                "credits": 0,
-                "face_image": face_image,
-            }
-        else:
-            user_info = {"id": user_id, "email": new_email, "name": new_email.split("@")[0] if new_email else "사용자", "face_image": None}
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"사용자 정보 조회 실패: {e}")
-        user_info = {"id": user_id, "email": new_email, "name": new_email.split("@")[0] if new_email else "사용자", "face_image": None}
+    user_info = _load_user_info(user_id)
     
     return render_template("mypage.html", user_info=user_info, messages=messages)
 
@@ -594,11 +1284,11 @@ def change_password():
     
     if not current_password or not new_password or not confirm_password:
         messages.append({"type": "error", "text": "모든 필드를 입력해주세요."})
-        return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+        return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
     
     if new_password != confirm_password:
         messages.append({"type": "error", "text": "새 비밀번호가 일치하지 않습니다."})
-        return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+        return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
     
     try:
         cur = mysql.connection.cursor()
@@ -606,15 +1296,16 @@ def change_password():
         # 현재 비밀번호 확인
         cur.execute("SELECT password FROM users WHERE id = %s", (user_id,))
         user = cur.fetchone()
-        if not user or not bcrypt.check_password_hash(user[0], current_password):
+        if not user or not bcrypt.check(user[0], current_password):
             messages.append({"type": "error", "text": "현재 비밀번호가 올바르지 않습니다."})
             cur.close()
-            return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+            return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
         
         # 비밀번호 변경
-        hashed_pw = bcrypt.generate_password_hash(new_password).decode("utf-8")
+        hashed_pw = bcrypt.hash(new_password)
         cur.execute("UPDATE users SET password = %s WHERE id = %s", (hashed_pw, user_id))
         mysql.connection.commit()
+        user_profiles.invalidate(user_id)
         messages.append({"type": "success", "text": "비밀번호가 성공적으로 변경되었습니다."})
         cur.close()
     except Exception as e:
@@ -623,28 +1314,7 @@ def change_password():
         messages.append({"type": "error", "text": f"비밀번호 변경 중 오류가 발생했습니다: {e}"})
     
     # 사용자 정보 다시 조회
-    try:
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT id, email, COALESCE(face_image, '') as face_image FROM users WHERE id = %s", (user_id,))
-        user_data = cur.fetchone()
-        if user_data:
-            email = user_data[1] if user_data[1] else ""
-            user_name = email.split("@")[0] if email else "사용자"
-            face_image = user_data[2] if len(user_data) > 2 and user_data[2] else None
-            user_info = {
-                "id": user_data[0],
-                "email": email,
-                "name": user_name,
-                "plan": "Free",
-                "credits": 0,
-                "face_image": face_image,
-            }
-        else:
-            user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"사용자 정보 조회 실패: {e}")
-        user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
+    user_info = _load_user_info(user_id)
     
     return render_template("mypage.html", user_info=user_info, messages=messages)
 
@@ -656,33 +1326,13 @@ def register_face():
     
     user_id = session.get("user_id")
     messages = []
+    request.max_content_length = app.config["MAX_IMAGE_UPLOAD_BYTES"]
     
     # 얼굴 등록은 선택사항이므로 파일이 없어도 에러를 발생시키지 않음
     if "face_image" not in request.files:
         messages.append({"type": "error", "text": "파일이 선택되지 않았습니다."})
         # 사용자 정보 다시 조회
-        try:
-            cur = mysql.connection.cursor()
-            cur.execute("SELECT id, email, COALESCE(face_image, '') as face_image FROM users WHERE id = %s", (user_id,))
-            user_data = cur.fetchone()
-            if user_data:
-                email = user_data[1] if user_data[1] else ""
-                user_name = email.split("@")[0] if email else "사용자"
-                face_image = user_data[2] if len(user_data) > 2 and user_data[2] else None
-                user_info = {
-                    "id": user_data[0],
-                    "email": email,
-                    "name": user_name,
-                    "plan": "Free",
-                    "credits": 0,
-                    "face_image": face_image,
-                }
-            else:
-                user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
-            cur.close()
-        except Exception as e:
-            app.logger.error(f"사용자 정보 조회 실패: {e}")
-            user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
+        user_info = _load_user_info(user_id)
         return render_template("mypage.html", user_info=user_info, messages=messages)
     
     file = request.files["face_image"]
@@ -690,74 +1340,41 @@ def register_face():
         # 파일이 선택되지 않았지만 선택사항이므로 성공 메시지와 함께 반환
         messages.append({"type": "success", "text": "변경사항이 없습니다."})
         # 사용자 정보 다시 조회
-        try:
-            cur = mysql.connection.cursor()
-            cur.execute("SELECT id, email, COALESCE(face_image, '') as face_image FROM users WHERE id = %s", (user_id,))
-            user_data = cur.fetchone()
-            if user_data:
-                email = user_data[1] if user_data[1] else ""
-                user_name = email.split("@")[0] if email else "사용자"
-                face_image = user_data[2] if len(user_data) > 2 and user_data[2] else None
-                user_info = {
-                    "id": user_data[0],
-                    "email": email,
-                    "name": user_name,
-                    "plan": "Free",
-                    "credits": 0,
-                    "face_image": face_image,
-                }
-            else:
-                user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
-            cur.close()
-        except Exception as e:
-            app.logger.error(f"사용자 정보 조회 실패: {e}")
-            user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": None}
+        user_info = _load_user_info(user_id)
         return render_template("mypage.html", user_info=user_info, messages=messages)
     
     try:
-        # 파일 저장
-        filename = secure_filename(file.filename)
-        timestamp = str(int(time.time()))
-        filename = f"face_{user_id}_{timestamp}_{filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # DB에 파일명 저장 (users 테이블에 face_image 컬럼이 있다고 가정)
-        cur = mysql.connection.cursor()
-        # 만약 컬럼이 없다면 ALTER TABLE users ADD COLUMN face_image VARCHAR(255) NULL; 실행 필요
-        cur.execute("UPDATE users SET face_image = %s WHERE id = %s", (filename, user_id))
-        mysql.connection.commit()
-        cur.close()
-        
-        messages.append({"type": "success", "text": "얼굴 사진이 성공적으로 등록되었습니다."})
+        # 파일 저장 (업로드를 받으면서 이미 디스크에 있으므로 고유한 이름으로 옮기기만 한다)
+        upload = commit_upload(file, storage, "image", prefix=f"face_{user_id}_")
+        filename = upload["stored_name"]
+        filepath = upload["path"]
+
+        # 얼굴 임베딩은 등록할 때 한 번만 계산해서 인덱스에 저장한다 (작업마다 다시 계산하지 않음).
+        embedding = embed_face_image(filepath)
+        if embedding is None:
+            os.remove(filepath)
+            messages.append({"type": "error", "text": "사진에서 얼굴을 찾지 못했습니다. 정면 사진으로 다시 등록해주세요."})
+        else:
+            # DB에 파일명 저장 (users 테이블에 face_image 컬럼이 있다고 가정)
+            cur = mysql.connection.cursor()
+            # 만약 컬럼이 없다면 ALTER TABLE users ADD COLUMN face_image VARCHAR(255) NULL; 실행 필요
+            cur.execute("UPDATE users SET face_image = %s WHERE id = %s", (filename, user_id))
+            mysql.connection.commit()
+            cur.close()
+            user_profiles.invalidate(user_id)
+            get_index().set(user_id, embedding)
+            _publish(filename)
+
+            messages.append({"type": "success", "text": "얼굴 사진이 성공적으로 등록되었습니다."})
+            if not owner_exclusion_enabled():
+                messages.append({"type": "error", "text": "지금은 얼굴 인식 모델이 설정되지 않아 본인 얼굴도 모자이크됩니다."})
     except Exception as e:
         mysql.connection.rollback()
         app.logger.error(f"얼굴 등록 실패: {e}")
         messages.append({"type": "error", "text": f"얼굴 등록 중 오류가 발생했습니다: {e}"})
     
     # 사용자 정보 다시 조회
-    try:
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT id, email, face_image FROM users WHERE id = %s", (user_id,))
-        user_data = cur.fetchone()
-        if user_data:
-            email = user_data[1] if user_data[1] else ""
-            user_name = email.split("@")[0] if email else "사용자"
-            face_image = user_data[2] if len(user_data) > 2 else None
-            user_info = {
-                "id": user_data[0],
-                "email": email,
-                "name": user_name,
-                "plan": "Free",
-                "credits": 0,
-                "face_image": face_image,
-            }
-        else:
-            user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": filename if 'filename' in locals() else None}
-        cur.close()
-    except Exception as e:
-        app.logger.error(f"사용자 정보 조회 실패: {e}")
-        user_info = {"id": user_id, "email": "", "name": "사용자", "face_image": filename if 'filename' in locals() else None}
+    user_info = _load_user_info(user_id)
     
     return render_template("mypage.html", user_info=user_info, messages=messages)
 
@@ -774,7 +1391,7 @@ def delete_account():
     
     if not password:
         messages.append({"type": "error", "text": "비밀번호를 입력해주세요."})
-        return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+        return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
     
     try:
         cur = mysql.connection.cursor()
@@ -782,15 +1399,17 @@ def delete_account():
         # 비밀번호 확인
         cur.execute("SELECT password FROM users WHERE id = %s", (user_id,))
         user = cur.fetchone()
-        if not user or not bcrypt.check_password_hash(user[0], password):
+        if not user or not bcrypt.check(user[0], password):
             messages.append({"type": "error", "text": "비밀번호가 올바르지 않습니다."})
             cur.close()
-            return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+            return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
         
         # 계정 삭제 (CASCADE로 관련 데이터도 삭제됨)
         cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
         mysql.connection.commit()
         cur.close()
+        user_profiles.invalidate(user_id)
+        get_index().remove(user_id)
         
         # 세션 삭제
         session.clear()
@@ -799,7 +1418,7 @@ def delete_account():
         mysql.connection.rollback()
         app.logger.error(f"계정 삭제 실패: {e}")
         messages.append({"type": "error", "text": f"계정 삭제 중 오류가 발생했습니다: {e}"})
-        return render_template("mypage.html", user_info={"id": user_id, "email": "", "name": "사용자"}, messages=messages)
+        return render_template("mypage.html", user_info=_load_user_info(user_id), messages=messages)
 
 
 # ---------------------------
@@ -815,13 +1434,16 @@ def internal_error(error):
 
 @app.errorhandler(Exception)
 def handle_exception(e):
+    # 413 같은 HTTP 오류는 500 으로 바꾸지 않고 그대로 돌려준다.
+    if isinstance(e, HTTPException):
+        return e
     import traceback
     error_msg = traceback.format_exc()
     app.logger.error(f"Unhandled Exception: {error_msg}")
     return f"<h1>Error</h1><pre>{error_msg}</pre>", 500
 
 if __name__ == "__main__":
-    # ⚠ 여기서 app.run 과 MOSAIC_API_URL(127.0.0.1:5000/api/mosaic)을 같이 쓰면
+    # ⚠ MOSAIC_BACKEND=http 로 MOSAIC_API_URL 을 자기 자신(127.0.0.1:5000)으로 두면
     # 단일 프로세스/단일 스레드일 때 자기 자신을 다시 호출해서 막힐 수 있음이다.
-    # 개발할 때는 api_mosaic 를 직접 호출하거나, 포트를 다르게 써도 됨이다.
+    # 기본값(process)이나 inprocess 는 HTTP 를 거치지 않으므로 이 문제가 없다.
     app.run(host="0.0.0.0", port=5000, debug=True)
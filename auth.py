@@ -1,5 +1,6 @@
 from flask import render_template, request, redirect, session, url_for
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import hashlib
 import secrets
 
 # 순환 import 방지를 위해 함수 내부에서 import
@@ -15,6 +16,10 @@ def get_send_reset_email():
     from app import send_reset_email
     return send_reset_email
 
+def hash_reset_token(token: str) -> str:
+    # DB 에는 재설정 토큰의 SHA-256 만 저장한다 (MariaDB SHA2(token, 256) 과 같은 값).
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
 # app은 데코레이터에서 사용하므로 직접 import 필요
 # 순환 import는 Python에서 일반적으로 작동하므로 직접 import
 from app import app
@@ -57,7 +62,7 @@ def signup():
 
     # 2) 비밀번호 해시 생성
     bcrypt = get_bcrypt()
-    hashed_pw = bcrypt.generate_password_hash(raw_password).decode("utf-8")
+    hashed_pw = bcrypt.hash(raw_password)
 
     # 3) DB 저장
     try:
@@ -121,12 +126,28 @@ def login():
 
     # 비밀번호 검증
     bcrypt = get_bcrypt()
-    if not bcrypt.check_password_hash(hashed_pw, raw_password):
+    if not bcrypt.check(hashed_pw, raw_password):
         return render_template(
             "login.html",
             error="이메일 또는 비밀번호가 올바르지 않습니다.",
         ), 401
 
+    # 저장된 해시의 cost 가 현재 설정(BCRYPT_LOG_ROUNDS)과 다르면 새 cost 로 다시 저장한다.
+    # 평문 비밀번호를 알 수 있는 건 로그인 순간뿐이라 여기서 한다. 실패해도 로그인은 계속한다.
+    if bcrypt.needs_rehash(hashed_pw):
+        try:
+            new_hash = bcrypt.hash(raw_password)
+            cur = mysql.connection.cursor()
+            cur.execute(
+                "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                (new_hash, user_id, hashed_pw),
+            )
+            mysql.connection.commit()
+            cur.close()
+        except Exception as exc:
+            mysql.connection.rollback()
+            app.logger.warning("비밀번호 해시 cost 갱신 실패: %s", exc)
+
     # 로그인 성공 → 세션에 사용자 ID 저장
     # 브라우저를 닫으면 세션이 사라지도록 설정 (영구 세션 비활성화)
     session.permanent = False
@@ -174,15 +195,17 @@ def forgot_password():
 
     user_id = user[0]
     token = secrets.token_urlsafe(32)
-    expires_at = datetime.utcnow() + timedelta(hours=1)
+    token_hash = hash_reset_token(token)
+    expires_at = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
 
     try:
+        # 평문 토큰은 메일로만 보내고 DB 에는 해시만 남긴다 (token 컬럼은 NOT NULL 이라 해시를 같이 넣음).
         cur.execute(
             """
-            INSERT INTO password_resets (user_id, token, expires_at, used)
-            VALUES (%s, %s, %s, 0)
+            INSERT INTO password_resets (user_id, token, token_hash, expires_at, used)
+            VALUES (%s, %s, %s, %s, 0)
             """,
-            (user_id, token, expires_at),
+            (user_id, token_hash, token_hash, expires_at),
         )
         mysql.connection.commit()
     except Exception as exc:
@@ -210,11 +233,11 @@ def reset_password(token):
         SELECT pr.id, pr.expires_at, pr.used, u.id, u.email
         FROM password_resets pr
         JOIN users u ON pr.user_id = u.id
-        WHERE pr.token = %s
+        WHERE pr.token_hash = %s
         ORDER BY pr.id DESC
         LIMIT 1
         """,
-        (token,),
+        (hash_reset_token(token),),
     )
     token_row = cur.fetchone()
 
@@ -227,7 +250,7 @@ def reset_password(token):
 
     reset_id, expires_at, used_flag, user_id, email = token_row
 
-    if used_flag or expires_at < datetime.utcnow():
+    if used_flag or expires_at < datetime.now(timezone.utc).replace(tzinfo=None):
         cur.close()
         return render_template(
             "reset_password.html",
@@ -251,7 +274,7 @@ def reset_password(token):
         )
 
     bcrypt = get_bcrypt()
-    hashed_pw = bcrypt.generate_password_hash(new_password).decode("utf-8")
+    hashed_pw = bcrypt.hash(new_password)
 
     try:
         cur.execute(
@@ -0,0 +1,105 @@
+import os
+import time
+import zipfile
+
+from job_queue import STATUS_SUCCESS
+
+
+# ---------------------------
+# 여러 장 한 번에 처리 (/batch)
+# ---------------------------
+# 업로드된 사진들을 작업 큐에 한꺼번에 넣으면 JobRunner 스레드(및 다른 gunicorn 워커의 러너)가 나눠서 병렬로 처리한다.
+# 응답은 ZIP 이고, 작업이 끝나는 순서대로 결과를 ZIP 항목으로 바로 흘려 보낸다.
+#   - ZIP 을 메모리나 임시 파일에 다 만든 뒤 보내지 않는다. zipfile 은 seek 할 수 없는 출력에도
+#     쓸 수 있으므로(항목 뒤에 data descriptor 를 붙임) ZipSink 에 쓰인 바이트를 그때그때 내보낸다.
+#   - 사진은 이미 압축된 형식이라 다시 압축하지 않고 저장(ZIP_STORED)만 한다.
+#   - 실패했거나 제한 시간 안에 끝나지 않은 항목은 마지막에 errors.txt 로 알려 준다.
+#     작업 자체는 계속 진행되므로 나중에 작업 기록에서 받을 수 있다.
+
+# 결과 파일을 ZIP 으로 복사할 때 한 번에 읽는 크기이다.
+COPY_CHUNK = 1024 * 1024
+
+# 끝난 작업이 없을 때 큐를 다시 확인하는 간격(초)이다.
+POLL_INTERVAL = 0.5
+
+
+class ZipSink:
+    """
+    zipfile 이 쓰는 바이트를 모아 두었다가 drain() 으로 꺼내 주는 쓰기 전용 출력이다.
+    tell/seek 이 없으므로 zipfile 은 스트리밍 모드로 쓴다.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def result_arcname(original_filename: str, out_name: str, used: set) -> str:
+    """
+    ZIP 안에서 쓸 결과 이름이다. 원래 이름에 mosaic_ 을 붙이고 확장자는 결과 형식을 따른다.
+    같은 이름이 이미 있으면 ' (2)' 처럼 번호를 붙인다.
+    """
+    stem = os.path.splitext(original_filename)[0] or "upload"
+    ext = os.path.splitext(out_name)[1]
+    name = f"mosaic_{stem}{ext}"
+    n = 2
+    while name in used:
+        name = f"mosaic_{stem} ({n}){ext}"
+        n += 1
+    used.add(name)
+    return name
+
+
+def stream_results_zip(queue, storage, entries: dict, wait, timeout: float, skipped=()):
+    """
+    entries({작업 id: ZIP 안 이름}) 의 작업이 끝나는 순서대로 결과를 ZIP 바이트로 내보내는 제너레이터이다.
+    wait(timeout) 은 작업이 끝났다는 신호를 기다리는 함수(JobRunner.wait_finished)이다.
+    skipped 는 업로드 단계에서 건너뛴 파일 이름으로 errors.txt 에 함께 적는다.
+    """
+    # 빈 조각은 보내지 않는다 (청크 전송에서 빈 조각은 본문 끝으로 읽힐 수 있다).
+    return (chunk for chunk in _zip_chunks(queue, storage, entries, wait, timeout, skipped) if chunk)
+
+
+def _zip_chunks(queue, storage, entries: dict, wait, timeout: float, skipped):
+    sink = ZipSink()
+    pending = dict(entries)
+    errors = [f"{name}: 사진이 아니거나 너무 커서 건너뜀" for name in skipped]
+    deadline = time.monotonic() + timeout
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        while pending:
+            for job in queue.finished(list(pending)):
+                arcname = pending.pop(job["id"])
+                path = None
+                if job["status"] == STATUS_SUCCESS:
+                    path = storage.local_path(os.path.basename(job["output_path"]))
+                if path is None:
+                    errors.append(f"{arcname}: {job.get('error') or '결과 파일을 찾을 수 없음'}")
+                    continue
+                with open(path, "rb") as src, archive.open(arcname, "w") as dst:
+                    while True:
+                        chunk = src.read(COPY_CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        yield sink.drain()
+                yield sink.drain()
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                errors.extend(f"{name}: 제한 시간 안에 끝나지 않음 (작업 기록에서 확인)" for name in pending.values())
+                break
+            wait(POLL_INTERVAL)
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+    yield sink.drain()
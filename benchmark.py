@@ -0,0 +1,377 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+import warnings
+
+import numpy as np
+from PIL import Image
+
+import mosaic_api
+from image_encoder import encode_image
+
+
+# ---------------------------
+# 모자이크 커널/코덱 마이크로 벤치마크
+# ---------------------------
+# 네트워크, DB, 얼굴 탐지 모델 없이 합성 이미지만으로 돈다 (리눅스 CPU 한 대면 충분).
+#   python benchmark.py                      전체 실행 후 기준값(BASELINE_PATH)과 비교
+#   python benchmark.py --save               이번 결과를 기준값으로 저장
+#   python benchmark.py --sizes vga,24mp --cases pixelate,encode
+# 측정 항목
+#   pixelate  mosaic_api.pixelate_array (전체 배열을 한 번에 처리하는 커널)
+#   tiled     mosaic_api.pixelate_image_tiled (큰 이미지용 띠 단위 처리)
+#   encode    image_encoder.encode_image (JPEG/PNG/WebP)
+#   decode    Image.open + load()
+#   process   mosaic_api.process_image_file (디스크 → 디코드 → 모자이크 → 인코드 → 디스크)
+# 케이스마다 fork 한 자식 프로세스에서 돌리고, 입력을 준비한 뒤 최대 RSS 기록을 지워서
+# 측정 구간의 최대 RSS(peak)와 그중 준비된 입력을 뺀 작업 메모리(work)를 케이스별로 잡는다.
+# 시간은 반복 실행의 중앙값이고 메가픽셀당 ms 로 비교한다.
+# 기준값보다 threshold 이상 느려지거나 메모리를 더 쓰면 종료 코드 1 로 끝난다.
+# 기준값은 측정한 기계에 묶인 숫자이므로 같은 기계에서 만든 것과 비교해야 의미가 있다.
+
+# 이름 → (가로, 세로)
+SIZES = {
+    "vga": (640, 480),
+    "hd": (1280, 720),
+    "fhd": (1920, 1080),
+    "12mp": (4000, 3000),
+    "24mp": (6000, 4000),
+    "50mp": (8192, 6144),
+    "100mp": (11547, 8660),
+}
+
+# pixelate/tiled 에서 재는 블록 크기(px)이다. 작은 블록일수록 블록당 오버헤드 비중이 크다.
+BLOCKS = (4, 16, 64)
+
+FORMATS = ("JPEG", "PNG", "WEBP")
+
+CASES = ("pixelate", "tiled", "encode", "decode", "process")
+
+# process 케이스의 blur_strength 이다.
+PROCESS_STRENGTH = 50
+
+# 한 케이스를 최소 이 시간(초) 동안, MIN_RUNS~MAX_RUNS 번 반복한다.
+MIN_TIME = 1.0
+MIN_RUNS = 3
+MAX_RUNS = 50
+
+# 기준값보다 이 비율 이상 나빠지면 회귀로 본다.
+DEFAULT_THRESHOLD = 0.25
+
+# 메모리 비교의 절대 여유(MB)이다. 거의 0 인 값끼리 비율로 비교하면 잡음에 걸리기 때문이다.
+RSS_SLACK_MB = 16.0
+
+# 시간 비교의 절대 여유(ms)이다. 아주 짧은 케이스는 타이머/스케줄러 잡음이 비율로 크게 보인다.
+TIME_SLACK_MS = 0.5
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    가로/세로 그라디언트에 약한 잡음을 섞은 (H, W, 3) uint8 배열이다.
+    완전한 잡음이나 단색은 코덱에 비현실적으로 불리/유리하므로 사진 비슷한 중간 난이도로 만든다.
+    큰 이미지에서 임시 배열이 커지지 않도록 띠 단위로 채운다.
+    """
+    rng = np.random.default_rng(seed)
+    arr = np.empty((height, width, 3), np.uint8)
+    gx = (np.arange(width, dtype=np.uint32) * 200 // max(1, width - 1)).astype(np.uint8)
+    gy = (np.arange(height, dtype=np.uint32) * 200 // max(1, height - 1)).astype(np.uint8)
+    for y0 in range(0, height, 512):
+        y1 = min(height, y0 + 512)
+        strip = arr[y0:y1]
+        strip[..., 0] = gx[None, :]
+        strip[..., 1] = gy[y0:y1, None]
+        strip[..., 2] = gx[None, :] // 2 + gy[y0:y1, None] // 2
+        strip += rng.integers(0, 48, size=strip.shape, dtype=np.uint8)
+    return arr
+
+
+def case_list(sizes, blocks, formats, cases) -> list:
+    """실행할 케이스 목록이다. 케이스 id 는 기준값 파일의 키로 쓴다."""
+    out = []
+    for size in sizes:
+        for case in cases:
+            if case in ("pixelate", "tiled"):
+                out.extend({"id": f"{case}/{size}/b{b}", "case": case, "size": size, "block": b} for b in blocks)
+            else:
+                out.extend({"id": f"{case}/{size}/{f.lower()}", "case": case, "size": size, "format": f} for f in formats)
+    return out
+
+
+def _max_rss_mb() -> float:
+    """지금까지(또는 _reset_peak_rss 이후)의 최대 RSS(MB)이다."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # 리눅스의 ru_maxrss 단위는 KB 이다.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+
+
+def _reset_peak_rss() -> bool:
+    """
+    최대 RSS 기록(VmHWM)을 지금 RSS 로 되돌린다 (리눅스 4.0+).
+    입력 준비에서 잠깐 쓴 메모리가 측정 구간의 최대값을 가리지 않게 한다.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _encoded(arr: np.ndarray, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    encode_image(Image.fromarray(arr, "RGB"), buf, fmt)
+    return buf.getvalue()
+
+
+def _prepare(spec: dict, workdir: str):
+    """
+    케이스 하나의 입력을 만들고 시간을 잴 함수(인자 없음)를 돌려준다. 여기서 쓴 시간과 메모리는 측정에서 뺀다.
+    """
+    width, height = SIZES[spec["size"]]
+    arr = synthetic_image(width, height)
+    case = spec["case"]
+
+    if case == "pixelate":
+        # 제자리 처리라 두 번째부터는 이미 픽셀화된 배열을 다시 처리하지만 연산량은 같다.
+        return lambda: mosaic_api.pixelate_array(arr, spec["block"])
+
+    if case == "tiled":
+        img = Image.fromarray(arr, "RGB")
+        del arr
+        return lambda: mosaic_api.pixelate_image_tiled(img, spec["block"])
+
+    fmt = spec["format"]
+    if case == "encode":
+        img = Image.fromarray(arr, "RGB")
+        del arr
+        return lambda: encode_image(img, io.BytesIO(), fmt)
+
+    data = _encoded(arr, fmt)
+    del arr
+    if case == "decode":
+        def run():
+            with Image.open(io.BytesIO(data)) as img:
+                img.load()
+        return run
+
+    ext = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}[fmt]
+    src = os.path.join(workdir, "input" + ext)
+    dst = os.path.join(workdir, "output" + ext)
+    with open(src, "wb") as f:
+        f.write(data)
+    del data
+    return lambda: mosaic_api.process_image_file(src, dst, PROCESS_STRENGTH)
+
+
+def _measure(spec: dict, min_time: float) -> dict:
+    width, height = SIZES[spec["size"]]
+    # 100MP 합성 입력은 Pillow 의 기본 픽셀 수 경고 한도를 넘는다 (직접 만든 입력이라 무시함).
+    warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+    workdir = tempfile.mkdtemp(prefix="mozik_bench_")
+    try:
+        run = _prepare(spec, workdir)
+        gc.collect()
+        setup_rss = _current_rss_mb() if _reset_peak_rss() else _max_rss_mb()
+        times = []
+        started = time.perf_counter()
+        while len(times) < MAX_RUNS:
+            t0 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t0)
+            if len(times) >= MIN_RUNS and time.perf_counter() - started >= min_time:
+                break
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    peak_rss = _max_rss_mb()
+    mp = width * height / 1e6
+    median = statistics.median(times)
+    return {
+        "megapixels": round(mp, 3),
+        "runs": len(times),
+        "median_ms": round(median * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "ms_per_mp": round(median * 1000 / mp, 4),
+        "setup_rss_mb": round(setup_rss, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        # 입력 준비가 끝난 뒤 측정 구간에서 늘어난 최대 RSS 이다.
+        "work_rss_mb": round(max(0.0, peak_rss - setup_rss), 1),
+    }
+
+
+def run_case(spec: dict, min_time: float = MIN_TIME) -> dict:
+    """
+    케이스를 fork 한 자식에서 실행하고 결과를 돌려준다. 자식이 실패하면 {"error": ...} 이다.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        code = 0
+        try:
+            result = _measure(spec, min_time)
+        except BaseException:
+            result = {"error": traceback.format_exc(limit=3)}
+            code = 1
+        with os.fdopen(write_fd, "w") as out:
+            json.dump(result, out)
+        os._exit(code)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        payload = f.read()
+    _, status, _ = os.wait4(pid, 0)
+    if not payload:
+        # 메모리 부족으로 죽은 경우 등 결과를 못 쓰고 끝난 자식
+        return {"error": f"자식 프로세스가 결과 없이 끝남 (status={status})"}
+    return json.loads(payload)
+
+
+def environment() -> dict:
+    """기준값과 같은 조건에서 잰 것인지 확인할 때 쓰는 실행 환경 정보이다."""
+    import PIL
+
+    return {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "tiled_min_pixels": mosaic_api.TILED_MIN_PIXELS,
+        "strip_rows": mosaic_api.STRIP_ROWS,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    기준값보다 나빠진 케이스의 설명 목록이다. 기준값에 없는 케이스는 건너뛴다.
+    """
+    regressions = []
+    for case_id, cur in results.items():
+        base = baseline.get(case_id)
+        if not base or "error" in base:
+            continue
+        if "error" in cur:
+            regressions.append(f"{case_id}: 실패 ({cur['error'].strip().splitlines()[-1]})")
+            continue
+        slack = TIME_SLACK_MS / cur["megapixels"]
+        limit = base["ms_per_mp"] * (1 + threshold) + slack
+        if cur["ms_per_mp"] > limit:
+            regressions.append(
+                f"{case_id}: {cur['ms_per_mp']:.3f} ms/MP (기준 {base['ms_per_mp']:.3f}, "
+                f"+{(cur['ms_per_mp'] / base['ms_per_mp'] - 1) * 100:.0f}%)"
+            )
+        limit = base["work_rss_mb"] * (1 + threshold) + RSS_SLACK_MB
+        if cur["work_rss_mb"] > limit:
+            regressions.append(f"{case_id}: 작업 메모리 {cur['work_rss_mb']:.1f} MB (기준 {base['work_rss_mb']:.1f} MB)")
+    return regressions
+
+
+def _split(value: str, choices) -> list:
+    items = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [v for v in items if v not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"알 수 없는 값: {', '.join(unknown)} (가능: {', '.join(map(str, choices))})")
+    return items
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="모자이크 커널/코덱 마이크로 벤치마크")
+    parser.add_argument("--sizes", type=lambda v: _split(v, SIZES), default=list(SIZES))
+    parser.add_argument("--blocks", type=lambda v: [int(b) for b in _split(v, [str(b) for b in range(1, 4097)])],
+                        default=list(BLOCKS))
+    parser.add_argument("--formats", type=lambda v: _split(v.upper(), FORMATS), default=list(FORMATS))
+    parser.add_argument("--cases", type=lambda v: _split(v, CASES), default=list(CASES))
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="케이스당 최소 측정 시간(초)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="기준값 JSON 경로")
+    parser.add_argument("--save", action="store_true", help="결과를 기준값으로 저장 (같은 id 만 덮어씀)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="회귀로 볼 악화 비율 (0.25 = 25%%)")
+    parser.add_argument("--output", help="이번 결과를 따로 저장할 JSON 경로")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork") or not hasattr(os, "wait4"):
+        print("이 벤치마크는 fork/wait4 가 있는 리눅스에서만 돈다.", file=sys.stderr)
+        return 2
+
+    specs = case_list(args.sizes, args.blocks, args.formats, args.cases)
+    print(f"{'case':<28} {'runs':>4} {'median ms':>11} {'ms/MP':>9} {'peak MB':>9} {'work MB':>9}")
+    results = {}
+    for spec in specs:
+        result = run_case(spec, args.min_time)
+        results[spec["id"]] = result
+        if "error" in result:
+            print(f"{spec['id']:<28} 실패: {result['error'].strip().splitlines()[-1]}")
+            continue
+        print(
+            f"{spec['id']:<28} {result['runs']:>4} {result['median_ms']:>11.2f} {result['ms_per_mp']:>9.3f} "
+            f"{result['peak_rss_mb']:>9.1f} {result['work_rss_mb']:>9.1f}",
+            flush=True,
+        )
+
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    failed = any("error" in r for r in results.values())
+    if args.save:
+        merged = dict(baseline["results"]) if baseline else {}
+        merged.update({k: v for k, v in results.items() if "error" not in v})
+        report["results"] = merged
+        tmp_path = f"{args.baseline}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, args.baseline)
+        print(f"\n기준값 저장: {args.baseline} ({len(merged)} 케이스)")
+        return 1 if failed else 0
+
+    if baseline is None:
+        print(f"\n기준값이 없음 ({args.baseline}). --save 로 먼저 만든다.")
+        return 1 if failed else 0
+
+    if baseline.get("environment") != report["environment"]:
+        print("\n주의: 기준값을 잰 환경이 다르다. 비교 결과는 참고만 한다.")
+        for key, value in report["environment"].items():
+            if baseline.get("environment", {}).get(key) != value:
+                print(f"  {key}: {baseline.get('environment', {}).get(key)} → {value}")
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"\n회귀 {len(regressions)} 건 (허용 {args.threshold * 100:.0f}%):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\n회귀 없음 (허용 {args.threshold * 100:.0f}%, 기준값 {baseline.get('created_at')})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import g
+
+
+# ---------------------------
+# DB 연결 풀
+# ---------------------------
+# flask_mysqldb 는 앱 컨텍스트마다 원격 MariaDB 에 새로 접속해서(TCP + 인증) 짧은 쿼리보다 접속이 더 오래 걸렸다.
+# PooledMySQL 은 같은 mysql.connection 인터페이스를 유지하면서 프로세스마다 연결을 pool_size 개까지 재사용한다.
+#   - 체크아웃: 빈 연결이 없고 풀이 꽉 찼으면 pool_timeout 초 기다리고, 그래도 없으면 PoolTimeoutError 이다.
+#   - pre-ping: ping_idle 초 이상 놀던 연결은 넘겨주기 전에 살아 있는지 확인하고, 죽었으면 새로 접속한다.
+#   - recycle: 만든 지 recycle 초가 지난 연결은 닫고 새로 만든다 (서버 wait_timeout 보다 짧게 둔다).
+#   - 반납: 커밋하지 않은 트랜잭션은 rollback 해서 다음 요청에 잠금/스냅샷이 넘어가지 않게 한다.
+#   - 쿼리 시간/풀 대기 시간은 DBMetrics 에 모으고, slow_query 초를 넘는 쿼리는 로그로 남긴다.
+# DB_SQLITE_PATH 를 주면 MariaDB 대신 로컬 SQLite 파일을 쓴다 (테스트/부하 시험용 대용품).
+# 이때 %s 자리표시자는 ? 로 바꿔서 실행하므로 라우트의 SQL 은 그대로 둔다.
+
+# 쿼리/대기 시간 히스토그램 구간(초)이다.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 로컬 SQLite 대용품 스키마이다. 원격 MariaDB 의 테이블 중 앱이 쓰는 컬럼만 같은 이름으로 둔다.
+# created_at 은 MariaDB NOW() 와 같게 로컬 시각으로 채운다.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    face_image TEXT,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS password_resets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token TEXT NOT NULL,
+    token_hash TEXT,
+    expires_at DATETIME NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS job_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    original_filename TEXT,
+    output_filename TEXT,
+    blur_strength TEXT,
+    status TEXT,
+    media_type TEXT,
+    created_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+"""
+
+# SQLite 는 DATETIME 컬럼을 문자열로 저장하므로 MariaDB 처럼 datetime 으로 주고받게 한다.
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+class PoolTimeoutError(RuntimeError):
+    """pool_timeout 안에 DB 연결을 얻지 못했을 때 발생한다 (요청이 몰려 풀이 모두 사용 중)."""
+
+
+class DBMetrics:
+    """
+    쿼리 실행 시간과 풀 대기 시간을 모은다. 값은 프로세스 안에서만 누적된다.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {
+            "query": self._empty(),
+            "pool_wait": self._empty(),
+        }
+        self.timeouts = 0
+        self.connects = 0
+        self.reconnects = 0
+
+    def _empty(self) -> dict:
+        return {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(self.buckets)}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series[name]
+            series["count"] += 1
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "query": {**self._series["query"], "buckets": list(self._series["query"]["buckets"])},
+                "pool_wait": {**self._series["pool_wait"], "buckets": list(self._series["pool_wait"]["buckets"])},
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "reconnects": self.reconnects,
+            }
+
+
+class TimedCursor:
+    """
+    DB-API 커서를 감싸서 execute 시간을 재고, SQLite 면 %s 를 ? 로 바꿔 실행한다.
+    """
+
+    def __init__(self, cursor, dialect: str, metrics: DBMetrics, slow_query: float, logger):
+        self._cursor = cursor
+        self.dialect = dialect
+        self._metrics = metrics
+        self._slow_query = slow_query
+        self._logger = logger
+
+    def _sql(self, query: str) -> str:
+        return _PLACEHOLDER.sub("?", query) if self.dialect == "sqlite" else query
+
+    def _timed(self, method, query, args):
+        start = time.perf_counter()
+        try:
+            return method(self._sql(query), args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._metrics.observe("query", elapsed)
+            if self._slow_query and elapsed >= self._slow_query and self._logger is not None:
+                self._logger.warning("느린 쿼리 %.3fs: %s", elapsed, " ".join(query.split())[:200])
+
+    def execute(self, query, args=()):
+        return self._timed(self._cursor.execute, query, args or ())
+
+    def executemany(self, query, seq_of_args):
+        return self._timed(self._cursor.executemany, query, seq_of_args)
+
+    def __getattr__(self, name):
+        # fetchone / fetchall / rowcount / lastrowid / close 등은 원래 커서 것을 쓴다.
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """
+    풀이 빌려주는 연결이다. cursor() 는 TimedCursor 를 돌려준다.
+    """
+
+    def __init__(self, raw, dialect: str, pool):
+        self.raw = raw
+        self.dialect = dialect
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._pool = pool
+
+    def cursor(self):
+        pool = self._pool
+        return TimedCursor(self.raw.cursor(), self.dialect, pool.metrics, pool.slow_query, pool.logger)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self) -> None:
+        if self.dialect == "sqlite":
+            self.raw.execute("SELECT 1")
+        else:
+            self.raw.ping()
+
+    def close(self) -> None:
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    프로세스 안에서 공유하는 고정 크기 연결 풀이다. 스레드 안전하다.
+    """
+
+    def __init__(
+        self,
+        connect,
+        dialect: str = "mysql",
+        size: int = 10,
+        timeout: float = 5.0,
+        recycle: float = 1800.0,
+        ping_idle: float = 5.0,
+        slow_query: float = 0.0,
+        metrics: DBMetrics = None,
+        logger=None,
+    ):
+        self._connect = connect
+        self.dialect = dialect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_idle = ping_idle
+        self.slow_query = slow_query
+        self.metrics = metrics or DBMetrics()
+        self.logger = logger
+        # 최근에 쓴 연결부터 꺼내서(LIFO) 남는 연결은 오래 놀다가 recycle 되게 한다.
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _open(self) -> PooledConnection:
+        conn = PooledConnection(self._connect(), self.dialect, self)
+        self.metrics.incr("connects")
+        return conn
+
+    def _discard(self, conn: PooledConnection) -> None:
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return True
+        return False
+
+    def _open_reserved(self) -> PooledConnection:
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def checkout(self) -> PooledConnection:
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve():
+                conn = self._open_reserved()
+                self.metrics.observe("pool_wait", time.perf_counter() - start)
+                return conn
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                self.metrics.incr("timeouts")
+                raise PoolTimeoutError(
+                    f"DB 연결 풀({self.size}개)이 모두 사용 중이라 {self.timeout:g}초 안에 연결을 얻지 못했다."
+                ) from None
+        self.metrics.observe("pool_wait", time.perf_counter() - start)
+        return self._validate(conn)
+
+    def _validate(self, conn: PooledConnection) -> PooledConnection:
+        now = time.monotonic()
+        if self.recycle and now - conn.created_at > self.recycle:
+            conn.close()
+            return self._replace()
+        if self.ping_idle is not None and now - conn.last_used >= self.ping_idle:
+            try:
+                conn.ping()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.warning(f"끊어진 DB 연결을 다시 만든다: {e}")
+                conn.close()
+                self.metrics.incr("reconnects")
+                return self._replace()
+        return conn
+
+    def _replace(self) -> PooledConnection:
+        # 자리는 그대로 두고 연결만 새로 만든다. 실패하면 자리도 반납한다.
+        return self._open_reserved()
+
+    def checkin(self, conn: PooledConnection) -> None:
+        try:
+            # 커밋하지 않은 변경/잠금이 다음 사용자에게 넘어가지 않게 한다.
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        self._idle.put(conn)
+
+    def close_idle(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def status(self) -> dict:
+        with self._lock:
+            opened = self._opened
+        idle = self._idle.qsize()
+        return {"size": self.size, "opened": opened, "idle": idle, "in_use": opened - idle}
+
+
+def _mysql_connector(config: dict):
+    def connect():
+        import MySQLdb  # mysqlclient (flask_mysqldb 가 쓰던 드라이버)
+
+        kwargs = {
+            "host": config["MYSQL_HOST"],
+            "user": config["MYSQL_USER"],
+            "passwd": config["MYSQL_PASSWORD"],
+            "db": config["MYSQL_DB"],
+            "port": config.get("MYSQL_PORT", 3306),
+            "charset": config.get("MYSQL_CHARSET", "utf8mb4"),
+            "connect_timeout": config.get("MYSQL_CONNECT_TIMEOUT", 10),
+        }
+        if config.get("MYSQL_CURSORCLASS"):
+            kwargs["cursorclass"] = getattr(MySQLdb.cursors, config["MYSQL_CURSORCLASS"])
+        return MySQLdb.connect(**kwargs)
+
+    return connect
+
+
+def _sqlite_connector(path: str):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SQLITE_SCHEMA)
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(
+            path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # MariaDB 의 SHA2(str, 256) 과 같은 결과를 내는 함수이다 (schema.py 의 토큰 해시 채우기에서 씀).
+        conn.create_function(
+            "SHA2", 2, lambda value, bits: hashlib.sha256(str(value).encode("utf-8")).hexdigest(), deterministic=True
+        )
+        # MariaDB NOW() 처럼 DB 쪽 로컬 시각을 돌려준다 (created_at 기본값과 같은 형식).
+        conn.create_function("NOW", 0, lambda: datetime.now().isoformat(" ", "seconds"))
+        return conn
+
+    return connect
+
+
+def db_now(cur) -> datetime:
+    """
+    DB 의 NOW() 를 datetime 으로 돌려준다. created_at 이 DB 시각으로 채워지므로 기간 조건의 기준 시각은
+    앱 서버 시계가 아니라 이것으로 잡아야 두 서버의 시간대/시계가 달라도 어긋나지 않는다.
+    """
+    cur.execute("SELECT NOW()")
+    value = cur.fetchone()[0]
+    # SQLite 대용품의 함수 결과는 선언 타입이 없어서 문자열로 온다.
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class PooledMySQL:
+    """
+    flask_mysqldb.MySQL 대신 쓰는 확장이다. mysql.connection 은 앱 컨텍스트마다 풀에서 한 번 빌리고
+    컨텍스트가 끝나면 반납한다. 풀은 프로세스마다 처음 쓸 때 만든다 (gunicorn fork 뒤에도 안전).
+    """
+
+    def __init__(self, app=None):
+        self.metrics = DBMetrics()
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        app.teardown_appcontext(self._teardown)
+
+    @property
+    def pool(self) -> ConnectionPool:
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    # fork 로 물려받은 연결은 부모와 소켓을 공유하므로 닫지 않고 버린다.
+                    self._pool = self._create_pool()
+                    self._pool_pid = pid
+        return self._pool
+
+    def _create_pool(self) -> ConnectionPool:
+        config = self.app.config
+        sqlite_path = config.get("DB_SQLITE_PATH")
+        if sqlite_path:
+            connect, dialect = _sqlite_connector(sqlite_path), "sqlite"
+        else:
+            connect, dialect = _mysql_connector(config), "mysql"
+        return ConnectionPool(
+            connect,
+            dialect=dialect,
+            size=config.get("MYSQL_POOL_SIZE", 10),
+            timeout=config.get("MYSQL_POOL_TIMEOUT", 5.0),
+            recycle=config.get("MYSQL_POOL_RECYCLE", 1800.0),
+            ping_idle=config.get("MYSQL_POOL_PING_IDLE", 5.0),
+            slow_query=config.get("MYSQL_SLOW_QUERY_SECONDS", 0.0),
+            metrics=self.metrics,
+            logger=self.app.logger,
+        )
+
+    @property
+    def connection(self) -> PooledConnection:
+        conn = g.get("_db_connection")
+        if conn is None:
+            conn = self.pool.checkout()
+            g._db_connection = conn
+        return conn
+
+    def _teardown(self, exc) -> None:
+        conn = g.pop("_db_connection", None)
+        if conn is not None:
+            self.pool.checkin(conn)
@@ -0,0 +1,274 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from face_index import get_embedder, get_index
+from metrics import stage_timer
+from mosaic_api import parse_blur_strength, pixelate_array
+
+
+# ---------------------------
+# 얼굴 탐지 + 얼굴 영역 모자이크
+# ---------------------------
+# 탐지 모델은 워커 프로세스당 한 번만 로드해서 모든 요청에 재사용한다 (get_detector).
+# 탐지는 긴 변이 DETECT_MAX_SIDE 이하가 되도록 줄인 사본에서 하고 박스만 원본 해상도로 되돌리므로
+# 사진 해상도가 커져도 탐지 시간은 거의 일정함이다. 줄이는 방법은 shrink_for_detection 하나로 정해서
+# 배열 경로와 큰 사진의 PIL 띠 경로가 같은 박스를 얻는다.
+
+# 탐지용으로 줄인 이미지의 긴 변 최대 길이(px)이다.
+DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "640"))
+
+# YuNet(ONNX) 모델 경로이다. 비어 있으면 OpenCV 에 포함된 Haar cascade 를 쓴다.
+YUNET_MODEL_PATH = os.getenv("FACE_DETECTOR_MODEL", "")
+
+# 얼굴 박스를 가장자리까지 덮도록 상하좌우로 넓히는 비율이다.
+BOX_PADDING = 0.15
+
+# 얼굴 영역은 전체 화면보다 훨씬 작으므로 blur_strength 를 얼굴 크기 대비 블록 비율로 따로 매핑한다.
+FACE_MIN_BLOCK_RATIO = 0.08
+FACE_MAX_BLOCK_RATIO = 0.25
+
+
+# 탐지용 축소 1단계(정수 배 블록 평균)를 이 행 수 안팎의 띠 단위로 한다.
+SHRINK_STRIP_ROWS = 512
+
+
+def detection_size(width: int, height: int, max_side: int) -> tuple:
+    """
+    탐지용으로 줄인 이미지 크기 (w, h) 와 1단계 정수 축소 배율 k 를 돌려준다.
+    k 는 1단계 결과가 최종 크기의 2배 이상 남도록 고른다 (1 이면 1단계 없음).
+    """
+    scale = min(1.0, max_side / float(max(width, height)))
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return size, max(1, int(1.0 / scale) // 2)
+
+
+def shrink_for_detection(read_rows, width: int, height: int, max_side: int) -> np.ndarray:
+    """
+    탐지기에 넣을 축소 이미지를 만든다. read_rows(y0, y1) 은 [y0, y1) 행의 3채널 배열을 돌려주는 함수이다.
+    배열 경로(FaceDetector.detect)와 PIL 띠 경로(mosaic_faces_image)가 모두 이 함수를 거치므로
+    두 경로의 탐지기 입력은 같은 픽셀이다.
+      1단계: k x k 블록 평균(cv2 INTER_AREA 정수 배율)을 띠마다 한다. 블록이 띠 경계를 넘지 않으므로
+             띠로 나눠도 한 번에 한 것과 같고, 원본 전체를 한 배열로 올리지 않는다.
+      2단계: 1단계 결과를 최종 크기로 INTER_AREA 축소한다.
+    """
+    (small_w, small_h), k = detection_size(width, height, max_side)
+    if k == 1:
+        reduced = read_rows(0, height)
+    else:
+        reduced_w, reduced_h = width // k, height // k
+        step = k * max(1, SHRINK_STRIP_ROWS // k)
+        parts = []
+        for y0 in range(0, reduced_h * k, step):
+            y1 = min(y0 + step, reduced_h * k)
+            strip = read_rows(y0, y1)[:, : reduced_w * k]
+            parts.append(cv2.resize(strip, (reduced_w, (y1 - y0) // k), interpolation=cv2.INTER_AREA))
+        reduced = np.concatenate(parts)
+    if reduced.shape[1] == small_w and reduced.shape[0] == small_h:
+        return reduced
+    return cv2.resize(reduced, (small_w, small_h), interpolation=cv2.INTER_AREA)
+
+
+def scale_boxes(boxes, width: int, height: int, small: np.ndarray) -> np.ndarray:
+    """축소 이미지 기준 (x, y, w, h) 박스를 원본 해상도로 되돌린다 (가로/세로 배율을 따로 쓴다)."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    factor = np.array([width / small.shape[1], height / small.shape[0]] * 2)
+    return np.round(boxes * factor).astype(np.int32)
+
+
+class FaceDetector:
+    """
+    얼굴 탐지기이다. detect() 는 원본 해상도 기준 (x, y, w, h) 박스 배열(N, 4)을 돌려준다.
+    """
+
+    def __init__(self, model_path: str = YUNET_MODEL_PATH, max_side: int = DETECT_MAX_SIDE):
+        self.max_side = max_side
+        self._yunet = None
+        self._cascade = None
+        if model_path:
+            self._yunet = cv2.FaceDetectorYN.create(model_path, "", (320, 320), 0.8)
+        else:
+            cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+            self._cascade = cv2.CascadeClassifier(cascade_path)
+            if self._cascade.empty():
+                raise RuntimeError(f"얼굴 탐지 모델을 불러올 수 없음이다: {cascade_path}")
+        # cv2 탐지기 객체는 스레드 안전하지 않으므로 inprocess 백엔드에서 여러 스레드가 부를 때를 대비한다.
+        self._lock = threading.Lock()
+
+    def detect(self, arr: np.ndarray, color_order: str = "RGB") -> np.ndarray:
+        h, w = arr.shape[:2]
+        small = shrink_for_detection(lambda y0, y1: arr[y0:y1], w, h, self.max_side)
+        return scale_boxes(self._detect_small(small, color_order), w, h, small)
+
+    def detect_image(self, img: Image.Image) -> np.ndarray:
+        """
+        PIL 이미지(RGB/RGBA)판 detect 이다. 띠 단위로 읽어 줄이므로 원본 전체 배열을 만들지 않고,
+        같은 이미지의 배열로 detect 한 것과 같은 박스를 돌려준다.
+        """
+        def read_rows(y0, y1):
+            strip = img.crop((0, y0, img.width, y1))
+            return np.asarray(strip if strip.mode == "RGB" else strip.convert("RGB"))
+
+        small = shrink_for_detection(read_rows, img.width, img.height, self.max_side)
+        return scale_boxes(self._detect_small(small, "RGB"), img.width, img.height, small)
+
+    def _detect_small(self, small: np.ndarray, color_order: str):
+        with self._lock:
+            if self._yunet is not None:
+                bgr = cv2.cvtColor(small, cv2.COLOR_RGB2BGR) if color_order == "RGB" else small
+                self._yunet.setInputSize((bgr.shape[1], bgr.shape[0]))
+                _, faces = self._yunet.detect(bgr)
+                return faces[:, :4] if faces is not None else np.empty((0, 4))
+            code = cv2.COLOR_RGB2GRAY if color_order == "RGB" else cv2.COLOR_BGR2GRAY
+            gray = cv2.cvtColor(small, code)
+            return self._cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(20, 20))
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> FaceDetector:
+    """
+    프로세스 전역 탐지기를 돌려준다. 처음 한 번만 모델을 로드한다.
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = FaceDetector()
+    return _detector
+
+
+def face_block_size(strength, width: int, height: int) -> int:
+    """
+    blur_strength(0~100)와 얼굴 박스 크기로 얼굴 모자이크 블록 크기를 계산한다.
+    """
+    strength = parse_blur_strength(strength)
+    ratio = FACE_MIN_BLOCK_RATIO + (FACE_MAX_BLOCK_RATIO - FACE_MIN_BLOCK_RATIO) * strength / 100.0
+    return max(2, int(round(min(width, height) * ratio)))
+
+
+def pad_boxes(boxes: np.ndarray, width: int, height: int, padding: float = BOX_PADDING) -> np.ndarray:
+    """
+    (x, y, w, h) 박스를 padding 비율만큼 넓히고 이미지 경계 안으로 자른 (x0, y0, x1, y1) 배열을 돌려준다.
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    pad_w = boxes[:, 2] * padding
+    pad_h = boxes[:, 3] * padding
+    x0 = np.clip(boxes[:, 0] - pad_w, 0, width)
+    y0 = np.clip(boxes[:, 1] - pad_h, 0, height)
+    x1 = np.clip(boxes[:, 0] + boxes[:, 2] + pad_w, 0, width)
+    y1 = np.clip(boxes[:, 1] + boxes[:, 3] + pad_h, 0, height)
+    return np.stack([x0, y0, x1, y1], axis=1).astype(np.int32)
+
+
+def pixelate_boxes(arr: np.ndarray, boxes: np.ndarray, blur_strength=0) -> np.ndarray:
+    """
+    (x, y, w, h) 박스 영역만 제자리에서 픽셀화한다. 박스마다 배열 뷰를 잘라 커널에 넘기므로 복사가 없다.
+    """
+    h, w = arr.shape[:2]
+    for x0, y0, x1, y1 in pad_boxes(boxes, w, h):
+        if x1 <= x0 or y1 <= y0:
+            continue
+        block = face_block_size(blur_strength, x1 - x0, y1 - y0)
+        pixelate_array(arr[y0:y1, x0:x1], block)
+    return arr
+
+
+def crop_boxes(arr: np.ndarray, boxes: np.ndarray) -> list:
+    """
+    (x, y, w, h) 박스를 이미지 경계 안으로 잘라 얼굴 crop 뷰 목록을 돌려준다.
+    """
+    h, w = arr.shape[:2]
+    crops = []
+    for x0, y0, x1, y1 in pad_boxes(boxes, w, h, padding=0.0):
+        crops.append(arr[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)])
+    return crops
+
+
+def _can_exclude(user_id) -> bool:
+    # 얼굴 인식 모델이 있고 등록 얼굴이 있을 때만 본인 얼굴을 가려낸다 (face_index.owner_exclusion_enabled).
+    return user_id is not None and get_embedder().identifies and user_id in get_index()
+
+
+def _match_owner(crops: list, user_id, color_order: str) -> np.ndarray:
+    embeddings = get_embedder().embed_many(crops, color_order)
+    return get_index().match(embeddings, user_ids=[user_id])
+
+
+def owner_mask(arr: np.ndarray, boxes: np.ndarray, user_id, color_order: str = "RGB") -> np.ndarray:
+    """
+    각 박스가 user_id 로 등록된 얼굴인지 bool (N,) 로 돌려준다.
+    등록된 얼굴이 없거나 얼굴 인식 모델이 없으면(face_index.owner_exclusion_enabled) 임베딩을 계산하지 않고
+    바로 전부 False(= 모두 모자이크)를 돌려준다.
+    """
+    if len(boxes) == 0 or not _can_exclude(user_id):
+        return np.zeros(len(boxes), dtype=bool)
+    return _match_owner(crop_boxes(arr, boxes), user_id, color_order)
+
+
+def mosaic_faces(
+    arr: np.ndarray, blur_strength=0, color_order: str = "RGB", exclude_user_id=None, timings: dict = None
+) -> np.ndarray:
+    """
+    얼굴을 탐지해서 얼굴 영역만 제자리에서 모자이크 처리하고, 모자이크한 박스를 돌려준다.
+    exclude_user_id 가 있으면 그 사용자가 등록한 얼굴과 같은 얼굴은 건너뛴다.
+    timings 가 있으면 탐지(본인 얼굴 판별 포함)에 걸린 시간을 timings["detect"] 에 더한다.
+    """
+    with stage_timer(timings, "detect"):
+        boxes = get_detector().detect(arr, color_order)
+        if exclude_user_id is not None and len(boxes):
+            boxes = boxes[~owner_mask(arr, boxes, exclude_user_id, color_order)]
+    pixelate_boxes(arr, boxes, blur_strength)
+    return boxes
+
+
+def mosaic_faces_image(img: Image.Image, blur_strength=0, exclude_user_id=None, timings: dict = None) -> np.ndarray:
+    """
+    mosaic_faces 의 PIL 이미지판이다. 큰 이미지(mosaic_api 띠 단위 경로)에서 전체 배열 사본을 만들지 않는다.
+      - 탐지는 FaceDetector.detect_image 로 한다 (배열 경로와 같은 축소 픽셀, 같은 박스).
+      - 본인 얼굴 판별과 모자이크는 얼굴 박스 영역만 잘라 배열로 처리하고 제자리에 붙여 넣는다.
+    그래서 추가 메모리는 줄인 이미지와 얼굴 박스 몇 개 크기이다. img 는 RGB 또는 RGBA 여야 하고 제자리에서 고쳐진다.
+    RGBA 는 mosaic_faces 경로와 같게 색 채널만 모자이크하고 알파는 그대로 둔다.
+    """
+    with stage_timer(timings, "detect"):
+        boxes = get_detector().detect_image(img)
+        if len(boxes) and _can_exclude(exclude_user_id):
+            crops = [
+                np.asarray(img.crop((x0, y0, max(x1, x0 + 1), max(y1, y0 + 1))).convert("RGB"))
+                for x0, y0, x1, y1 in pad_boxes(boxes, img.width, img.height, padding=0.0)
+            ]
+            boxes = boxes[~_match_owner(crops, exclude_user_id, "RGB")]
+
+    for x0, y0, x1, y1 in pad_boxes(boxes, img.width, img.height):
+        if x1 <= x0 or y1 <= y0:
+            continue
+        region = np.array(img.crop((x0, y0, x1, y1)))
+        block = face_block_size(blur_strength, x1 - x0, y1 - y0)
+        if region.ndim == 3 and region.shape[2] == 4:
+            rgb = np.ascontiguousarray(region[..., :3])
+            pixelate_array(rgb, block)
+            region[..., :3] = rgb
+        else:
+            pixelate_array(region, block)
+        img.paste(Image.fromarray(region, img.mode), (x0, y0))
+    return boxes
+
+
+def embed_face_image(path: str):
+    """
+    등록용 얼굴 사진에서 가장 큰 얼굴을 찾아 임베딩을 돌려준다. 얼굴이 없으면 None 이다.
+    """
+    with Image.open(path) as src:
+        arr = np.array(src.convert("RGB"))
+    boxes = get_detector().detect(arr, "RGB")
+    if len(boxes) == 0:
+        return None
+    largest = boxes[np.argmax(boxes[:, 2] * boxes[:, 3])][None, :]
+    return get_embedder().embed(crop_boxes(arr, largest)[0], "RGB")
@@ -0,0 +1,221 @@
+import fcntl
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+# ---------------------------
+# 등록 얼굴 임베딩 인덱스
+# ---------------------------
+# /register_face 에서 얼굴 임베딩을 한 번만 계산해 저장하고, 작업 때는 다시 계산하지 않는다.
+# 인덱스는 메모리에 (M, D) 행렬로 들고 있고 npz 파일로 저장한다.
+# 탐지된 얼굴 N 개와의 비교는 (N, D) @ (D, M) 행렬곱 한 번으로 끝나는 코사인 유사도 계산이다.
+# 여러 프로세스(gunicorn 워커, 모자이크 워커)가 같은 파일을 쓰므로
+#   - 쓰기는 flock 으로 잠그고 디스크 내용을 다시 읽은 뒤 원자적으로 교체하고
+#   - 읽기는 파일 mtime 이 바뀌었을 때만 다시 로드한다.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", os.path.join(BASE_DIR, "face_index.npz"))
+
+# SFace(ONNX) 모델 경로이다. 비어 있으면 정규화한 흑백 얼굴 패치를 임베딩으로 쓴다.
+# 패치는 신원 임베딩이 아니라서(비슷한 정면 얼굴이면 남의 얼굴도 맞는다고 나옴) 본인 얼굴 제외에는 쓰지 않는다.
+# 즉 모델이 없으면 본인 얼굴 제외가 꺼지고 모든 얼굴을 모자이크한다 (개인정보 기능이므로 안전한 쪽으로 실패함).
+SFACE_MODEL_PATH = os.getenv("FACE_EMBEDDER_MODEL", "")
+
+
+class FaceEmbedder:
+    """
+    얼굴 crop(RGB 또는 BGR)을 L2 정규화된 float32 벡터로 바꾼다.
+    threshold 는 같은 사람으로 볼 코사인 유사도 기준값이다.
+    identifies 는 벡터로 사람을 구별할 수 있는지(얼굴 인식 모델인지) 여부이다.
+    """
+
+    def __init__(self, model_path: str = SFACE_MODEL_PATH):
+        self._sface = None
+        self._lock = threading.Lock()
+        if model_path:
+            self._sface = cv2.FaceRecognizerSF.create(model_path, "")
+            self.name = "sface"
+            self.threshold = 0.363
+            self.identifies = True
+        else:
+            self.name = "patch64"
+            self.threshold = 0.6
+            self.identifies = False
+
+    def embed(self, face: np.ndarray, color_order: str = "RGB") -> np.ndarray:
+        if self._sface is not None:
+            bgr = cv2.cvtColor(face, cv2.COLOR_RGB2BGR) if color_order == "RGB" else face
+            bgr = cv2.resize(bgr, (112, 112), interpolation=cv2.INTER_AREA)
+            with self._lock:
+                vec = self._sface.feature(bgr).reshape(-1).astype(np.float32)
+        else:
+            code = cv2.COLOR_RGB2GRAY if color_order == "RGB" else cv2.COLOR_BGR2GRAY
+            gray = cv2.cvtColor(face, code)
+            gray = cv2.equalizeHist(cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA))
+            vec = gray.reshape(-1).astype(np.float32)
+            vec -= vec.mean()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def embed_many(self, faces: list, color_order: str = "RGB") -> np.ndarray:
+        if not faces:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([self.embed(face, color_order) for face in faces])
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def owner_exclusion_enabled() -> bool:
+    """본인 얼굴 제외를 할 수 있는지 여부이다. 얼굴 인식 모델(SFACE_MODEL_PATH)이 있을 때만 True 이다."""
+    return bool(SFACE_MODEL_PATH)
+
+
+def get_embedder() -> FaceEmbedder:
+    """
+    프로세스 전역 임베더를 돌려준다. 처음 한 번만 모델을 로드한다.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = FaceEmbedder()
+    return _embedder
+
+
+class FaceIndex:
+    """
+    user_id → 얼굴 임베딩 인덱스이다. 메모리 행렬 + npz 파일로 유지한다.
+    """
+
+    def __init__(self, path: str = FACE_INDEX_PATH, model: str = None):
+        self.path = path
+        self.model = model or get_embedder().name
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+
+    def _read_disk(self):
+        try:
+            with np.load(self.path) as data:
+                if str(data["model"]) != self.model:
+                    # 다른 임베딩 모델로 만든 벡터는 비교할 수 없으므로 무시한다 (재등록 필요).
+                    return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+                return data["user_ids"].astype(np.int64), data["embeddings"].astype(np.float32)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    def refresh(self) -> None:
+        """디스크 파일이 바뀌었으면 다시 읽는다. 바뀌지 않았으면 stat 한 번으로 끝난다."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            self._user_ids, self._matrix = self._read_disk()
+            self._mtime = mtime
+
+    def _write(self, user_ids: np.ndarray, matrix: np.ndarray) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, model=np.array(self.model), user_ids=user_ids, embeddings=matrix)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, func) -> None:
+        # 다른 프로세스의 변경을 덮어쓰지 않도록 잠근 상태에서 디스크 내용을 기준으로 고친다.
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                user_ids, matrix = self._read_disk()
+                user_ids, matrix = func(user_ids, matrix)
+                self._write(user_ids, matrix)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._mtime = None
+        self.refresh()
+
+    def set(self, user_id: int, embedding: np.ndarray) -> None:
+        """사용자 임베딩을 추가하거나 교체하고 디스크에 저장한다."""
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+
+        def apply(user_ids, matrix):
+            keep = user_ids != user_id
+            if matrix.size and matrix.shape[1] == embedding.shape[1]:
+                matrix = matrix[keep]
+                user_ids = user_ids[keep]
+            else:
+                matrix = np.empty((0, embedding.shape[1]), dtype=np.float32)
+                user_ids = np.empty(0, dtype=np.int64)
+            return np.append(user_ids, user_id), np.vstack([matrix, embedding])
+
+        self._update(apply)
+
+    def remove(self, user_id: int) -> None:
+        def apply(user_ids, matrix):
+            keep = user_ids != user_id
+            return user_ids[keep], matrix[keep] if matrix.size else matrix
+
+        self._update(apply)
+
+    def match(self, embeddings: np.ndarray, user_ids=None, threshold: float = None) -> np.ndarray:
+        """
+        (N, D) 임베딩 각각이 등록된 얼굴(user_ids 로 제한 가능)과 같은 사람인지 bool (N,) 로 돌려준다.
+        """
+        self.refresh()
+        n = len(embeddings)
+        # refresh() 가 두 배열을 바꿔 끼우는 중에 짝이 안 맞는 값을 읽지 않도록 잠근 채 함께 가져온다.
+        with self._lock:
+            index_ids, matrix = self._user_ids, self._matrix
+        if n == 0 or matrix.size == 0:
+            return np.zeros(n, dtype=bool)
+
+        if user_ids is not None:
+            matrix = matrix[np.isin(index_ids, list(user_ids))]
+        if matrix.size == 0 or matrix.shape[1] != embeddings.shape[1]:
+            return np.zeros(n, dtype=bool)
+
+        if threshold is None:
+            threshold = get_embedder().threshold
+        # 모든 벡터가 L2 정규화되어 있으므로 내적이 곧 코사인 유사도이다.
+        similarity = embeddings @ matrix.T
+        return (similarity >= threshold).any(axis=1)
+
+    def fingerprint(self, user_id) -> str:
+        """
+        사용자 임베딩의 짧은 해시이다. 등록 얼굴이 바뀌면 값이 바뀌므로 결과 캐시 키에 넣는다.
+        """
+        self.refresh()
+        with self._lock:
+            index_ids, matrix = self._user_ids, self._matrix
+        rows = matrix[index_ids == user_id] if matrix.size else matrix
+        if rows.size == 0:
+            return ""
+        return hashlib.sha1(rows.tobytes()).hexdigest()[:16]
+
+    def __contains__(self, user_id) -> bool:
+        self.refresh()
+        with self._lock:
+            index_ids = self._user_ids
+        return bool(np.any(index_ids == user_id))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FaceIndex:
+    """프로세스 전역 인덱스를 돌려준다."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FaceIndex()
+    return _index
@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+
+
+# ---------------------------
+# 동영상용 얼굴 추적기
+# ---------------------------
+# 매 프레임 얼굴 탐지를 돌리는 대신 detect_interval 프레임마다(또는 장면 전환 시) 한 번만 탐지하고,
+# 그 사이 프레임은 등속 모델로 박스를 옮긴다. 탐지 결과와 기존 트랙은 IoU 로 짝지으며
+# 박스는 지수 이동 평균으로 부드럽게 만들어 모자이크가 떨리지 않게 한다.
+# 본인 얼굴 여부는 트랙이 처음 생길 때 한 번만 판단해서 임베딩 계산도 트랙 수만큼만 한다.
+
+# 탐지 결과와 트랙을 같은 얼굴로 볼 최소 IoU 이다.
+MATCH_IOU = 0.3
+
+# 박스 스무딩 계수이다. 클수록 새 탐지 결과를 더 많이 따른다.
+SMOOTHING = 0.6
+
+# 탐지에서 연속으로 놓친 횟수가 이보다 많으면 트랙을 버린다.
+MAX_MISSES = 2
+
+# 장면 전환 판단용 썸네일 크기와 평균 밝기 차이 기준값(0~255)이다.
+SCENE_THUMB_SIZE = (32, 18)
+SCENE_CHANGE_THRESHOLD = 40.0
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    (x, y, w, h) 박스 배열 a(N, 4), b(M, 4) 사이의 IoU 를 (N, M) 행렬로 한 번에 계산한다.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    a = np.asarray(a, dtype=np.float64)[:, None, :]
+    b = np.asarray(b, dtype=np.float64)[None, :, :]
+    x0 = np.maximum(a[..., 0], b[..., 0])
+    y0 = np.maximum(a[..., 1], b[..., 1])
+    x1 = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    y1 = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return np.where(union > 0, inter / union, 0.0)
+
+
+class _Track:
+    __slots__ = ("box", "velocity", "misses", "is_owner")
+
+    def __init__(self, box: np.ndarray, is_owner: bool):
+        self.box = box.astype(np.float64)
+        self.velocity = np.zeros(2)
+        self.misses = 0
+        self.is_owner = is_owner
+
+
+class FaceTracker:
+    """
+    step(index, frame) 마다 모자이크할 (x, y, w, h) 박스 배열을 돌려준다.
+    detect(frame) 는 박스 배열을, owner_mask(frame, boxes) 는 본인 얼굴 bool 배열을 돌려주는 함수이다.
+    """
+
+    def __init__(self, detect, detect_interval: int = 5, owner_mask=None):
+        self.detect = detect
+        self.detect_interval = max(1, int(detect_interval))
+        self.owner_mask = owner_mask
+        self.tracks = []
+        self.detections = 0
+        self._frames_since_detect = None
+        self._prev_thumb = None
+
+    def _scene_changed(self, frame: np.ndarray) -> bool:
+        small = cv2.resize(frame, SCENE_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        thumb = small.astype(np.int16)
+        changed = (
+            self._prev_thumb is not None
+            and float(np.abs(thumb - self._prev_thumb).mean()) > SCENE_CHANGE_THRESHOLD
+        )
+        self._prev_thumb = thumb
+        return changed
+
+    def _update_with_detections(self, frame: np.ndarray, boxes: np.ndarray) -> None:
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        predicted = np.array([t.box for t in self.tracks]).reshape(-1, 4)
+        ious = iou_matrix(predicted, boxes)
+
+        matched_tracks = set()
+        matched_boxes = set()
+        # IoU 가 큰 쌍부터 탐욕적으로 짝짓는다 (얼굴 수가 적어서 헝가리안까지는 필요 없음).
+        for flat in np.argsort(ious, axis=None)[::-1]:
+            ti, bi = np.unravel_index(flat, ious.shape)
+            if ious[ti, bi] < MATCH_IOU:
+                break
+            if ti in matched_tracks or bi in matched_boxes:
+                continue
+            track = self.tracks[ti]
+            new_box = SMOOTHING * boxes[bi] + (1 - SMOOTHING) * track.box
+            # 탐지 간격 동안의 평균 이동량을 다음 구간의 속도로 쓴다.
+            steps = max(1, self._frames_since_detect or 1)
+            track.velocity = (new_box[:2] - track.box[:2]) / steps + track.velocity
+            track.box = new_box
+            track.misses = 0
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                track.velocity[:] = 0
+            if track.misses <= MAX_MISSES:
+                survivors.append(track)
+
+        new_idx = [i for i in range(len(boxes)) if i not in matched_boxes]
+        if new_idx:
+            new_boxes = boxes[new_idx]
+            if self.owner_mask is not None:
+                owners = self.owner_mask(frame, new_boxes.astype(np.int32))
+            else:
+                owners = np.zeros(len(new_boxes), dtype=bool)
+            survivors.extend(_Track(box, bool(owner)) for box, owner in zip(new_boxes, owners))
+
+        self.tracks = survivors
+
+    def step(self, index: int, frame: np.ndarray) -> np.ndarray:
+        scene_changed = self._scene_changed(frame)
+        due = self._frames_since_detect is None or self._frames_since_detect >= self.detect_interval
+
+        if scene_changed:
+            # 장면이 바뀌면 이전 트랙은 의미가 없으므로 버리고 새로 탐지한다.
+            self.tracks = []
+        if due or scene_changed:
+            self._update_with_detections(frame, self.detect(frame))
+            self.detections += 1
+            self._frames_since_detect = 1
+        else:
+            for track in self.tracks:
+                track.box[:2] += track.velocity
+            self._frames_since_detect += 1
+
+        boxes = [t.box for t in self.tracks if not t.is_owner]
+        if not boxes:
+            return np.empty((0, 4), dtype=np.int32)
+        return np.round(np.array(boxes)).astype(np.int32)
@@ -0,0 +1,186 @@
+import io
+import os
+
+from PIL import Image
+
+
+# ---------------------------
+# 결과 이미지 인코더
+# ---------------------------
+# 기본값(keep)은 입력 포맷을 그대로 유지한다. PNG 스크린샷은 PNG(투명도 포함)로, JPEG 은 JPEG 으로 나간다.
+# 요청하면 WebP / 프로그레시브 JPEG 으로 바꿔 저장할 수 있고,
+# target_bytes 가 있으면 품질 값을 이진 탐색해서 그 크기 안에 들어오는 가장 높은 품질로 인코딩한다.
+# 작은 결과만 필요하면(max_side) JPEG 은 draft() 로 DCT 단계에서 1/2~1/8 로 줄여 디코드하므로
+# 디코드/모자이크/인코드 비용과 전송량이 함께 줄어든다.
+
+# 사용자가 고를 수 있는 출력 형식이다.
+OUTPUT_CHOICES = ("keep", "jpeg", "progressive_jpeg", "webp", "png")
+
+# keep 일 때 원본 포맷 → 출력 포맷이다. 목록에 없는 포맷은 JPEG 으로 저장한다.
+KEEP_FORMATS = {
+    "JPEG": "JPEG",
+    "MPO": "JPEG",
+    "PNG": "PNG",
+    "WEBP": "WEBP",
+    "GIF": "PNG",
+    "BMP": "PNG",
+    "TIFF": "PNG",
+}
+
+EXT_BY_FORMAT = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# 업로드 판별 결과(mime) → 원본 포맷 이름이다. keep 일 때 결과 확장자를 미리 정하는 데 쓴다.
+FORMAT_BY_MIME = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/gif": "GIF",
+    "image/webp": "WEBP",
+    "image/bmp": "BMP",
+    "image/tiff": "TIFF",
+}
+
+DEFAULT_QUALITY = 85
+MIN_QUALITY = 20
+MAX_QUALITY = 95
+
+# 결과 긴 변의 최소/최대 길이(px)이다.
+MIN_SIDE = 16
+MAX_SIDE = 16384
+
+
+def parse_output_format(value) -> str:
+    """폼에서 넘어온 output_format 값을 OUTPUT_CHOICES 중 하나로 정규화한다."""
+    value = (value or "keep").strip().lower()
+    return value if value in OUTPUT_CHOICES else "keep"
+
+
+def parse_quality(value):
+    """quality(MIN_QUALITY~MAX_QUALITY) 값이다. 비어 있으면 None(기본 품질)이다."""
+    try:
+        quality = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(MIN_QUALITY, min(MAX_QUALITY, quality))
+
+
+def parse_target_bytes(value_kb):
+    """목표 크기(KB) 폼 값을 바이트로 바꾼다. 비어 있거나 0 이하면 None 이다."""
+    try:
+        kb = int(float(value_kb))
+    except (TypeError, ValueError):
+        return None
+    return kb * 1024 if kb > 0 else None
+
+
+def parse_max_side(value):
+    """결과 긴 변 길이(px) 폼 값이다. 비어 있으면 None(원본 크기)이다."""
+    try:
+        side = int(value)
+    except (TypeError, ValueError):
+        return None
+    if side <= 0:
+        return None
+    return max(MIN_SIDE, min(MAX_SIDE, side))
+
+
+def resolve_output_format(choice: str, source_format: str):
+    """
+    출력 선택값과 원본 포맷으로 (PIL 포맷 이름, progressive 여부) 를 정한다.
+    """
+    choice = parse_output_format(choice)
+    if choice == "keep":
+        return KEEP_FORMATS.get((source_format or "").upper(), "JPEG"), False
+    if choice == "progressive_jpeg":
+        return "JPEG", True
+    return choice.upper(), False
+
+
+def output_extension(choice: str, source_format: str) -> str:
+    """결과 파일 확장자이다. 파일 이름과 실제 내용 포맷이 항상 같게 한다."""
+    return EXT_BY_FORMAT[resolve_output_format(choice, source_format)[0]]
+
+
+def open_for_output(path_or_stream, max_side: int = None) -> Image.Image:
+    """
+    이미지를 연다. max_side 가 있으면 JPEG 은 draft() 로 줄여서 디코드하고,
+    나머지 포맷은 디코드 후 긴 변이 max_side 가 되도록 줄인다.
+    """
+    img = Image.open(path_or_stream)
+    if not max_side or max(img.size) <= max_side:
+        return img
+    scale = max_side / float(max(img.size))
+    target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if img.format in ("JPEG", "MPO"):
+        # 요청 크기 이상인 범위에서 가장 작은 1/2^n 배율로 디코드한다 (남은 차이는 아래 thumbnail 이 맞춤).
+        img.draft(img.mode, target)
+    img.thumbnail(target, Image.LANCZOS)
+    return img
+
+
+def _save_kwargs(fmt: str, quality: int, progressive: bool, icc_profile) -> dict:
+    kwargs = {}
+    if icc_profile:
+        kwargs["icc_profile"] = icc_profile
+    if fmt == "JPEG":
+        kwargs.update(quality=quality, optimize=progressive, progressive=progressive)
+    elif fmt == "WEBP":
+        kwargs.update(quality=quality, method=4)
+    return kwargs
+
+
+def _flatten_alpha(img: Image.Image) -> Image.Image:
+    # JPEG 은 투명도를 담을 수 없으므로 흰 배경에 합성한다.
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def encode_image(
+    img: Image.Image,
+    fp,
+    fmt: str,
+    progressive: bool = False,
+    quality: int = None,
+    target_bytes: int = None,
+    icc_profile=None,
+) -> dict:
+    """
+    img 를 fmt(JPEG/PNG/WEBP)로 fp(경로 또는 파일 객체)에 저장하고 {format, quality, bytes} 를 돌려준다.
+    target_bytes 가 있으면(JPEG/WebP) 그 크기 이하가 되는 가장 높은 품질을 이진 탐색으로 찾는다.
+    가장 낮은 품질로도 넘으면 가장 낮은 품질 결과를 쓴다.
+    """
+    if fmt == "JPEG":
+        img = _flatten_alpha(img)
+
+    if fmt == "PNG" or not target_bytes:
+        quality = quality or DEFAULT_QUALITY
+        img.save(fp, format=fmt, **_save_kwargs(fmt, quality, progressive, icc_profile))
+        size = fp.tell() if hasattr(fp, "tell") else os.path.getsize(fp)
+        return {"format": fmt, "quality": quality if fmt != "PNG" else None, "bytes": size}
+
+    low, high = MIN_QUALITY, quality or MAX_QUALITY
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        buf = io.BytesIO()
+        img.save(buf, format=fmt, **_save_kwargs(fmt, mid, progressive, icc_profile))
+        if buf.tell() <= target_bytes:
+            best = (mid, buf)
+            low = mid + 1
+        else:
+            high = mid - 1
+            # 모든 품질이 목표보다 크면 마지막에 시험하는 MIN_QUALITY 결과를 쓴다.
+            if best is None and mid == MIN_QUALITY:
+                best = (mid, buf)
+
+    quality, buf = best
+    data = buf.getbuffer()
+    if hasattr(fp, "write"):
+        fp.write(data)
+    else:
+        with open(fp, "wb") as out:
+            out.write(data)
+    return {"format": fmt, "quality": quality, "bytes": len(data)}
@@ -0,0 +1,338 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from mosaic_backend import MosaicError
+
+
+# ---------------------------
+# 비동기 모자이크 작업 큐
+# ---------------------------
+# 업로드 라우트는 작업을 큐에 넣고 바로 응답하고, JobRunner 스레드가 큐에서 꺼내 백엔드로 처리한다.
+# 큐는 로컬 SQLite 파일에 저장되므로 워커가 재시작돼도 작업이 사라지지 않는다.
+# running 상태로 남은 작업은 lease 가 지나면 다시 queued 로 돌려서 재처리함이다.
+# lease 는 작업 종류마다 따로 둔다 (사진은 몇 분, 동영상은 몇 시간). 하나로 두면 워커가 죽었을 때
+# 사진 작업도 동영상 기준 시간 동안 running 으로 남아서 사용자가 그만큼 폴링하게 된다.
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    user_id INTEGER,
+    history_id INTEGER,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    error TEXT,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+
+class JobQueue:
+    """
+    SQLite 기반 영속 작업 큐이다. 스레드마다 연결을 새로 열기 때문에 어느 스레드에서 불러도 된다.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3, kind_lease_seconds: dict = None):
+        """
+        lease_seconds 는 기본 lease(초)이고, kind_lease_seconds({kind: 초})가 있으면 그 종류에는 그 값을 쓴다.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.kind_lease_seconds = dict(kind_lease_seconds or {})
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # 예전 버전에서 만든 큐 파일에는 result 컬럼이 없으므로 추가한다.
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "result" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN result TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # WAL 모드면 상태 조회(읽기)가 작업 갱신(쓰기)에 막히지 않는다.
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enqueue(
+        self,
+        kind: str,
+        input_path: str,
+        output_path: str,
+        user_id=None,
+        history_id=None,
+        params: dict = None,
+        status: str = STATUS_QUEUED,
+        result: dict = None,
+    ) -> int:
+        """
+        작업을 queued 상태로 넣고 작업 id 를 돌려준다.
+        캐시 적중처럼 이미 끝난 작업은 status=success 로 바로 기록해서 상태 조회를 똑같이 쓰게 한다.
+        """
+        return self.enqueue_many(
+            [
+                {
+                    "kind": kind,
+                    "input_path": input_path,
+                    "output_path": output_path,
+                    "user_id": user_id,
+                    "history_id": history_id,
+                    "params": params,
+                    "status": status,
+                    "result": result,
+                }
+            ]
+        )[0]
+
+    def enqueue_many(self, jobs: list) -> list:
+        """
+        enqueue() 인자 dict 목록을 한 트랜잭션으로 넣고 작업 id 목록을 같은 순서로 돌려준다.
+        """
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job in jobs:
+                    status = job.get("status", STATUS_QUEUED)
+                    cur = conn.execute(
+                        "INSERT INTO jobs (kind, user_id, history_id, input_path, output_path, params, status, result, created_at, finished_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            job["kind"],
+                            job.get("user_id"),
+                            job.get("history_id"),
+                            job["input_path"],
+                            job["output_path"],
+                            json.dumps(job.get("params") or {}),
+                            status,
+                            json.dumps(job.get("result") or {}),
+                            now,
+                            now if status != STATUS_QUEUED else None,
+                        ),
+                    )
+                    ids.append(cur.lastrowid)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return ids
+
+    def claim(self) -> dict:
+        """
+        가장 오래된 queued 작업 하나를 running 으로 바꾸고 돌려준다. 없으면 None 이다.
+        UPDATE ... RETURNING 한 문장으로 처리해서 여러 프로세스가 같은 작업을 가져가지 않는다.
+        """
+        now = time.time()
+        # 한 문장 안에서 고른 작업의 종류에 맞는 lease 를 붙인다.
+        lease = "?"
+        lease_args = [self.lease_seconds]
+        if self.kind_lease_seconds:
+            lease = "CASE kind " + "WHEN ? THEN ? " * len(self.kind_lease_seconds) + "ELSE ? END"
+            lease_args = [v for item in self.kind_lease_seconds.items() for v in item] + lease_args
+        with self._connect() as conn:
+            row = conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? + {lease} "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1) "
+                "RETURNING *",
+                (STATUS_RUNNING, now, now, *lease_args, STATUS_QUEUED),
+            ).fetchone()
+        return _row_to_job(row)
+
+    def finish(self, job_id: int, status: str, error: str = None, result: dict = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (status, error, json.dumps(result or {}), time.time(), job_id),
+            )
+
+    def get(self, job_id: int) -> dict:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row)
+
+    def counts(self) -> dict:
+        """상태별 작업 수이다."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def finished(self, job_ids: list) -> list:
+        """job_ids 중 success/failed 로 끝난 작업 목록이다."""
+        if not job_ids:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE status IN (?, ?) AND id IN ({', '.join('?' * len(job_ids))})",
+                (STATUS_SUCCESS, STATUS_FAILED, *job_ids),
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def requeue_expired(self) -> list:
+        """
+        lease 가 지난 running 작업(처리하던 워커가 죽은 경우)을 다시 queued 로 돌린다.
+        재시도 횟수를 넘긴 작업은 failed 로 확정하고, 그 작업 목록을 돌려준다.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ? AND attempts < ?",
+                (STATUS_QUEUED, STATUS_RUNNING, now, self.max_attempts),
+            )
+            rows = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ? "
+                "RETURNING *",
+                (STATUS_FAILED, "재시도 횟수 초과", now, STATUS_RUNNING, now),
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+
+def _row_to_job(row) -> dict:
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job.get("result") or "{}")
+    return job
+
+
+class JobRunner:
+    """
+    큐에서 작업을 꺼내 모자이크 백엔드로 처리하는 백그라운드 스레드 묶음이다.
+    작업이 끝나면 on_finish(job, status, error) 를 호출해서 job_history 를 갱신하게 한다.
+    lease 가 지난 작업 정리(requeue_expired)는 쓰기 쿼리이므로 스레드마다 매 폴링마다 하지 않고,
+    꺼낼 작업이 없을 때 프로세스당 sweep_interval 초에 한 번만 한다.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        backend,
+        on_finish=None,
+        threads: int = 1,
+        poll_interval: float = 1.0,
+        sweep_interval: float = 30.0,
+        logger=None,
+    ):
+        self.queue = queue
+        self.backend = backend
+        self.on_finish = on_finish
+        self.threads = max(1, threads)
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.logger = logger
+        self._next_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._done = threading.Condition()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.threads):
+                threading.Thread(target=self._loop, name=f"job-runner-{i}", daemon=True).start()
+            self._started = True
+
+    def notify(self) -> None:
+        """새 작업이 들어왔음을 알려서 폴링 간격을 기다리지 않고 바로 꺼내게 한다."""
+        self._wakeup.set()
+
+    def wait_finished(self, timeout: float) -> None:
+        """
+        이 프로세스의 러너가 작업 하나를 끝내거나 timeout 초가 지날 때까지 기다린다.
+        다른 프로세스가 끝낸 작업은 알 수 없으므로 부르는 쪽이 timeout 마다 큐를 다시 확인한다.
+        """
+        with self._done:
+            self._done.wait(timeout)
+
+    def _sweep_expired(self) -> None:
+        # 이 프로세스의 다른 러너 스레드가 방금 했으면 건너뛴다.
+        with self._sweep_lock:
+            now = time.monotonic()
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        for job in self.queue.requeue_expired():
+            self._finished(job, STATUS_FAILED, job["error"])
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                job = self.queue.claim()
+                if job is None:
+                    self._sweep_expired()
+            except sqlite3.Error as e:
+                self._log("작업 큐 조회 실패: %s", e)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self.run_job(job)
+            except Exception as e:
+                # 결과 기록(finish) 중 "database is locked" 같은 오류가 나도 러너 스레드는 계속 돈다.
+                # 기록하지 못한 작업은 lease 가 지나면 다시 처리된다.
+                self._log("작업 %s 결과 기록 실패: %s", job["id"], e)
+
+    def _log(self, message: str, *args) -> None:
+        if self.logger is not None:
+            self.logger.error(message, *args)
+
+    def run_job(self, job: dict) -> None:
+        try:
+            # 같은 이름의 이전 결과가 결과 캐시와 하드링크로 묶여 있을 수 있으므로
+            # 그 자리에 덮어쓰지 않고 링크를 먼저 끊는다.
+            if os.path.exists(job["output_path"]):
+                os.remove(job["output_path"])
+            result = self.backend.process_file(
+                job["input_path"],
+                job["output_path"],
+                job["params"],
+                kind=job["kind"],
+            )
+        except MosaicError as e:
+            self.queue.finish(job["id"], STATUS_FAILED, str(e))
+            self._finished(job, STATUS_FAILED, str(e))
+            return
+        except Exception as e:
+            self.queue.finish(job["id"], STATUS_FAILED, f"알 수 없는 오류: {e}")
+            self._finished(job, STATUS_FAILED, str(e))
+            return
+
+        job["result"] = result or {}
+        self.queue.finish(job["id"], STATUS_SUCCESS, result=job["result"])
+        self._finished(job, STATUS_SUCCESS, None)
+
+    def _finished(self, job: dict, status: str, error) -> None:
+        try:
+            if self.on_finish is not None:
+                self.on_finish(job, status, error)
+        except Exception:
+            # 후처리 실패가 러너 스레드를 죽이면 안 된다.
+            pass
+        with self._done:
+            self._done.notify_all()
@@ -0,0 +1,586 @@
+import argparse
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+from PIL import Image
+
+from benchmark import SIZES, synthetic_image
+
+
+# ---------------------------
+# 종단 간 부하 시험
+# ---------------------------
+# 앱을 원격 MariaDB/실제 SMTP 없이 띄워서 로그인, 사진/동영상 업로드, 작업 기록 보기를 섞어 보내고
+# 경로별 처리량, p50/p95/p99 지연 시간, 오류율을 보고한다.
+#   python loadtest.py --concurrency 16 --duration 60
+#   python loadtest.py --server gunicorn --workers 4 --threads 8 --concurrency 64 --wait-jobs
+#   python loadtest.py --url http://127.0.0.1:5000      이미 떠 있는 서버에 보냄 (앱을 띄우지 않음)
+# 앱은 임시 폴더에서 띄운다.
+#   DB: DB_SQLITE_PATH 로 SQLite 대용품 (db_pool.py)
+#   메일: 이 프로세스 안의 SMTP 싱크(SMTPSink)로 SMTP_AUTH=0 발송, 받은 메일 수만 센다.
+#   업로드/작업 큐/결과 캐시/지표: 모두 임시 폴더 아래
+# 가상 사용자마다 계정 하나와 쿠키 세션 하나를 쓰고, 작업 비율(--mix)에 따라 요청을 고른다.
+# 업로드는 매번 바이트를 조금 바꿔서 결과 캐시(result_cache.py)에 걸리지 않게 한다 (--repeat-ratio 로 조절).
+# --wait-jobs 면 업로드 뒤 /jobs/<id> 를 폴링해서 업로드부터 결과가 나올 때까지의 시간도 잰다.
+
+# 기본 작업 비율이다. 작업 기록 보기가 가장 많고, 동영상은 무거우므로 적게 섞는다.
+DEFAULT_MIX = "history=50,image=25,login=10,video=5,forgot=5,jobs=5"
+
+# 작업 이름 → 보고서에 쓰는 경로 이름
+ROUTES = {
+    "login": "POST /login",
+    "image": "POST /image",
+    "video": "POST /video",
+    "history": "GET /history",
+    "forgot": "POST /forgot-password",
+    "jobs": "GET /jobs/<id>",
+}
+
+PASSWORD = "loadtest-password"
+
+# 앱이 뜨기를 기다리는 최대 시간(초)이다.
+BOOT_TIMEOUT = 60.0
+
+# --wait-jobs 에서 작업 상태를 다시 묻는 간격(초)이다.
+POLL_INTERVAL = 0.5
+
+PERCENTILES = (50, 95, 99)
+
+# 업로드부터 결과가 나올 때까지의 시간을 모으는 행 이름 앞부분이다 (--wait-jobs).
+JOB_ROUTE_PREFIX = "job "
+
+_JOB_URL = re.compile(r"/jobs/(\d+)")
+
+
+class SMTPSink:
+    """
+    받은 메일을 버리고 개수만 세는 로컬 SMTP 서버이다. STARTTLS/AUTH 는 지원하지 않는다 (SMTP_AUTH=0 용).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str) -> None:
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                self.reply("220 loadtest SMTP sink")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line[:4].upper()
+                    if command in (b"EHLO", b"HELO"):
+                        self.reply("250 loadtest")
+                    elif command == b"DATA":
+                        self.reply("354 end with <CRLF>.<CRLF>")
+                        while True:
+                            data = self.rfile.readline()
+                            if not data or data.rstrip(b"\r\n") == b".":
+                                break
+                        with sink._lock:
+                            sink.delivered += 1
+                        self.reply("250 OK")
+                    elif command == b"QUIT":
+                        self.reply("221 bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.host, self.port = self._server.server_address[:2]
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """
+    workdir 아래 임시 DB/업로드 폴더로 앱을 자식 프로세스로 띄운다.
+    server 는 flask(개발 서버, 스레드) 또는 gunicorn 이다.
+    """
+
+    def __init__(self, workdir: str, smtp: SMTPSink, server: str = "flask", workers: int = 2, threads: int = 8,
+                 env: dict = None):
+        self.workdir = workdir
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, "server.log")
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+
+        self.env = dict(os.environ)
+        self.env.update(
+            {
+                "DB_SQLITE_PATH": os.path.join(workdir, "db.sqlite"),
+                "JOB_QUEUE_PATH": os.path.join(workdir, "jobs.db"),
+                "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+                "RESULT_CACHE_DIR": os.path.join(workdir, "cache"),
+                "METRICS_DIR": os.path.join(workdir, "metrics"),
+                "FACE_INDEX_PATH": os.path.join(workdir, "face_index.npz"),
+                "SMTP_HOST": smtp.host,
+                "SMTP_PORT": str(smtp.port),
+                "SMTP_AUTH": "0",
+                "SMTP_SENDER": "noreply@loadtest.invalid",
+                "MAIL_RETRY_DELAY": "1",
+                "BASE_URL": self.url,
+            }
+        )
+        self.env.update(env or {})
+
+        if server == "gunicorn":
+            gunicorn = shutil.which("gunicorn")
+            if gunicorn is None:
+                raise RuntimeError("gunicorn 이 설치되어 있지 않다 (--server flask 를 쓰거나 pip install gunicorn).")
+            # 앱이 모자이크 풀 크기를 코어 수 / 웹 프로세스 수로 잡도록 워커 수를 알려 준다.
+            self.env["WEB_CONCURRENCY"] = str(workers)
+            self.command = [gunicorn, "-w", str(workers), "--threads", str(threads),
+                            "-b", f"127.0.0.1:{self.port}", "app:app"]
+        else:
+            self.command = [sys.executable, "-c",
+                            "import sys; from app import app; "
+                            "app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)",
+                            str(self.port)]
+        self.cwd = base_dir
+        self.process = None
+
+    def start(self, timeout: float = BOOT_TIMEOUT) -> None:
+        log = open(self.log_path, "wb")
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"앱이 시작하자마자 끝남 (code={self.process.returncode})\n{self.log_tail()}")
+            try:
+                if requests.get(f"{self.url}/login", timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"앱이 {timeout:.0f} 초 안에 뜨지 않음\n{self.log_tail()}")
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def log_tail(self, lines: int = 30) -> str:
+        try:
+            with open(self.log_path, encoding="utf-8", errors="replace") as f:
+                return "".join(f.readlines()[-lines:])
+        except OSError:
+            return ""
+
+
+# ---------------------------
+# 업로드용 합성 미디어
+# ---------------------------
+def make_image(size: str, seed: int = 0) -> bytes:
+    """SIZES 크기의 합성 JPEG 이다."""
+    width, height = SIZES[size]
+    buf = io.BytesIO()
+    Image.fromarray(synthetic_image(width, height, seed), "RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def make_video(size: str, seconds: float, fps: int, workdir: str) -> bytes:
+    """SIZES 크기의 합성 MP4 이다. 그라디언트를 프레임마다 옆으로 밀어서 움직임을 만든다."""
+    import cv2
+
+    width, height = SIZES[size]
+    path = os.path.join(workdir, "sample.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV 로 MP4(mp4v)를 만들 수 없다.")
+    frame = synthetic_image(width, height)
+    try:
+        for i in range(max(1, int(seconds * fps))):
+            writer.write(np.roll(frame, i * 8, axis=1))
+    finally:
+        writer.release()
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def vary(data: bytes, kind: str, n: int) -> bytes:
+    """
+    내용 해시만 바뀌도록 끝에 n 을 붙인다. JPEG 은 EOI 뒤의 바이트를 무시하고,
+    MP4 는 끝에 붙인 free 박스를 건너뛴다.
+    """
+    tag = struct.pack(">Q", n)
+    if kind == "video":
+        return data + struct.pack(">I4s", 8 + len(tag), b"free") + tag
+    return data + tag
+
+
+# ---------------------------
+# 결과 집계
+# ---------------------------
+def percentile(sorted_values: list, p: float) -> float:
+    """가장 가까운 순위(nearest-rank) 백분위수이다."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Stats:
+    """경로별 지연 시간과 오류를 모은다. 여러 가상 사용자 스레드에서 부른다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._errors = {}
+        self.first = None
+        self.last = None
+
+    def record(self, route: str, started: float, ok: bool, reason: str = "") -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self._latencies.setdefault(route, []).append(now - started)
+            errors = self._errors.setdefault(route, Counter())
+            if not ok:
+                errors[reason or "error"] += 1
+            self.first = started if self.first is None else min(self.first, started)
+            self.last = now if self.last is None else max(self.last, now)
+
+    def report(self) -> dict:
+        with self._lock:
+            elapsed = (self.last - self.first) if self.first is not None else 0.0
+            routes = {}
+            for route in sorted(self._latencies):
+                values = sorted(self._latencies[route])
+                errors = self._errors[route]
+                failed = sum(errors.values())
+                row = {
+                    "requests": len(values),
+                    "errors": failed,
+                    "error_rate": failed / len(values),
+                    "throughput": len(values) / elapsed if elapsed else 0.0,
+                    "mean_ms": sum(values) / len(values) * 1000,
+                    "max_ms": values[-1] * 1000,
+                    "error_reasons": dict(errors.most_common(5)),
+                }
+                for p in PERCENTILES:
+                    row[f"p{p}_ms"] = percentile(values, p) * 1000
+                routes[route] = row
+            # 작업 완료 행(job ...)은 HTTP 요청이 아니므로 합계에 넣지 않는다.
+            http = [r for route, r in routes.items() if not route.startswith(JOB_ROUTE_PREFIX)]
+            total = sum(r["requests"] for r in http)
+            failed = sum(r["errors"] for r in http)
+            return {
+                "elapsed_seconds": elapsed,
+                "requests": total,
+                "errors": failed,
+                "error_rate": failed / total if total else 0.0,
+                "throughput": total / elapsed if elapsed else 0.0,
+                "routes": routes,
+            }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{'route':<24} {'reqs':>6} {'err%':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, row in report["routes"].items():
+        print(
+            f"{route:<24} {row['requests']:>6} {row['error_rate'] * 100:>6.1f} {row['throughput']:>8.2f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}"
+        )
+    print(
+        f"{'total':<24} {report['requests']:>6} {report['error_rate'] * 100:>6.1f} {report['throughput']:>8.2f}"
+        f"   ({report['elapsed_seconds']:.1f} 초)"
+    )
+    for route, row in report["routes"].items():
+        if row["error_reasons"]:
+            reasons = ", ".join(f"{k} x{v}" for k, v in row["error_reasons"].items())
+            print(f"  {route} 오류: {reasons}")
+
+
+# ---------------------------
+# 가상 사용자
+# ---------------------------
+class Media:
+    """업로드할 바이트이다. 매번 조금씩 바꿔서(vary) 결과 캐시에 걸리지 않게 한다."""
+
+    def __init__(self, image: bytes, video: bytes, repeat_ratio: float):
+        self.samples = {"image": image, "video": video}
+        self.repeat_ratio = repeat_ratio
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next(self, kind: str, rng: random.Random) -> bytes:
+        data = self.samples[kind]
+        if rng.random() < self.repeat_ratio:
+            return data
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        return vary(data, kind, n)
+
+
+class VirtualUser(threading.Thread):
+    """
+    계정 하나로 로그인한 채 deadline 까지 mix 비율로 요청을 보낸다.
+    """
+
+    def __init__(self, index: int, url: str, email: str, mix: dict, media: Media, stats: Stats, deadline: float,
+                 options: argparse.Namespace):
+        super().__init__(name=f"vu-{index}", daemon=True)
+        self.url = url
+        self.email = email
+        self.actions = list(mix)
+        self.weights = [mix[a] for a in self.actions]
+        self.media = media
+        self.stats = stats
+        self.deadline = deadline
+        self.options = options
+        self.rng = random.Random(options.seed * 1000 + index)
+        self.http = requests.Session()
+        self.job_ids = []
+
+    def _request(self, route: str, method: str, path: str, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = self.http.request(method, self.url + path, allow_redirects=False,
+                                     timeout=(5, self.options.timeout), **kwargs)
+        except requests.RequestException as e:
+            self.stats.record(route, started, False, type(e).__name__)
+            return None
+        ok = resp.status_code in expect
+        self.stats.record(route, started, ok, "" if ok else f"HTTP {resp.status_code}")
+        return resp if ok else None
+
+    def login(self, record: bool = True) -> bool:
+        started = time.perf_counter()
+        try:
+            resp = self.http.post(f"{self.url}/login", data={"email": self.email, "password": PASSWORD},
+                                  allow_redirects=False, timeout=(5, self.options.timeout))
+        except requests.RequestException as e:
+            if record:
+                self.stats.record(ROUTES["login"], started, False, type(e).__name__)
+            return False
+        ok = resp.status_code == 302 and resp.headers.get("Location", "").endswith("/history")
+        if record:
+            self.stats.record(ROUTES["login"], started, ok, "" if ok else f"HTTP {resp.status_code}")
+        return ok
+
+    def upload(self, kind: str) -> None:
+        started = time.perf_counter()
+        data = self.media.next(kind, self.rng)
+        name = "loadtest.jpg" if kind == "image" else "loadtest.mp4"
+        form = {"blur_strength": str(self.options.blur_strength)}
+        if self.options.face_only:
+            form["face_only"] = "1"
+        resp = self._request(ROUTES[kind], "POST", f"/{kind}", expect=(200, 202),
+                             files={"file": (name, data)}, data=form)
+        if resp is None:
+            return
+        match = _JOB_URL.search(resp.text)
+        if match is None:
+            return
+        job_id = int(match.group(1))
+        self.job_ids = (self.job_ids + [job_id])[-20:]
+        if self.options.wait_jobs:
+            self.wait_job(kind, job_id, started)
+
+    def wait_job(self, kind: str, job_id: int, started: float) -> None:
+        # 결과가 나올 때까지의 시간은 "job image" / "job video" 행으로 따로 집계한다.
+        route = f"{JOB_ROUTE_PREFIX}{kind}"
+        limit = time.perf_counter() + self.options.job_timeout
+        while time.perf_counter() < limit:
+            resp = self._request(ROUTES["jobs"], "GET", f"/jobs/{job_id}")
+            status = resp.json().get("status") if resp is not None else None
+            if status == "success":
+                self.stats.record(route, started, True)
+                return
+            if status == "failed":
+                self.stats.record(route, started, False, "failed")
+                return
+            time.sleep(POLL_INTERVAL)
+        self.stats.record(route, started, False, "timeout")
+
+    def run(self) -> None:
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(self.actions, self.weights)[0]
+            if action == "login":
+                self.login()
+            elif action in ("image", "video"):
+                self.upload(action)
+            elif action == "history":
+                self._request(ROUTES["history"], "GET", "/history")
+            elif action == "forgot":
+                self._request(ROUTES["forgot"], "POST", "/forgot-password", data={"email": self.email})
+            elif action == "jobs" and self.job_ids:
+                self._request(ROUTES["jobs"], "GET", f"/jobs/{self.rng.choice(self.job_ids)}")
+            if self.options.think_time:
+                time.sleep(self.rng.expovariate(1.0 / self.options.think_time))
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"알 수 없는 작업: {name} (가능: {', '.join(ROUTES)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"비율이 숫자가 아님: {item}")
+    mix = {k: v for k, v in mix.items() if v > 0}
+    if not mix:
+        raise argparse.ArgumentTypeError("작업 비율이 비어 있음")
+    return mix
+
+
+def create_users(url: str, count: int, prefix: str) -> list:
+    """
+    가상 사용자 계정을 만든다 (이미 있으면 그대로 씀). bcrypt 비용 때문에 느리므로 측정에는 넣지 않는다.
+    """
+    emails = [f"{prefix}{i}@loadtest.invalid" for i in range(count)]
+    for email in emails:
+        resp = requests.post(f"{url}/signup", data={"email": email, "password": PASSWORD},
+                             allow_redirects=False, timeout=60)
+        if resp.status_code not in (302, 409):
+            raise RuntimeError(f"계정 생성 실패 ({email}): HTTP {resp.status_code}")
+    return emails
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="로그인/업로드/작업 기록 혼합 부하 시험")
+    parser.add_argument("--url", help="이미 떠 있는 서버 주소. 없으면 임시 폴더에서 앱을 띄운다")
+    parser.add_argument("--server", choices=("flask", "gunicorn"), default="flask")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn 워커 수")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn 워커당 스레드 수")
+    parser.add_argument("--concurrency", type=int, default=8, help="동시 가상 사용자 수")
+    parser.add_argument("--duration", type=float, default=30.0, help="요청을 보내는 시간(초)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"작업=비율 목록 (기본 {DEFAULT_MIX})")
+    parser.add_argument("--think-time", type=float, default=0.0, help="요청 사이 평균 대기 시간(초, 지수 분포)")
+    parser.add_argument("--image-size", choices=list(SIZES), default="fhd")
+    parser.add_argument("--video-size", choices=list(SIZES), default="vga")
+    parser.add_argument("--video-seconds", type=float, default=2.0)
+    parser.add_argument("--video-fps", type=int, default=15)
+    parser.add_argument("--blur-strength", type=int, default=50)
+    parser.add_argument("--face-only", action="store_true", help="얼굴만 모자이크 (탐지 모델 필요)")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="같은 바이트를 다시 올리는 비율 (결과 캐시 적중 비율)")
+    parser.add_argument("--wait-jobs", action="store_true", help="업로드 뒤 작업이 끝날 때까지 기다림")
+    parser.add_argument("--job-timeout", type=float, default=300.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="요청 하나의 응답 대기 시간(초)")
+    parser.add_argument("--bcrypt-rounds", type=int, help="앱의 BCRYPT_LOG_ROUNDS (기본은 앱 설정)")
+    parser.add_argument("--mosaic-backend", help="앱의 MOSAIC_BACKEND (기본은 앱 설정)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    parser.add_argument("--keep", action="store_true", help="임시 폴더(DB, 업로드, 서버 로그)를 지우지 않음")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="mozik_load_")
+    smtp = None
+    server = None
+    try:
+        url = args.url
+        if url is None:
+            smtp = SMTPSink()
+            smtp.start()
+            app_env = {}
+            if args.bcrypt_rounds:
+                app_env["BCRYPT_LOG_ROUNDS"] = str(args.bcrypt_rounds)
+            if args.mosaic_backend:
+                app_env["MOSAIC_BACKEND"] = args.mosaic_backend
+            server = AppServer(workdir, smtp, args.server, args.workers, args.threads, app_env)
+            print(f"앱 시작: {server.url} ({args.server}, 작업 폴더 {workdir})")
+            server.start()
+        url = url.rstrip("/") if args.url else server.url
+
+        print("업로드용 합성 미디어 준비")
+        image = make_image(args.image_size, args.seed) if "image" in args.mix else b""
+        video = (make_video(args.video_size, args.video_seconds, args.video_fps, workdir)
+                 if "video" in args.mix else b"")
+        media = Media(image, video, args.repeat_ratio)
+
+        print(f"가상 사용자 {args.concurrency} 명 계정 준비/로그인")
+        prefix = f"vu{args.seed}-"
+        emails = create_users(url, args.concurrency, prefix)
+        stats = Stats()
+        users = [VirtualUser(i, url, email, args.mix, media, stats, 0.0, args) for i, email in enumerate(emails)]
+        for user in users:
+            if not user.login(record=False):
+                raise RuntimeError(f"로그인 실패: {user.email}")
+
+        print(f"{args.duration:.0f} 초 동안 부하 (mix {args.mix})")
+        deadline = time.monotonic() + args.duration
+        for user in users:
+            user.deadline = deadline
+            user.start()
+        for user in users:
+            user.join()
+
+        report = stats.report()
+        report["config"] = {
+            key: value for key, value in vars(args).items() if key not in ("json", "keep")
+        }
+        print_report(report)
+        if smtp is not None:
+            report["mail_delivered"] = smtp.delivered
+            print(f"SMTP 싱크가 받은 메일: {smtp.delivered}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        return 0
+    except RuntimeError as e:
+        print(f"실패: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if server is not None:
+            server.stop()
+        if smtp is not None:
+            smtp.stop()
+        if args.keep:
+            print(f"작업 폴더를 남김: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+import smtplib
+import sqlite3
+import threading
+import time
+from email.message import EmailMessage
+
+
+# ---------------------------
+# 메일 발송함 (outbox)
+# ---------------------------
+# 예전에는 /forgot-password 요청 안에서 SMTP 접속 → STARTTLS → 로그인 → 발송을 해서
+# SMTP 서버가 느리면 요청이 몇 초씩 걸렸다. 이제 요청은 발송함(SQLite)에 메일을 넣고 바로 응답하고,
+# OutboxWorker 스레드가 한 번 로그인한 SMTP 연결을 재사용하며 보낸다.
+#   - 일시적 실패(접속 끊김, 4xx)는 base_delay * 2^(시도-1) 뒤에 다시 보내고 (max_delay 까지),
+#     max_attempts 를 넘기거나 5xx 로 거절되면 dead 로 남긴다.
+#   - 보낸 메일은 바로 지운다 (본문에 재설정 토큰이 들어 있으므로 남기지 않는다).
+#     dead 가 된 메일도 본문을 바로 비우고, 원인 확인용으로 남긴 행은 DEAD_TTL 뒤에 정리 작업(purge)이 지운다.
+#   - 여러 gunicorn 워커가 같은 파일을 보더라도 claim 이 한 문장 UPDATE ... RETURNING 이라 두 번 보내지 않는다.
+# 로컬에서는 SMTP_AUTH=0 으로 두고 디버그 SMTP 서버(python -m aiosmtpd -n -l localhost:1025 등)에 보내 볼 수 있다.
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_DEAD = "dead"
+
+# dead 메일 행(수신자, 제목, 마지막 오류)을 지우기까지의 시간(초)이다.
+DEAD_TTL = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_addr TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (status, next_attempt_at);
+"""
+
+
+class EmailOutbox:
+    """
+    SQLite 기반 메일 발송함이다. 어느 스레드/프로세스에서 불러도 된다.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 8,
+        base_delay: float = 30.0,
+        max_delay: float = 3600.0,
+        lease_seconds: float = 120.0,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enqueue(self, to_addr: str, subject: str, body: str) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO mail_outbox (to_addr, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (to_addr, subject, body, now, now),
+            )
+            return cur.lastrowid
+
+    def claim(self) -> dict:
+        """
+        보낼 때가 된 메일 하나를 sending 으로 바꾸고 돌려준다. 없으면 None 이다.
+        lease 가 지난 sending 메일(보내던 워커가 죽은 경우)도 다시 가져온다.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE mail_outbox SET status = ?, attempts = attempts + 1, lease_until = ? "
+                "WHERE id = (SELECT id FROM mail_outbox "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until < ?) "
+                "ORDER BY id LIMIT 1) "
+                "RETURNING *",
+                (STATUS_SENDING, now + self.lease_seconds, STATUS_PENDING, now, STATUS_SENDING, now),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def mark_sent(self, mail_id: int) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM mail_outbox WHERE id = ?", (mail_id,))
+
+    def mark_failed(self, mail: dict, error: str, permanent: bool = False) -> str:
+        """
+        실패를 기록한다. 다시 보낼 수 있으면 pending(백오프), 아니면 dead 로 두고 그 상태를 돌려준다.
+        """
+        if permanent or mail["attempts"] >= self.max_attempts:
+            status, next_at = STATUS_DEAD, time.time()
+        else:
+            delay = min(self.max_delay, self.base_delay * (2 ** (mail["attempts"] - 1)))
+            status, next_at = STATUS_PENDING, time.time() + delay
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE mail_outbox SET status = ?, next_attempt_at = ?, lease_until = NULL, last_error = ?, "
+                # 다시 보내지 않을 메일의 본문(재설정 링크)은 남길 이유가 없다.
+                "body = CASE WHEN ? = ? THEN '' ELSE body END WHERE id = ?",
+                (status, next_at, error[:500], status, STATUS_DEAD, mail["id"]),
+            )
+        return status
+
+    def purge(self, ttl: float = DEAD_TTL) -> int:
+        """dead 가 된 지 ttl 초가 지난 메일 행을 지우고 지운 개수를 돌려준다."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM mail_outbox WHERE status = ? AND next_attempt_at < ?",
+                (STATUS_DEAD, time.time() - ttl),
+            )
+            return cur.rowcount
+
+    def next_due(self):
+        """가장 이른 다음 발송 시각(time.time 기준)이다. 보낼 메일이 없으면 None 이다."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM mail_outbox WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM mail_outbox GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+class SMTPSender:
+    """
+    SMTP 연결 하나를 열어 두고 여러 메일에 재사용한다. 한 스레드(OutboxWorker)에서만 쓴다.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str = "",
+        password: str = "",
+        sender: str = "",
+        use_auth: bool = True,
+        timeout: float = 30.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender or user
+        self.use_auth = use_auth
+        self.timeout = timeout
+        self._smtp = None
+
+    def _open(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_auth:
+                smtp.starttls()
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def send(self, to_addr: str, subject: str, body: str) -> None:
+        message = EmailMessage()
+        message["Subject"] = subject
+        message["From"] = self.sender
+        message["To"] = to_addr
+        message.set_content(body)
+
+        if self._smtp is None:
+            self._smtp = self._open()
+            self._smtp.send_message(message)
+            return
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # 서버가 놀던 연결을 끊었으면 한 번만 다시 접속해서 보낸다.
+            self.close()
+            self._smtp = self._open()
+            self._smtp.send_message(message)
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+    @property
+    def connected(self) -> bool:
+        return self._smtp is not None
+
+
+def is_permanent(error: Exception) -> bool:
+    """다시 보내도 소용없는 실패(5xx 응답, 수신자 거절)인지 판단한다."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500 and not isinstance(error, smtplib.SMTPAuthenticationError)
+    return False
+
+
+class OutboxWorker:
+    """
+    발송함을 비우는 백그라운드 스레드이다. 보낼 메일이 없으면 idle_timeout 뒤에 SMTP 연결을 닫는다.
+    """
+
+    def __init__(self, outbox: EmailOutbox, sender: SMTPSender, logger=None, poll_interval: float = 30.0, idle_timeout: float = 60.0):
+        self.outbox = outbox
+        self.sender = sender
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._wakeup = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._loop, name="mail-outbox", daemon=True).start()
+            self._started = True
+
+    def notify(self) -> None:
+        """새 메일이 들어왔음을 알려서 폴링 간격을 기다리지 않고 바로 보내게 한다."""
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        last_sent = 0.0
+        while True:
+            try:
+                mail = self.outbox.claim()
+            except sqlite3.Error:
+                mail = None
+
+            if mail is not None:
+                try:
+                    self.send_one(mail)
+                except Exception as e:
+                    # 발송함 기록(mark_sent/mark_failed)이 실패해도 스레드는 살아 있어야 한다.
+                    # 메일은 sending 으로 남아 lease 가 지나면 다시 claim 된다.
+                    if self.logger is not None:
+                        self.logger.error("메일 발송 처리 실패 (id=%s): %s", mail["id"], e)
+                last_sent = time.monotonic()
+                continue
+
+            if self.sender.connected and time.monotonic() - last_sent >= self.idle_timeout:
+                self.sender.close()
+            self._wakeup.wait(self._wait_seconds(last_sent))
+            self._wakeup.clear()
+
+    def _wait_seconds(self, last_sent: float) -> float:
+        wait = self.poll_interval
+        try:
+            due = self.outbox.next_due()
+        except sqlite3.Error:
+            due = None
+        if due is not None:
+            wait = min(wait, max(0.1, due - time.time()))
+        if self.sender.connected:
+            wait = min(wait, max(0.1, self.idle_timeout - (time.monotonic() - last_sent)))
+        return wait
+
+    def send_one(self, mail: dict) -> bool:
+        try:
+            self.sender.send(mail["to_addr"], mail["subject"], mail["body"])
+        except Exception as e:
+            permanent = is_permanent(e)
+            if not permanent:
+                # 연결 상태를 알 수 없으므로 다음 시도는 새로 접속한다.
+                self.sender.close()
+            status = self.outbox.mark_failed(mail, f"{type(e).__name__}: {e}", permanent=permanent)
+            if self.logger is not None:
+                self.logger.warning(
+                    "메일 발송 실패 (id=%s, 시도 %s, %s): %s", mail["id"], mail["attempts"], status, e
+                )
+            return False
+        self.outbox.mark_sent(mail["id"])
+        return True
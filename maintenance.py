@@ -0,0 +1,331 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from thumbnails import THUMB_SUFFIX
+
+
+# ---------------------------
+# 정기 정리 작업
+# ---------------------------
+# 요청 처리와 상관없이 쌓이기만 하던 것들을 백그라운드에서 정리한다.
+#   - purge_reset_tokens: 만료됐거나 사용한 password_resets 행을 지운다.
+#   - gc_uploads: job_history / users.face_image 어디에도 걸려 있지 않은 업로드 파일을 지운다
+#     (실패한 작업의 입력, 바뀌기 전 얼굴 사진 등).
+#   - enforce_quotas: 사용자별 결과 파일 합계가 quota 를 넘으면 오래된 작업부터 expired 로 바꾸고 파일을 지운다.
+# 테이블을 오래 잠그지 않도록 모든 조회/삭제는 PK 키셋으로 batch 개씩 나눠서 하고 batch 마다 커밋한다.
+# 여러 gunicorn 워커가 같은 스케줄러를 띄워도 작업마다 로컬 SQLite 의 lease 를 잡은 프로세스 하나만 실행한다.
+
+BATCH = 1000
+
+# 이 시간(초)보다 최근에 바뀐 파일은 참조가 없어도 지우지 않는다.
+# 업로드 직후 job_history INSERT 전이거나 작업이 아직 결과를 쓰는 중일 수 있기 때문이다.
+GC_GRACE_SECONDS = 6 * 3600
+
+# 앱이 만든 파일 이름만 정리 대상으로 본다. 그 밖의 파일(예시 이미지 등)은 건드리지 않는다.
+#   <uuid16>_<이름>                업로드 원본
+#   mosaic_<...>                    결과 (예전 버전 이름 포함)
+#   face_<user_id>_<...>            얼굴 사진 (예전 버전의 face_<id>_<timestamp>_... 포함)
+#   <결과 이름>.thumb.webp          결과 썸네일
+MANAGED_NAME = re.compile(r"^(?:[0-9a-f]{16}_|mosaic_|face_\d+_)")
+
+# job_history 의 이 상태인 행은 파일을 붙잡지 않는다.
+RELEASED_STATUSES = ("failed", "expired")
+STATUS_EXPIRED = "expired"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maintenance_tasks (
+    name TEXT PRIMARY KEY,
+    next_run_at REAL NOT NULL,
+    lease_until REAL,
+    last_result TEXT,
+    last_run_at REAL
+);
+"""
+
+
+def _placeholders(values) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def _iter_rows(conn, table: str, columns: str, batch: int = BATCH, where: str = "", params=()):
+    """table 을 id 키셋으로 batch 행씩 읽는다. 한 번에 긴 스캔/잠금을 잡지 않는다."""
+    last_id = 0
+    where_sql = f" AND ({where})" if where else ""
+    while True:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"SELECT id, {columns} FROM {table} WHERE id > %s{where_sql} ORDER BY id LIMIT %s",
+                (last_id, *params, batch),
+            )
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+        # 읽기 트랜잭션을 batch 마다 끝내서 스냅샷을 오래 잡지 않는다.
+        conn.commit()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+        if len(rows) < batch:
+            return
+
+
+def _delete_ids(conn, table: str, ids: list) -> int:
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DELETE FROM {table} WHERE id IN ({_placeholders(ids)})", tuple(ids))
+        deleted = cur.rowcount
+    finally:
+        cur.close()
+    conn.commit()
+    return deleted
+
+
+def purge_reset_tokens(conn, now: datetime = None, batch: int = BATCH) -> int:
+    """
+    만료됐거나 사용한 재설정 토큰을 batch 개씩 지우고 지운 행 수를 돌려준다.
+    expires_at 은 forgot_password 에서 UTC 로 저장하므로 UTC 로 비교한다.
+    "만료 OR 사용" 을 한 조건으로 걸면 인덱스를 못 타므로 조건마다 따로 지운다
+    (expires_at 인덱스 / (used, expires_at) 인덱스, schema.py 참고).
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    total = 0
+    for where, params in (("expires_at < %s", (now,)), ("used = 1", ())):
+        while True:
+            cur = conn.cursor()
+            try:
+                cur.execute(f"SELECT id FROM password_resets WHERE {where} LIMIT %s", params + (batch,))
+                ids = [row[0] for row in cur.fetchall()]
+            finally:
+                cur.close()
+            if not ids:
+                conn.commit()
+                break
+            total += _delete_ids(conn, "password_resets", ids)
+            if len(ids) < batch:
+                break
+    return total
+
+
+def _input_stem(output_filename: str) -> str:
+    # 결과 이름은 "mosaic_" + 업로드 원본 이름이다 (사진은 확장자가 바뀔 수 있어 확장자를 뺀 이름으로 맞춘다).
+    name = output_filename[len("mosaic_"):] if output_filename.startswith("mosaic_") else output_filename
+    return os.path.splitext(name)[0]
+
+
+def referenced_files(conn, batch: int = BATCH) -> set:
+    """
+    DB 가 참조하는 업로드 파일 이름(결과, 썸네일, 원본 이름 stem, 얼굴 사진) 집합이다.
+    원본은 확장자를 모르므로 stem 으로 넣는다.
+    """
+    names = set()
+    released = _placeholders(RELEASED_STATUSES)
+    for _, output_filename in _iter_rows(
+        conn,
+        "job_history",
+        "output_filename",
+        batch,
+        where=f"status IS NULL OR status NOT IN ({released})",
+        params=RELEASED_STATUSES,
+    ):
+        if output_filename:
+            names.add(output_filename)
+            names.add(os.path.splitext(output_filename)[0] + THUMB_SUFFIX)
+            names.add(_input_stem(output_filename))
+    for _, face_image in _iter_rows(conn, "users", "face_image", batch, where="face_image IS NOT NULL"):
+        if face_image:
+            names.add(face_image)
+    return names
+
+
+def _delete_key(storage, key: str, on_delete) -> None:
+    for path in storage.delete(key):
+        if on_delete is not None:
+            on_delete(path)
+
+
+def gc_uploads(conn, storage, grace: float = GC_GRACE_SECONDS, batch: int = BATCH, on_delete=None) -> dict:
+    """
+    저장소(storage.py)에서 앱이 만든 파일 중 DB 가 참조하지 않고 grace 초 이상 지난 파일을 지운다.
+    on_delete(path) 는 지운 로컬 파일마다 불린다 (ETag 캐시 정리 등).
+    """
+    # 참조 목록보다 파일 목록을 먼저 만든다. 그 사이에 생긴 파일은 grace 로 보호된다.
+    cutoff = time.time() - grace
+    candidates = [
+        (key, size)
+        for key, size, mtime in storage.list_files()
+        if MANAGED_NAME.match(key) and mtime < cutoff
+    ]
+    if not candidates:
+        return {"files": 0, "bytes": 0}
+
+    referenced = referenced_files(conn, batch)
+    removed = freed = 0
+    for key, size in candidates:
+        if key in referenced or os.path.splitext(key)[0] in referenced:
+            continue
+        _delete_key(storage, key, on_delete)
+        removed += 1
+        freed += size
+    return {"files": removed, "bytes": freed}
+
+
+def _job_files(output_filename: str, inputs_by_stem: dict) -> list:
+    keys = [output_filename, os.path.splitext(output_filename)[0] + THUMB_SUFFIX]
+    keys.extend(inputs_by_stem.get(_input_stem(output_filename), ()))
+    return keys
+
+
+def enforce_quotas(conn, storage, quota_bytes: int, batch: int = BATCH, on_delete=None) -> dict:
+    """
+    사용자별로 작업 파일(원본 + 결과 + 썸네일) 합계가 quota_bytes 를 넘으면
+    오래된 작업부터 expired 로 바꾸고 파일을 지운다. 작업 기록 행 자체는 남긴다.
+    """
+    if not quota_bytes or quota_bytes <= 0:
+        return {"jobs": 0, "bytes": 0}
+
+    sizes = {}
+    inputs_by_stem = {}
+    for key, size, _ in storage.list_files():
+        if not MANAGED_NAME.match(key):
+            continue
+        sizes[key] = size
+        if not key.startswith("mosaic_"):
+            inputs_by_stem.setdefault(os.path.splitext(key)[0], []).append(key)
+
+    # id 가 클수록 최근 작업이므로 사용자별 목록은 오래된 순서로 쌓인다.
+    jobs_by_user = {}
+    released = _placeholders(RELEASED_STATUSES)
+    for job_id, user_id, output_filename in _iter_rows(
+        conn,
+        "job_history",
+        "user_id, output_filename",
+        batch,
+        where=f"output_filename IS NOT NULL AND (status IS NULL OR status NOT IN ({released}))",
+        params=RELEASED_STATUSES,
+    ):
+        keys = _job_files(output_filename, inputs_by_stem)
+        jobs_by_user.setdefault(user_id, []).append((job_id, keys, sum(sizes.get(k, 0) for k in keys)))
+
+    expired_ids = []
+    freed = 0
+    for jobs in jobs_by_user.values():
+        usage = sum(size for _, _, size in jobs)
+        for job_id, keys, size in jobs:
+            if usage <= quota_bytes:
+                break
+            expired_ids.append(job_id)
+            usage -= size
+            freed += size
+
+    for i in range(0, len(expired_ids), batch):
+        ids = expired_ids[i:i + batch]
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"UPDATE job_history SET status = %s WHERE id IN ({_placeholders(ids)})",
+                (STATUS_EXPIRED, *ids),
+            )
+        finally:
+            cur.close()
+        conn.commit()
+
+    # DB 를 먼저 바꾸고 파일을 지운다 (반대 순서면 기록은 success 인데 파일이 없는 순간이 생긴다).
+    expired = set(expired_ids)
+    for jobs in jobs_by_user.values():
+        for job_id, keys, _ in jobs:
+            if job_id not in expired:
+                continue
+            for key in keys:
+                _delete_key(storage, key, on_delete)
+    return {"jobs": len(expired_ids), "bytes": freed}
+
+
+class MaintenanceScheduler:
+    """
+    이름별 작업을 interval 초마다 실행하는 백그라운드 스레드이다.
+    실행 시각과 lease 는 로컬 SQLite 에 저장해서 여러 프로세스 중 하나만 실행하게 한다.
+    """
+
+    def __init__(self, db_path: str, logger=None, poll_interval: float = 60.0, lease_seconds: float = 3600.0):
+        self.db_path = db_path
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.tasks = {}
+        self._started = False
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add(self, name: str, interval: float, func) -> None:
+        """func() 를 interval 초마다 실행한다. 첫 실행은 시작 후 poll_interval 안에 한다."""
+        self.tasks[name] = (interval, func)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO maintenance_tasks (name, next_run_at) VALUES (?, ?)",
+                (name, time.time()),
+            )
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started or not self.tasks:
+                return
+            threading.Thread(target=self._loop, name="maintenance", daemon=True).start()
+            self._started = True
+
+    def _claim(self, name: str, interval: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE maintenance_tasks SET lease_until = ?, next_run_at = ? "
+                "WHERE name = ? AND next_run_at <= ? AND (lease_until IS NULL OR lease_until < ?) "
+                "RETURNING name",
+                (now + self.lease_seconds, now + interval, name, now, now),
+            ).fetchone()
+        return row is not None
+
+    def _release(self, name: str, result) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE maintenance_tasks SET lease_until = NULL, last_result = ?, last_run_at = ? WHERE name = ?",
+                (str(result)[:500], time.time(), name),
+            )
+
+    def run_pending(self) -> dict:
+        """실행할 때가 된 작업을 모두 실행하고 {이름: 결과} 를 돌려준다."""
+        results = {}
+        for name, (interval, func) in self.tasks.items():
+            try:
+                if not self._claim(name, interval):
+                    continue
+            except sqlite3.Error:
+                continue
+            started = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                result = f"실패: {e}"
+                if self.logger is not None:
+                    self.logger.error(f"정리 작업 실패 ({name}): {e}")
+            else:
+                if self.logger is not None:
+                    self.logger.info("정리 작업 완료 (%s, %.1fs): %s", name, time.monotonic() - started, result)
+            self._release(name, result)
+            results[name] = result
+        return results
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            self.run_pending()
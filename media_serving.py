@@ -0,0 +1,268 @@
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import threading
+import uuid
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+
+# ---------------------------
+# 결과 파일 서빙 (ETag / Range / sendfile)
+# ---------------------------
+# - ETag 는 파일 내용의 SHA-256 으로 만든 강한 ETag 이다. 파일마다 한 번만 계산해서
+#   (경로, 크기, mtime) 기준으로 SQLite 에 저장해 두므로 요청마다 파일을 다시 읽지 않는다.
+# - If-None-Match / If-Modified-Since 가 맞으면 본문 없이 304 를 돌려준다.
+# - Range 는 단일 범위(206)와 여러 범위(multipart/byteranges 206)를 지원하고,
+#   요청한 범위만 CHUNK_SIZE 씩 읽어 보내므로 큰 동영상을 탐색해도 메모리는 청크 하나 크기이다.
+# - mode 가 x-sendfile / x-accel 이면 헤더만 만들고 실제 전송은 앞단 프록시(Apache/nginx)에 맡긴다.
+
+CHUNK_SIZE = 256 * 1024
+
+# 한 요청에서 받아 줄 최대 범위 수이다. 넘으면 Range 를 무시하고 전체를 보낸다.
+MAX_RANGES = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_etags (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    etag TEXT NOT NULL
+);
+"""
+
+
+class ETagStore:
+    """
+    파일 내용 해시 기반 ETag 저장소이다. 파일이 바뀌면(크기/mtime) 다시 계산한다.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._memo = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, path: str, st: os.stat_result = None) -> str:
+        st = st or os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            memo = self._memo.get(path)
+        if memo and memo[0] == stamp:
+            return memo[1]
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, etag FROM media_etags WHERE path = ?", (path,)
+            ).fetchone()
+        if row and (row[0], row[1]) == stamp:
+            etag = row[2]
+        else:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            etag = digest.hexdigest()[:32]
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO media_etags (path, size, mtime_ns, etag) VALUES (?, ?, ?, ?)",
+                    (path, st.st_size, st.st_mtime_ns, etag),
+                )
+        with self._lock:
+            self._memo[path] = (stamp, etag)
+        return etag
+
+    def forget(self, path: str) -> None:
+        with self._lock:
+            self._memo.pop(path, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM media_etags WHERE path = ?", (path,))
+
+
+def parse_ranges(header: str, size: int):
+    """
+    "bytes=0-99,200-,-50" 형태의 Range 헤더를 [(start, end_exclusive), ...] 로 바꾼다.
+    - 헤더가 없거나 형식이 틀리면(무시해야 하는 경우) None
+    - 형식은 맞지만 만족할 수 있는 범위가 하나도 없으면 빈 리스트 (416)
+    """
+    if not header:
+        return None
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return None
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition("-")
+        if not dash:
+            return None
+        try:
+            if first == "":
+                # 접미 범위: 마지막 N 바이트
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size
+            else:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if last and end <= start:
+                    # last < first 는 문법 오류이므로 Range 전체를 무시한다.
+                    return None
+                end = min(end, size)
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    return _coalesce(ranges)
+
+
+def _coalesce(ranges: list) -> list:
+    # 겹치거나 맞닿은 범위는 합쳐서 같은 바이트를 여러 번 보내지 않는다.
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    """path 의 [start, end) 구간만 chunk_size 씩 읽어 내보낸다."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _not_modified(etag: str, mtime: int) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [unquote_etag(t.strip())[0] for t in if_none_match.split(",")]
+        return etag in tags
+    since = parse_date(request.headers.get("If-Modified-Since"))
+    return since is not None and int(mtime) <= int(since.timestamp())
+
+
+def _if_range_ok(etag: str, mtime: int) -> bool:
+    # If-Range 가 현재 ETag/날짜와 다르면 파일이 바뀐 것이므로 Range 를 무시하고 전체를 보낸다.
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    if value.strip().startswith(('"', "W/")):
+        tag, weak = unquote_etag(value.strip())
+        return not weak and tag == etag
+    since = parse_date(value)
+    return since is not None and int(mtime) == int(since.timestamp())
+
+
+def serve_media(
+    directory: str,
+    filename: str,
+    etags: ETagStore,
+    mode: str = "",
+    accel_prefix: str = "/protected-uploads/",
+    max_age: int = 0,
+) -> Response:
+    """
+    directory 안의 filename 을 조건부 GET / Range 를 지원하며 돌려준다.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        return Response("파일을 찾을 수 없음이다.", 404)
+
+    st = os.stat(path)
+    etag = etags.get(path, st)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "ETag": quote_etag(etag),
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"private, max-age={max_age}",
+    }
+
+    if _not_modified(etag, st.st_mtime):
+        return Response(status=304, headers=headers)
+
+    if mode == "x-accel":
+        # nginx 가 internal location 에서 파일을 직접 보내고 Range 도 처리한다.
+        headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + filename.lstrip("/")
+        return Response(status=200, headers=headers, mimetype=mimetype)
+    if mode == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    size = st.st_size
+    ranges = None
+    if _if_range_ok(etag, st.st_mtime):
+        ranges = parse_ranges(request.headers.get("Range"), size)
+
+    if ranges is None:
+        # 전체 전송은 WSGI 서버의 file_wrapper(가능하면 sendfile)에 맡긴다.
+        headers["Content-Length"] = str(size)
+        body = wrap_file(request.environ, open(path, "rb"), CHUNK_SIZE)
+        return Response(body, 200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        body = iter_file_range(path, start, end)
+        return Response(body, 206, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    # 여러 범위: 각 범위를 파트 헤더와 함께 multipart/byteranges 로 이어 보낸다.
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        ).encode("ascii")
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode("ascii")
+    length = sum(len(h) for h in part_headers) + sum(end - start for start, end in ranges)
+    length += 2 * (len(ranges) - 1) + len(closing)
+
+    def generate():
+        for i, (start, end) in enumerate(ranges):
+            if i:
+                yield b"\r\n"
+            yield part_headers[i]
+            yield from iter_file_range(path, start, end)
+        yield closing
+
+    headers["Content-Length"] = str(length)
+    return Response(
+        generate(),
+        206,
+        headers=headers,
+        content_type=f"multipart/byteranges; boundary={boundary}",
+        direct_passthrough=True,
+    )
@@ -0,0 +1,369 @@
+import fcntl
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+# ---------------------------
+# Prometheus 형식 지표 (/metrics)
+# ---------------------------
+# gunicorn 워커마다 메모리가 따로라서 한 워커의 값만 내보내면 합계가 틀린다.
+#   - 각 프로세스는 자기 값을 메모리에 누적하고 (관측 한 번 = 락 + dict 갱신 몇 번),
+#     flush_interval 초마다 directory/metrics_<pid>_<토큰>.json 으로 통째로 덮어쓴다 (rename 이라 읽는 쪽이 반쪽을 보지 않음).
+#   - /metrics 를 받은 워커는 자기 값(최신)과 다른 워커 파일을 모두 읽어 더해서 내보낸다.
+#     다른 워커 값은 최대 flush_interval 초 늦을 수 있다.
+#   - 끝난 프로세스의 카운터/히스토그램은 줄어들면 안 되므로 metrics_archive.json 에 합쳐 두고 파일을 지운다.
+#     gauge(대기열 길이 등)는 살아 있는 프로세스 것만 더한다.
+# 모자이크 워커 프로세스(worker_pool)는 지표를 직접 쓰지 않고, 단계별 시간(timings)을 작업 결과에 담아 돌려준다.
+
+# 요청/DB 처럼 짧은 작업용 구간(초)이다. db_pool.LATENCY_BUCKETS 와 같다.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 모자이크 단계(디코드/탐지/인코드 등)용 구간(초)이다. 큰 사진과 동영상은 수십 초까지 걸린다.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+ARCHIVE_FILE = "metrics_archive.json"
+LOCK_FILE = ".metrics.lock"
+
+
+# ---------------------------
+# 단계별 시간 측정 (모자이크 처리 코드에서 씀)
+# ---------------------------
+@contextmanager
+def stage_timer(timings, name: str):
+    """
+    with 블록의 실행 시간(초)을 timings[name] 에 더한다. timings 가 None 이면 아무것도 하지 않는다.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class TimedWriter:
+    """
+    파일 객체를 감싸서 write() 에 걸린 시간을 timings[name] 에 더한다.
+    fileno 를 숨겨서 Pillow 가 파일 디스크립터에 직접 쓰지 않고 write() 를 거치게 한다
+    (그래야 인코딩 시간과 디스크에 쓰는 시간을 나눠 잴 수 있다).
+    """
+
+    def __init__(self, fp, timings: dict, name: str = "write"):
+        self._fp = fp
+        self._timings = timings
+        self._name = name
+
+    def write(self, data) -> int:
+        with stage_timer(self._timings, self._name):
+            return self._fp.write(data)
+
+    def fileno(self):
+        raise io.UnsupportedOperation("TimedWriter 는 fileno 를 제공하지 않는다.")
+
+    def __getattr__(self, name):
+        # tell / seek / flush 등은 실제 파일 객체에 넘긴다.
+        return getattr(self._fp, name)
+
+
+# ---------------------------
+# 지표 저장소
+# ---------------------------
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    counter / gauge / histogram 을 모으고 여러 프로세스 값을 합쳐 Prometheus 텍스트로 만든다.
+    directory 가 None 이면 파일을 쓰지 않고 이 프로세스 값만 내보낸다.
+    """
+
+    def __init__(self, directory: str = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._defs = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._counters = {}
+        self._histograms = {}
+        self._path = None
+
+    # -- 정의 --
+    def counter(self, name: str, help_text: str) -> None:
+        self._defs[name] = ("counter", help_text, None)
+
+    def gauge(self, name: str, help_text: str) -> None:
+        self._defs[name] = ("gauge", help_text, None)
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS) -> None:
+        self._defs[name] = ("histogram", help_text, tuple(buckets))
+
+    def collector(self, func) -> None:
+        """
+        파일에 함께 쓸 프로세스별 값을 돌려주는 함수를 등록한다.
+        func() 는 (name, labels, value) 목록을 돌려주고, histogram 이면 value 가 {"count", "sum", "buckets"} 이다.
+        DB 풀처럼 이미 자체적으로 누적하는 값을 옮겨 담을 때 쓴다.
+        """
+        self._collectors.append(func)
+
+    # -- 관측 --
+    def _check_pid(self) -> None:
+        # fork 로 물려받은 부모 값은 버리고, 이 프로세스의 flush 스레드를 띄운다.
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._reset()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._path = os.path.join(self.directory, f"metrics_{pid}_{uuid.uuid4().hex[:8]}.json")
+            threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        buckets = self._defs[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_pid()
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {"count": 0, "sum": 0.0, "buckets": [0] * len(buckets)}
+            series["count"] += 1
+            series["sum"] += seconds
+            for i, bound in enumerate(buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+
+    # -- 프로세스별 파일 --
+    def snapshot(self) -> dict:
+        """이 프로세스의 값이다 (등록한 collector 값 포함)."""
+        with self._lock:
+            self._check_pid()
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [
+                [name, list(labels), {**series, "buckets": list(series["buckets"])}]
+                for (name, labels), series in self._histograms.items()
+            ]
+        gauges = []
+        for func in self._collectors:
+            try:
+                samples = func()
+            except Exception:
+                # 지표 수집 실패가 요청이나 flush 스레드를 깨뜨리면 안 된다.
+                continue
+            for name, labels, value in samples:
+                kind = self._defs[name][0]
+                entry = [name, sorted([k, str(v)] for k, v in labels.items()), value]
+                {"counter": counters, "gauge": gauges, "histogram": histograms}[kind].append(entry)
+        return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def flush(self) -> None:
+        if not self._path:
+            return
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, self._path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # 한 번 실패해도 다음 주기에 다시 쓴다.
+                pass
+
+    # -- 합치기 --
+    @contextmanager
+    def _dir_lock(self, exclusive: bool):
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _other_files(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.startswith("metrics_") and name.endswith(".json") and name != ARCHIVE_FILE
+            and os.path.join(self.directory, name) != self._path
+        ]
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _archive_dead(self) -> None:
+        """끝난 프로세스 파일의 카운터/히스토그램을 archive 에 합치고 지운다."""
+        dead = []
+        for path in self._other_files():
+            data = self._read(path)
+            if data is not None and not self._alive(data["pid"]):
+                dead.append((path, data))
+        if not dead:
+            return
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = self._read(archive_path) or {"counters": [], "histograms": []}
+        merged = _Merged()
+        merged.add(archive)
+        for _, data in dead:
+            merged.add(data, gauges=False)
+        tmp_path = f"{archive_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(merged.dump(), f)
+        # archive 를 먼저 바꾸고 파일을 지운다. 둘 다 배타 락 안에서 하므로 읽는 쪽이 두 번 더하지 않는다.
+        os.replace(tmp_path, archive_path)
+        for path, _ in dead:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def collect(self) -> "_Merged":
+        merged = _Merged()
+        merged.add(self.snapshot())
+        if not self.directory:
+            return merged
+        os.makedirs(self.directory, exist_ok=True)
+        with self._dir_lock(exclusive=True):
+            self._archive_dead()
+        with self._dir_lock(exclusive=False):
+            archive = self._read(os.path.join(self.directory, ARCHIVE_FILE))
+            if archive is not None:
+                merged.add(archive, gauges=False)
+            for path in self._other_files():
+                data = self._read(path)
+                if data is not None:
+                    merged.add(data, gauges=self._alive(data["pid"]))
+        return merged
+
+    def render(self, extra=()) -> str:
+        """
+        모든 프로세스 값을 합친 Prometheus 텍스트 형식(0.0.4)이다.
+        extra 는 스크랩할 때 한 번 계산하는 전역 값(SQLite 에 있어서 이미 모든 프로세스 합계인 큐 길이, 캐시 적중 수 등)의
+        (name, labels, value) 목록이다. 프로세스 값과 더하지 않고 그대로 쓴다.
+        """
+        merged = self.collect()
+        for name, labels, value in extra:
+            merged.set(self._defs[name][0], name, _label_key(labels), value)
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._defs.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for labels, series in sorted(merged.histograms.get(name, {}).items()):
+                    for bound, count in zip(buckets, series["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {series['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+                continue
+            source = merged.counters if kind == "counter" else merged.gauges
+            for labels, value in sorted(source.get(name, {}).items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Merged:
+    """여러 프로세스 스냅샷을 더한 결과이다."""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def add(self, data: dict, gauges: bool = True) -> None:
+        for name, labels, value in data.get("counters", ()):
+            series = self.counters.setdefault(name, {})
+            key = tuple(tuple(pair) for pair in labels)
+            series[key] = series.get(key, 0) + value
+        for name, labels, value in data.get("histograms", ()):
+            series = self.histograms.setdefault(name, {})
+            key = tuple(tuple(pair) for pair in labels)
+            current = series.get(key)
+            if current is None:
+                series[key] = {"count": value["count"], "sum": value["sum"], "buckets": list(value["buckets"])}
+                continue
+            current["count"] += value["count"]
+            current["sum"] += value["sum"]
+            current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+        if gauges:
+            for name, labels, value in data.get("gauges", ()):
+                series = self.gauges.setdefault(name, {})
+                key = tuple(tuple(pair) for pair in labels)
+                series[key] = series.get(key, 0) + value
+
+    def set(self, kind: str, name: str, labels: tuple, value) -> None:
+        target = self.counters if kind == "counter" else self.gauges
+        target.setdefault(name, {})[labels] = value
+
+    def dump(self) -> dict:
+        return {
+            "counters": [
+                [name, [list(pair) for pair in labels], value]
+                for name, series in self.counters.items()
+                for labels, value in series.items()
+            ],
+            "histograms": [
+                [name, [list(pair) for pair in labels], value]
+                for name, series in self.histograms.items()
+                for labels, value in series.items()
+            ],
+        }
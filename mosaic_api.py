@@ -0,0 +1,241 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_encoder import encode_image, open_for_output, resolve_output_format
+from metrics import TimedWriter, stage_timer
+
+
+# ---------------------------
+# 모자이크(픽셀화) 엔진
+# ---------------------------
+# 블록 평균 다운샘플링 + 최근접 업샘플링을 NumPy reshape 뷰로 처리한다.
+# 픽셀 단위 파이썬 루프를 쓰지 않으므로 24MP 사진도 단일 코어에서 수십 ms 안에 끝남이다.
+
+# blur_strength(0~100)를 짧은 변 대비 블록 크기 비율로 바꿀 때 쓰는 범위이다.
+MIN_BLOCK_RATIO = 0.01
+MAX_BLOCK_RATIO = 0.10
+MIN_BLOCK_SIZE = 2
+
+# 픽셀 수가 이보다 큰 이미지는 가로 띠(strip) 단위로(얼굴만이면 얼굴 박스 단위로) 처리해서
+# 작업 메모리를 띠/박스 크기로 묶는다. 단, Pillow 는 이미지를 통째로 디코드하므로 디코드된 원본 한 장은
+# 항상 메모리에 있다. 줄어드는 건 그 위에 더 드는 사본(np.array, fromarray, 모드 변환)이다.
+TILED_MIN_PIXELS = int(os.getenv("MOSAIC_TILED_MIN_PIXELS", str(16 * 1000 * 1000)))
+
+# 띠 하나의 목표 높이(px)이다. 실제 높이는 블록 크기의 배수로 내려 맞춘다.
+STRIP_ROWS = int(os.getenv("MOSAIC_STRIP_ROWS", "256"))
+
+
+def parse_blur_strength(value, default: int = 0) -> int:
+    """
+    폼에서 넘어온 blur_strength 값을 0~100 정수로 정규화한다.
+    """
+    try:
+        strength = int(float(value))
+    except (TypeError, ValueError):
+        strength = default
+    return max(0, min(100, strength))
+
+
+def block_size_for_strength(strength: int, width: int, height: int) -> int:
+    """
+    blur_strength(0~100)와 이미지 크기로부터 모자이크 블록 크기(px)를 계산한다.
+    해상도가 달라도 같은 강도면 비슷한 느낌이 나도록 짧은 변 기준 비율로 정함이다.
+    """
+    strength = parse_blur_strength(strength)
+    ratio = MIN_BLOCK_RATIO + (MAX_BLOCK_RATIO - MIN_BLOCK_RATIO) * strength / 100.0
+    return max(MIN_BLOCK_SIZE, int(round(min(width, height) * ratio)))
+
+
+def _fill_blocks(view: np.ndarray, bh: int, bw: int) -> None:
+    """
+    (H, W, C) 뷰를 bh x bw 블록으로 나눠 각 블록을 평균색으로 채운다.
+    H, W 는 각각 bh, bw 의 배수여야 한다. reshape 는 축 분할만 하므로 복사 없이 뷰로 동작함이다.
+    """
+    h, w, c = view.shape
+    if h == 0 or w == 0:
+        return
+    rows = h // bh
+    count = bh * bw
+    # 세로 방향 합 → 가로 방향 합 순서로 나눠 줄인다.
+    # 블록 안의 오프셋마다 strided 슬라이스를 더하는 방식이라 블록이 작아도 데이터를 한 번만 훑음이다.
+    row_sums = view[0::bh].astype(np.uint32)
+    for i in range(1, bh):
+        row_sums += view[i::bh]
+    sums = row_sums[:, 0::bw].copy()
+    for j in range(1, bw):
+        sums += row_sums[:, j::bw]
+    means = ((sums + count // 2) // count).astype(view.dtype)
+    # 가로로만 먼저 늘린 뒤 행 단위 브로드캐스팅으로 채워서 최근접 업샘플링을 한다.
+    view.reshape(rows, bh, w, c)[...] = np.repeat(means, bw, axis=1)[:, None]
+
+
+def pixelate_array(arr: np.ndarray, block: int) -> np.ndarray:
+    """
+    uint8 배열(H, W) 또는 (H, W, C)를 제자리(in-place)에서 픽셀화하고 그대로 돌려준다.
+    가장자리의 나머지 영역은 더 작은 블록으로 따로 평균을 낸다.
+    """
+    if block <= 1:
+        return arr
+
+    view = arr[..., None] if arr.ndim == 2 else arr
+    h, w = view.shape[:2]
+    hc = h - h % block
+    wc = w - w % block
+    rh = h - hc
+    rw = w - wc
+
+    _fill_blocks(view[:hc, :wc], block, block)
+    if rw:
+        _fill_blocks(view[:hc, wc:], block, rw)
+    if rh:
+        _fill_blocks(view[hc:, :wc], rh, block)
+    if rh and rw:
+        _fill_blocks(view[hc:, wc:], rh, rw)
+    return arr
+
+
+def working_mode(img: Image.Image) -> str:
+    """
+    처리에 쓸 모드이다. 투명도가 있으면 RGBA(알파까지 블록 평균), 없으면 RGB 이다.
+    """
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        return "RGBA"
+    return "RGB"
+
+
+def strip_bounds(height: int, block: int, rows: int = STRIP_ROWS):
+    """
+    이미지를 블록 경계에 맞춘 가로 띠 (y0, y1) 들로 나눈다.
+    띠 높이가 블록의 배수이므로 블록이 두 띠에 걸치지 않고, 남는 줄은 마지막 띠에 붙는다.
+    """
+    step = max(block, rows - rows % block)
+    full = height - height % block
+    y0 = 0
+    while y0 < height:
+        y1 = y0 + step
+        if y1 >= full:
+            # 마지막 띠는 나머지 줄까지 포함해서 pixelate_array 가 전체 처리 때와 같은 블록을 만들게 한다.
+            y1 = height
+        yield y0, y1
+        y0 = y1
+
+
+def pixelate_image_tiled(img: Image.Image, block: int, rows: int = STRIP_ROWS) -> Image.Image:
+    """
+    PIL 이미지를 가로 띠 단위로 잘라 픽셀화하고 RGB(투명도가 있으면 RGBA) 이미지로 돌려준다.
+    전체 배열 사본(np.array, fromarray, 모드 변환)을 만들지 않으므로 추가 메모리는 띠 몇 개 크기이다.
+    이미 작업 모드인 이미지는 img 자체를 제자리에서 고치고, 그 외 모드는 같은 크기의 새 이미지에 채운다.
+    블록 경계에 맞춰 자르므로 결과 픽셀은 전체를 한 번에 처리한 것과 똑같다.
+    """
+    mode = working_mode(img)
+    out = img if img.mode == mode else Image.new(mode, img.size)
+    for y0, y1 in strip_bounds(img.height, block, rows):
+        strip = img.crop((0, y0, img.width, y1))
+        if strip.mode != mode:
+            strip = strip.convert(mode)
+        arr = np.array(strip)
+        pixelate_array(arr, block)
+        out.paste(Image.fromarray(arr, mode), (0, y0))
+    return out
+
+
+def mosaic_image(
+    img: Image.Image,
+    blur_strength=0,
+    face_only: bool = False,
+    exclude_user_id=None,
+    tiled: bool = None,
+    timings: dict = None,
+) -> Image.Image:
+    """
+    PIL 이미지를 받아 blur_strength 에 맞춰 모자이크 처리한 RGB(투명도가 있으면 RGBA) 이미지를 돌려준다.
+    face_only 면 탐지된 얼굴 영역만, 아니면 전체를 픽셀화한다.
+    exclude_user_id 가 있으면 그 사용자가 등록한 본인 얼굴은 남겨 둔다 (face_only 일 때만).
+    tiled 가 None 이면 TILED_MIN_PIXELS 보다 큰 이미지만 띠/박스 단위로 처리한다 (이때 입력이 제자리에서 고쳐질 수 있음).
+    timings 가 있으면 얼굴 탐지 시간을 timings["detect"] 에 더한다.
+    """
+    if tiled is None:
+        tiled = img.width * img.height > TILED_MIN_PIXELS
+    if tiled and face_only:
+        from face_detect import mosaic_faces_image
+
+        mode = working_mode(img)
+        # 작업 모드가 아니면(팔레트, CMYK 등) 변환 사본 한 장은 어쩔 수 없이 생긴다.
+        out = img if img.mode == mode else img.convert(mode)
+        mosaic_faces_image(out, blur_strength, exclude_user_id, timings=timings)
+        return out
+    if tiled:
+        block = block_size_for_strength(blur_strength, img.width, img.height)
+        return pixelate_image_tiled(img, block)
+
+    mode = working_mode(img)
+    if img.mode != mode:
+        img = img.convert(mode)
+    arr = np.array(img)
+    if face_only:
+        # face_detect 가 이 모듈의 커널을 쓰므로 순환 import 를 피하려고 함수 안에서 import 한다.
+        from face_detect import mosaic_faces
+
+        # 탐지기는 3채널만 받으므로 RGBA 는 색 채널만 떼어 처리하고 알파는 그대로 둔다.
+        rgb = np.ascontiguousarray(arr[..., :3]) if mode == "RGBA" else arr
+        mosaic_faces(rgb, blur_strength, color_order="RGB", exclude_user_id=exclude_user_id, timings=timings)
+        if rgb is not arr:
+            arr[..., :3] = rgb
+    else:
+        block = block_size_for_strength(blur_strength, img.width, img.height)
+        pixelate_array(arr, block)
+    return Image.fromarray(arr, mode)
+
+
+def process_image_file(
+    input_path: str,
+    output_path: str,
+    blur_strength=0,
+    face_only: bool = False,
+    exclude_user_id=None,
+    output_format: str = "keep",
+    quality: int = None,
+    target_bytes: int = None,
+    max_side: int = None,
+) -> dict:
+    """
+    디스크의 이미지를 읽어 모자이크 처리 후 output_path 에 저장하고 인코딩 정보를 돌려준다.
+    기본(keep)은 입력 포맷을 유지하며, 출력 옵션은 image_encoder.encode_image 를 따른다.
+    모든 모자이크 백엔드(인프로세스/프로세스 풀)가 공통으로 호출하는 진입점이다.
+    결과의 timings 는 단계별(decode/detect/mosaic/encode/write) 소요 시간(초)이다.
+    """
+    timings = {}
+    start = time.perf_counter()
+    with open_for_output(input_path, max_side) as src:
+        # Pillow 는 픽셀을 처음 쓸 때 디코드하므로 여기서 미리 풀어서 디코드 시간을 따로 잰다.
+        # 어차피 이미지를 통째로 디코드하므로 미리 불러도 최대 메모리는 같다 (디코드된 원본 한 장은 늘 상주).
+        src.load()
+        timings["decode"] = time.perf_counter() - start
+        fmt, progressive = resolve_output_format(output_format, src.format)
+        icc_profile = src.info.get("icc_profile")
+        # 띠 단위 처리는 src 를 제자리에서 고치므로 닫기 전에 저장한다.
+        with stage_timer(timings, "mosaic"):
+            img = mosaic_image(src, blur_strength, face_only, exclude_user_id, timings=timings)
+        with open(output_path, "wb") as out, stage_timer(timings, "encode"):
+            result = encode_image(img, TimedWriter(out, timings), fmt, progressive, quality, target_bytes, icc_profile)
+    # 바깥 구간에 안쪽 구간 시간이 들어 있으므로 빼서 단계끼리 겹치지 않게 한다.
+    timings["mosaic"] -= timings.get("detect", 0.0)
+    timings["encode"] -= timings.get("write", 0.0)
+    result["timings"] = timings
+    return result
+
+
+def warm_up() -> None:
+    """
+    워커 프로세스 시작 시 한 번 호출해서 NumPy/Pillow 초기화와 얼굴 탐지/임베딩 모델 로드를 미리 끝낸다.
+    """
+    from face_detect import get_detector
+    from face_index import get_index
+
+    img = Image.new("RGB", (64, 64))
+    mosaic_image(img, 50).tobytes()
+    get_detector()
+    get_index().refresh()
@@ -0,0 +1,197 @@
+import os
+
+import requests
+from requests.exceptions import RequestException
+
+from metrics import stage_timer
+from mosaic_api import process_image_file, warm_up
+from thumbnails import ensure_thumbnail
+from video_pipeline import DEFAULT_DETECT_INTERVAL, process_video_file
+from worker_pool import WorkerPool, WorkerCrashedError, WorkerTimeoutError
+
+
+# ---------------------------
+# 모자이크 백엔드
+# ---------------------------
+# 작업 러너는 process_file(input_path, output_path, options, kind) 하나만 호출하고,
+# options 는 작업 파라미터 dict (blur_strength, face_only, exclude_user_id, detect_interval,
+# 사진 출력 옵션 output_format / quality / target_bytes / max_side) 이다.
+# 실제 처리를 어디서 할지는 MOSAIC_BACKEND 설정으로 고른다.
+#   - process   : 관리형 프로세스 풀에 경로만 넘겨서 처리 (기본값)
+#   - inprocess : 같은 프로세스에서 함수 직접 호출 (직렬화 없음)
+#   - http      : 원격 모자이크 서버(/api/mosaic)에 업로드해서 처리
+
+
+class MosaicError(Exception):
+    """
+    모자이크 처리 실패를 나타내는 예외이다.
+    status 는 라우트가 그대로 돌려줄 HTTP 상태 코드이다.
+    """
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+def run_mosaic_job(kind: str, input_path: str, output_path: str, options: dict) -> dict:
+    """
+    작업 종류(image/video)에 맞는 처리 함수를 호출하고 처리 통계를 돌려준다.
+    결과 옆에 작업 기록용 썸네일도 같은 워커에서 만든다.
+    프로세스 풀 워커에서도 그대로 불리므로 모듈 최상위 함수로 둔다.
+    """
+    result = _run_kind(kind, input_path, output_path, options)
+    try:
+        with stage_timer(result.setdefault("timings", {}), "thumbnail"):
+            result["thumbnail"] = os.path.basename(ensure_thumbnail(output_path))
+    except Exception:
+        # 썸네일은 부가 기능이므로 실패해도 작업은 성공으로 둔다 (기록 화면에서 다시 시도함).
+        pass
+    return result
+
+
+def _run_kind(kind: str, input_path: str, output_path: str, options: dict) -> dict:
+    blur_strength = options.get("blur_strength", 0)
+    face_only = bool(options.get("face_only", False))
+    exclude_user_id = options.get("exclude_user_id")
+    if kind == "video":
+        return process_video_file(
+            input_path,
+            output_path,
+            blur_strength,
+            face_only,
+            exclude_user_id,
+            detect_interval=options.get("detect_interval", DEFAULT_DETECT_INTERVAL),
+        )
+    return process_image_file(
+        input_path,
+        output_path,
+        blur_strength,
+        face_only,
+        exclude_user_id,
+        output_format=options.get("output_format", "keep"),
+        quality=options.get("quality"),
+        target_bytes=options.get("target_bytes"),
+        max_side=options.get("max_side"),
+    )
+
+
+class InProcessBackend:
+    """
+    요청을 받은 프로세스 안에서 모자이크 함수를 바로 호출하는 백엔드이다.
+    """
+
+    name = "inprocess"
+
+    def process_file(self, input_path: str, output_path: str, options: dict, kind: str = "image") -> dict:
+        try:
+            return run_mosaic_job(kind, input_path, output_path, options)
+        except Exception as e:
+            raise MosaicError(f"모자이크 처리 중 오류 발생임이다: {e}") from e
+
+
+class ProcessPoolBackend:
+    """
+    관리형 프로세스 풀(worker_pool.WorkerPool)에 작업을 넘기는 백엔드이다.
+    파일 경로만 pickle 되므로 이미지 바이트가 프로세스 사이를 오가지 않는다.
+    """
+
+    name = "process"
+
+    def __init__(self, pool: WorkerPool, video_timeout: float = None):
+        self.pool = pool
+        self.video_timeout = video_timeout
+
+    def process_file(self, input_path: str, output_path: str, options: dict, kind: str = "image") -> dict:
+        # 동영상은 길이에 비례해서 오래 걸리므로 별도 제한 시간을 쓴다.
+        timeout = self.video_timeout if kind == "video" else None
+        # 풀은 처음 쓸 때 뜨므로 gunicorn 마스터에서 fork 전에 워커가 생기지 않는다.
+        future = self.pool.submit(
+            run_mosaic_job, kind, input_path, output_path, options, timeout=timeout
+        )
+        try:
+            return future.result()
+        except WorkerTimeoutError as e:
+            raise MosaicError(str(e), 504) from e
+        except WorkerCrashedError as e:
+            raise MosaicError(str(e), 502) from e
+        except Exception as e:
+            raise MosaicError(f"모자이크 처리 중 오류 발생임이다: {e}") from e
+
+
+class HttpBackend:
+    """
+    원격 모자이크 서버의 /api/mosaic 에 파일을 올리고 결과를 스트리밍으로 받아 저장하는 백엔드이다.
+    """
+
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url
+        self.timeout = timeout
+
+    def process_file(self, input_path: str, output_path: str, options: dict, kind: str = "image") -> dict:
+        # 원격 /api/mosaic 는 단일 이미지만 받는다.
+        if kind != "image":
+            raise MosaicError("http 백엔드는 동영상 처리를 지원하지 않음이다.", 501)
+        try:
+            with open(input_path, "rb") as f:
+                resp = requests.post(
+                    self.url,
+                    files={"file": (os.path.basename(input_path), f)},
+                    data={
+                        "blur_strength": options.get("blur_strength", 0),
+                        "face_only": "1" if options.get("face_only") else "",
+                        "output_format": options.get("output_format", "keep"),
+                        "quality": options.get("quality") or "",
+                        "target_kb": (options.get("target_bytes") or 0) // 1024,
+                        "max_side": options.get("max_side") or "",
+                    },
+                    timeout=self.timeout,
+                    stream=True,
+                )
+        except RequestException as e:
+            raise MosaicError(f"모자이크 API 서버 호출 중 예외 발생: {e}", 502) from e
+
+        with resp:
+            # 정상 응답(200)이 아니면 실패로 처리한다.
+            if resp.status_code != 200:
+                raise MosaicError(
+                    f"모자이크 API 호출 실패임이다. "
+                    f"status={resp.status_code}, body={resp.text[:200]}",
+                    502,
+                )
+            # 받는 도중 연결이 끊기거나 시간이 지나도 MosaicError 로 알리고, 반쯤 쓴 결과 파일은 남기지 않는다.
+            try:
+                with open(output_path, "wb") as out_f:
+                    for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                        out_f.write(chunk)
+            except (RequestException, OSError) as e:
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+                if isinstance(e, RequestException):
+                    raise MosaicError(f"모자이크 API 응답 수신 중 예외 발생: {e}", 502) from e
+                raise MosaicError(f"모자이크 결과 저장 중 오류 발생임이다: {e}") from e
+        return {}
+
+
+def create_backend(config) -> object:
+    """
+    앱 설정(MOSAIC_BACKEND 등)을 보고 알맞은 모자이크 백엔드를 만든다.
+    """
+    kind = config.get("MOSAIC_BACKEND", "process")
+    timeout = config.get("MOSAIC_TIMEOUT", 60)
+
+    if kind == "inprocess":
+        return InProcessBackend()
+    if kind == "process":
+        pool = WorkerPool(
+            size=config.get("MOSAIC_WORKERS"),
+            task_timeout=timeout,
+            initializer=warm_up,
+        )
+        return ProcessPoolBackend(pool, video_timeout=config.get("MOSAIC_VIDEO_TIMEOUT"))
+    if kind == "http":
+        return HttpBackend(config["MOSAIC_API_URL"], timeout=timeout)
+    raise ValueError(f"알 수 없는 MOSAIC_BACKEND 값임이다: {kind}")
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+
+# ---------------------------
+# 비밀번호 해시 (bcrypt)
+# ---------------------------
+# bcrypt 한 번은 cost 12 기준 수백 ms 의 순수 CPU 작업이다. 요청 스레드에서 바로 돌리면
+# 로그인이 몰릴 때 업로드 같은 다른 라우트가 CPU 를 얻지 못한다.
+#   - 해시/검증은 전용 스레드(workers 개)에서만 돌린다. bcrypt 는 계산 중 GIL 을 놓으므로
+#     동시에 쓰는 코어 수가 workers 개로 묶이고 나머지 스레드는 계속 돈다.
+#   - 실행 중 + 대기 중인 작업이 workers + max_queue 를 넘으면 바로 HasherBusyError 로 거절한다 (503).
+#     대기열이 끝없이 길어져서 모든 요청이 느려지는 것보다 일부를 빨리 거절하는 편이 낫다.
+#   - cost(rounds)는 설정값을 따르고, 로그인할 때 저장된 해시의 cost 가 다르면 needs_rehash() 로
+#     알려 주어 새 cost 로 다시 저장한다 (비밀번호 재설정 없이 cost 를 올리거나 내릴 수 있다).
+
+# bcrypt 는 앞 72 바이트만 쓴다. bcrypt 5 부터는 더 긴 입력을 오류로 거절하므로
+# 예전 라이브러리가 조용히 자르던 것과 같게 직접 잘라서 기존 해시와 호환되게 한다.
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusyError(RuntimeError):
+    """해시 대기열이 가득 찼거나 timeout 안에 끝나지 않았을 때 발생한다."""
+
+
+def _encode(password: str) -> bytes:
+    return password.encode("utf-8")[:MAX_PASSWORD_BYTES]
+
+
+def hash_rounds(hashed: str):
+    """'$2b$12$...' 형태의 해시에서 cost 를 읽는다. 형식이 다르면 None 이다."""
+    parts = (hashed or "").split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """
+    bcrypt 해시/검증을 전용 스레드 풀에서 실행한다.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_queue: int = 32, timeout: float = 10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise HasherBusyError("비밀번호 처리 요청이 너무 많다.")
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusyError(f"비밀번호 처리가 {self.timeout:g}초 안에 끝나지 않았다.") from None
+
+    def queue_depth(self) -> int:
+        """실행 중이거나 기다리는 해시 작업 수이다."""
+        with self._lock:
+            return self._pending
+
+    def hash(self, password: str) -> str:
+        """password 를 현재 cost 로 해시한 문자열이다 (users.password 에 그대로 저장)."""
+        return self._run(self._hash, password)
+
+    def check(self, hashed: str, password: str) -> bool:
+        """저장된 해시와 비밀번호가 맞는지 확인한다. 해시 형식이 잘못됐으면 False 이다."""
+        if not hashed or not password:
+            return False
+        return self._run(self._check, hashed, password)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """저장된 해시의 cost 가 현재 설정과 다르면 True 이다."""
+        return hash_rounds(hashed) != self.rounds
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(_encode(password), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    @staticmethod
+    def _check(hashed: str, password: str) -> bool:
+        hashed_bytes = hashed.encode("utf-8")
+        try:
+            return bcrypt.checkpw(_encode(password), hashed_bytes)
+        except ValueError:
+            return False
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+
+# ---------------------------
+# 내용 주소 기반 결과 캐시
+# ---------------------------
+# 키 = SHA-256(업로드 바이트) + 결과에 영향을 주는 모자이크 파라미터이다.
+# 같은 사진을 같은 옵션으로 다시 올리면 디코드/모자이크/인코딩 없이 저장된 결과를 바로 돌려준다.
+# 결과 파일은 캐시 디렉터리에 하드링크로 보관하므로 복사 비용이 없고,
+# 메타데이터(크기, 마지막 접근 시각)와 hit/miss 카운터는 SQLite 에 두어 여러 워커 프로세스가 공유한다.
+# 전체 크기가 max_bytes 를 넘으면 마지막 접근이 오래된 항목부터 지운다 (LRU).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries (last_access);
+CREATE TABLE IF NOT EXISTS cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+def make_cache_key(content_hash: str, kind: str, params: dict, output_ext: str) -> str:
+    """
+    업로드 해시와 결과에 영향을 주는 파라미터로 캐시 키를 만든다.
+    """
+    canonical = json.dumps(
+        {"kind": kind, "ext": output_ext.lower(), "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(f"{content_hash}:{canonical}".encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # 다른 파일시스템이거나 하드링크를 지원하지 않으면 복사한다.
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """
+    크기 제한 LRU 결과 캐시이다. lookup() 은 결과를 output_path 에 연결해 주고 hit 여부를 돌려준다.
+    """
+
+    def __init__(self, directory: str, db_path: str, max_bytes: int):
+        self.directory = directory
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _bump(self, conn, name: str) -> None:
+        conn.execute(
+            "INSERT INTO cache_counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def lookup(self, key: str, output_path: str) -> bool:
+        """
+        key 에 해당하는 결과가 있으면 output_path 에 하드링크하고 True 를 돌려준다.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT filename FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            cached_path = os.path.join(self.directory, row[0]) if row else None
+            if cached_path is None or not os.path.exists(cached_path):
+                if row:
+                    # 파일이 지워진 항목은 정리한다.
+                    conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                self._bump(conn, "misses")
+                return False
+
+            _link_or_copy(cached_path, output_path)
+            conn.execute("UPDATE cache_entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._bump(conn, "hits")
+            return True
+
+    def store(self, key: str, output_path: str) -> None:
+        """
+        처리된 결과 파일을 캐시에 등록하고 용량을 넘으면 오래된 항목을 지운다.
+        """
+        filename = key + os.path.splitext(output_path)[1].lower()
+        cached_path = os.path.join(self.directory, filename)
+        _link_or_copy(output_path, cached_path)
+        size = os.path.getsize(cached_path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, filename, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, filename, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, filename, size in conn.execute(
+            "SELECT key, filename, size FROM cache_entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._bump(conn, "evictions")
+
+    def stats(self) -> dict:
+        """hits / misses / evictions / entries / bytes 를 돌려준다."""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM cache_counters").fetchall())
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": total,
+        }
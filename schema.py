@@ -0,0 +1,206 @@
+import threading
+import time
+
+
+# ---------------------------
+# DB 스키마 보강
+# ---------------------------
+# 원격 MariaDB 에는 별도 마이그레이션 도구가 없으므로 앱이 필요한 컬럼/인덱스를 직접 확인해서 추가한다.
+# 프로세스마다 첫 요청에서 한 번만 실행되고(SchemaMigrator), 이미 적용된 항목은 information_schema / schema_markers 조회만 한다.
+#
+# job_history.media_type
+#   예전에는 original_filename LIKE '%.mp4' ... 를 16 개 이어 붙여 사진/동영상을 나눴는데
+#   이런 조건은 인덱스를 탈 수 없어서 탭을 바꿀 때마다 테이블 전체를 훑었다.
+#   이제 INSERT 때 'image' / 'video' 를 저장하고 (user_id, media_type, created_at) 인덱스로 찾는다.
+#
+# password_resets.token_hash
+#   재설정 토큰을 평문 token 컬럼(인덱스 없음)으로 찾던 것을 SHA-256 해시 컬럼 + 인덱스로 찾는다.
+#   새 행은 token 컬럼에도 평문 대신 해시를 저장한다. 만료/사용 행 정리(maintenance.py)용 expires_at, (used, expires_at) 인덱스도 둔다.
+#
+# 기존 행 채우기(UPDATE ... WHERE 컬럼 IS NULL)는 그 컬럼에 인덱스가 없어 매번 테이블을 훑으므로,
+# 끝까지 채우면 schema_markers 에 이름을 남기고 다음 기동부터는 표시만 확인하고 건너뛴다.
+# 새 행은 INSERT 때 값을 넣으므로 한 번 채운 뒤에는 다시 NULL 이 생기지 않는다.
+
+VIDEO_EXTS = (".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm")
+
+# 기존 행 채우기는 잠금이 길어지지 않게 이 개수씩 나눠서 한다.
+BACKFILL_BATCH = 5000
+
+# 스키마 확인이 실패했을 때(DB 접속 불가 등) 다시 시도하기까지의 시간(초)이다.
+RETRY_SECONDS = 60
+
+JOB_HISTORY_INDEXES = {
+    # 사진/동영상 탭: WHERE user_id = ? AND media_type = ? ORDER BY created_at DESC, id DESC
+    "idx_job_history_user_media_created": "(user_id, media_type, created_at, id)",
+    # 전체 탭: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    "idx_job_history_user_created": "(user_id, created_at, id)",
+}
+
+
+def media_type_for_filename(filename: str) -> str:
+    """파일 이름(확장자)으로 'image' / 'video' 를 정한다. 예전 행을 채울 때 쓴다."""
+    return "video" if (filename or "").lower().endswith(VIDEO_EXTS) else "image"
+
+
+def _is_sqlite(cur) -> bool:
+    # db_pool 의 SQLite 대용품 커서이다. information_schema 대신 SQLite 카탈로그를 본다.
+    return getattr(cur, "dialect", "mysql") == "sqlite"
+
+
+def column_exists(cur, table: str, column: str) -> bool:
+    if _is_sqlite(cur):
+        cur.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cur.fetchall())
+    cur.execute(
+        "SELECT 1 FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column),
+    )
+    return cur.fetchone() is not None
+
+
+def index_exists(cur, table: str, index: str) -> bool:
+    if _is_sqlite(cur):
+        cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table, index),
+        )
+        return cur.fetchone() is not None
+    cur.execute(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index),
+    )
+    return cur.fetchone() is not None
+
+
+def _ensure_markers_table(conn, cur) -> None:
+    # 한 번만 하면 되는 작업(기존 행 채우기)의 완료 표시이다. 같은 DDL 이 MariaDB 와 SQLite 에서 모두 통한다.
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_markers ("
+        "name VARCHAR(64) NOT NULL PRIMARY KEY, "
+        "applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+
+
+def _backfill_once(conn, cur, name: str, update_sql: str, params: tuple = ()) -> None:
+    """
+    update_sql 을 BACKFILL_BATCH 개씩 더 바꿀 행이 없을 때까지 실행하고 name 으로 완료를 표시한다.
+    이미 표시가 있으면 아무것도 하지 않는다. update_sql 끝의 %s 에는 BACKFILL_BATCH 가 들어간다.
+    """
+    _ensure_markers_table(conn, cur)
+    cur.execute("SELECT 1 FROM schema_markers WHERE name = %s", (name,))
+    if cur.fetchone() is not None:
+        return
+    while True:
+        cur.execute(update_sql, params + (BACKFILL_BATCH,))
+        conn.commit()
+        if cur.rowcount < BACKFILL_BATCH:
+            break
+    ignore = "OR IGNORE" if _is_sqlite(cur) else "IGNORE"
+    cur.execute(f"INSERT {ignore} INTO schema_markers (name) VALUES (%s)", (name,))
+    conn.commit()
+
+
+def ensure_job_history_schema(conn) -> None:
+    """
+    job_history 에 media_type 컬럼과 목록 조회용 인덱스가 없으면 추가하고 기존 행을 채운다.
+    """
+    cur = conn.cursor()
+    try:
+        if not column_exists(cur, "job_history", "media_type"):
+            cur.execute("ALTER TABLE job_history ADD COLUMN media_type VARCHAR(10) NULL")
+            conn.commit()
+
+        video_clause = " OR ".join(["LOWER(original_filename) LIKE %s"] * len(VIDEO_EXTS))
+        video_params = tuple("%" + ext for ext in VIDEO_EXTS)
+        if _is_sqlite(cur):
+            # SQLite 는 UPDATE ... LIMIT 을 지원하지 않으므로 대상 id 를 하위 쿼리로 고른다.
+            batch_clause = "id IN (SELECT id FROM job_history WHERE media_type IS NULL LIMIT %s)"
+        else:
+            batch_clause = "media_type IS NULL LIMIT %s"
+        _backfill_once(
+            conn,
+            cur,
+            "job_history.media_type",
+            "UPDATE job_history SET media_type = CASE WHEN "
+            + video_clause
+            + " THEN 'video' ELSE 'image' END WHERE "
+            + batch_clause,
+            video_params,
+        )
+
+        for name, columns in JOB_HISTORY_INDEXES.items():
+            if not index_exists(cur, "job_history", name):
+                cur.execute(f"CREATE INDEX {name} ON job_history {columns}")
+                conn.commit()
+    finally:
+        cur.close()
+
+
+PASSWORD_RESETS_INDEXES = {
+    "idx_password_resets_token_hash": "(token_hash)",
+    "idx_password_resets_expires": "(expires_at)",
+    # 사용한 토큰 정리: WHERE used = 1 (maintenance.purge_reset_tokens)
+    "idx_password_resets_used_expires": "(used, expires_at)",
+}
+
+
+def ensure_password_resets_schema(conn) -> None:
+    """
+    password_resets 에 token_hash 컬럼과 인덱스가 없으면 추가하고 기존 행의 해시를 채운다.
+    """
+    cur = conn.cursor()
+    try:
+        if not column_exists(cur, "password_resets", "token_hash"):
+            cur.execute("ALTER TABLE password_resets ADD COLUMN token_hash CHAR(64) NULL")
+            conn.commit()
+
+        if _is_sqlite(cur):
+            batch_clause = "id IN (SELECT id FROM password_resets WHERE token_hash IS NULL LIMIT %s)"
+        else:
+            batch_clause = "token_hash IS NULL LIMIT %s"
+        _backfill_once(
+            conn,
+            cur,
+            "password_resets.token_hash",
+            "UPDATE password_resets SET token_hash = SHA2(token, 256) WHERE " + batch_clause,
+        )
+
+        for name, columns in PASSWORD_RESETS_INDEXES.items():
+            if not index_exists(cur, "password_resets", name):
+                cur.execute(f"CREATE INDEX {name} ON password_resets {columns}")
+                conn.commit()
+    finally:
+        cur.close()
+
+
+class SchemaMigrator:
+    """
+    프로세스당 한 번 스키마 보강을 실행한다. 실패하면 RETRY_SECONDS 뒤에 다시 시도한다.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.done = False
+        self._lock = threading.Lock()
+        self._next_try = 0.0
+
+    def run(self, get_connection, logger=None) -> bool:
+        """get_connection() 으로 DB 연결을 얻어 아직 적용하지 않은 보강을 실행하고 완료 여부를 돌려준다."""
+        if self.done or time.monotonic() < self._next_try:
+            return self.done
+        with self._lock:
+            if self.done:
+                return True
+            try:
+                conn = get_connection()
+                for step in self.steps:
+                    step(conn)
+                self.done = True
+            except Exception as e:
+                self._next_try = time.monotonic() + RETRY_SECONDS
+                if logger is not None:
+                    logger.error(f"DB 스키마 확인 실패: {e}")
+        return self.done
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import time
+import uuid
+
+from flask import redirect
+
+from media_serving import serve_media
+
+
+# ---------------------------
+# 업로드/결과 파일 저장소
+# ---------------------------
+# DB(job_history.output_filename, users.face_image)와 URL(/uploads/<이름>)은 지금처럼 파일 이름(key)만 쓰고,
+# 실제 위치는 저장소가 정한다.
+#   LocalStorage: root/ab/cd/<key> 로 나눠 저장한다. 한 디렉터리에 수백만 개가 쌓이면 목록/GC 가 느려지기 때문이다.
+#     ab/cd 는 key 의 첫 '.' 앞부분(stem)의 SHA-256 앞 4 글자이다. 결과(mosaic_x.jpg)와 그 썸네일
+#     (mosaic_x.thumb.webp)은 stem 이 같아서 같은 디렉터리에 놓인다.
+#     예전 버전이 root 에 바로 저장한 파일도 그대로 읽고, migrate_flat() 이 조금씩 샤드로 옮긴다.
+#   S3Storage: 같은 샤드 경로를 S3 호환 저장소(버킷/prefix)의 객체 키로 쓴다. 처리(OpenCV/PIL)는 로컬 파일이 필요하므로
+#     LocalStorage 를 작업/읽기 캐시로 두고, save() 때 올리고 없으면 local_path() 가 내려받는다.
+#     큰 파일은 boto3 전송 관리자가 multipart 로 나눠서 디스크에서 바로 올리고/받는다 (메모리에 통째로 올리지 않음).
+#     로컬 캐시에 없는 파일은 presigned URL 로 리다이렉트해서 S3 가 직접 (Range 포함) 내려준다.
+# boto3 는 S3Storage 를 쓸 때만 필요하다.
+
+# 샤드 디렉터리 깊이/폭: ab/cd → 65536 개 디렉터리
+SHARD_CHARS = 2
+SHARD_LEVELS = 2
+
+
+def shard_dir(key: str) -> str:
+    """key → 'ab/cd' 이다."""
+    stem = key.split(".", 1)[0]
+    digest = hashlib.sha256(stem.encode("utf-8")).hexdigest()
+    parts = [digest[i * SHARD_CHARS:(i + 1) * SHARD_CHARS] for i in range(SHARD_LEVELS)]
+    return "/".join(parts)
+
+
+def valid_key(key: str) -> bool:
+    # key 는 디렉터리 구분자 없는 파일 이름이어야 한다. 점으로 시작하는 이름은 임시 파일이다.
+    return bool(key) and "/" not in key and "\\" not in key and not key.startswith(".")
+
+
+class StorageError(RuntimeError):
+    """저장소에서 파일을 읽거나 쓸 수 없을 때 발생한다."""
+
+
+class LocalStorage:
+    """
+    로컬 디스크 저장소이다. work_path() 에 쓰면 그 자리가 최종 위치이므로 save() 는 할 일이 없다.
+    """
+
+    # save() 로 다른 곳에 올려야 하는 저장소인지 여부이다.
+    remote = False
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def relpath(self, key: str) -> str:
+        return f"{shard_dir(key)}/{key}"
+
+    def work_path(self, key: str) -> str:
+        """key 를 쓸 로컬 경로이다. 상위 디렉터리를 만들어 둔다."""
+        if not valid_key(key):
+            raise StorageError(f"잘못된 파일 이름이다: {key}")
+        path = os.path.join(self.root, self.relpath(key))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _existing(self, key: str):
+        if not valid_key(key):
+            return None
+        path = os.path.join(self.root, self.relpath(key))
+        if os.path.isfile(path):
+            return path
+        # 샤드 도입 전에 root 에 바로 저장된 파일
+        legacy = os.path.join(self.root, key)
+        if os.path.isfile(legacy):
+            return legacy
+        return None
+
+    def local_path(self, key: str):
+        """key 의 로컬 파일 경로이다. 없으면 None 이다."""
+        return self._existing(key)
+
+    def save(self, key: str) -> None:
+        """work_path(key) 에 쓴 파일을 저장소에 반영한다."""
+
+    def exists(self, key: str) -> bool:
+        return self._existing(key) is not None
+
+    def delete(self, key: str) -> list:
+        """key 를 지우고 지운 로컬 경로 목록을 돌려준다."""
+        removed = []
+        if not valid_key(key):
+            return removed
+        for path in (os.path.join(self.root, self.relpath(key)), os.path.join(self.root, key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(path)
+        return removed
+
+    def list_files(self):
+        """(key, size, mtime) 을 돌려준다. 샤드 디렉터리와 예전 평면 배치를 모두 훑는다."""
+        yield from self._scan(self.root, depth=0)
+
+    def _scan(self, directory: str, depth: int):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if depth < SHARD_LEVELS and len(entry.name) == SHARD_CHARS:
+                    yield from self._scan(entry.path, depth + 1)
+                continue
+            if entry.is_file(follow_symlinks=False):
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                yield entry.name, st.st_size, st.st_mtime
+
+    def migrate_flat(self, min_age: float = 3600, limit: int = 1000, managed=None) -> int:
+        """
+        root 에 바로 있던 예전 파일을 샤드 위치로 옮긴다. min_age 초 안에 바뀐 파일(아직 쓰는 중일 수 있음)과
+        managed(이름) 가 False 인 파일은 건드리지 않는다. 옮긴 개수를 돌려준다.
+        """
+        cutoff = time.time() - min_age
+        moved = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if moved >= limit:
+                    break
+                if not entry.is_file(follow_symlinks=False) or not valid_key(entry.name):
+                    continue
+                if managed is not None and not managed(entry.name):
+                    continue
+                if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                    continue
+                os.replace(entry.path, self.work_path(entry.name))
+                moved += 1
+        return moved
+
+    def serve(self, key: str, etags, mode: str = "", accel_prefix: str = "", max_age: int = 0):
+        path = self._existing(key)
+        if path is None:
+            return "파일을 찾을 수 없음이다.", 404
+        return serve_media(
+            self.root,
+            os.path.relpath(path, self.root).replace(os.sep, "/"),
+            etags,
+            mode=mode,
+            accel_prefix=accel_prefix,
+            max_age=max_age,
+        )
+
+
+class S3Storage(LocalStorage):
+    """
+    S3 호환 저장소이다. root 는 작업/읽기 캐시로 쓰고 원본은 bucket 에 둔다.
+    endpoint_url 로 MinIO 같은 로컬 S3 대용품을 가리킬 수 있다.
+    """
+
+    remote = True
+
+    def __init__(
+        self,
+        root: str,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str = None,
+        region: str = None,
+        multipart_chunk: int = 16 * 1024 * 1024,
+        presign_seconds: int = 3600,
+    ):
+        super().__init__(root)
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError as e:
+            raise StorageError("STORAGE_BACKEND=s3 에는 boto3 가 필요하다 (pip install boto3).") from e
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presign_seconds = presign_seconds
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        # multipart_chunk 보다 큰 파일은 그 크기 조각으로 나눠 병렬 전송한다.
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_chunk,
+            multipart_chunksize=multipart_chunk,
+            max_concurrency=4,
+        )
+
+    def object_key(self, key: str) -> str:
+        rel = self.relpath(key)
+        return f"{self.prefix}/{rel}" if self.prefix else rel
+
+    def save(self, key: str) -> None:
+        path = super().local_path(key)
+        if path is None:
+            raise StorageError(f"올릴 파일이 없음이다: {key}")
+        try:
+            self.client.upload_file(path, self.bucket, self.object_key(key), Config=self.transfer)
+        except Exception as e:
+            raise StorageError(f"S3 업로드 실패 ({key}): {e}") from e
+
+    def local_path(self, key: str):
+        path = super().local_path(key)
+        if path is not None or not valid_key(key):
+            return path
+        path = self.work_path(key)
+        # 같은 프로세스의 여러 스레드가 같은 key 를 동시에 내려받을 수 있으므로 임시 파일은 호출마다 따로 둔다.
+        # 각자 끝까지 받은 파일을 os.replace 로 바꿔 넣으므로 캐시에는 늘 완전한 파일만 놓인다.
+        tmp_path = f"{path}.{uuid.uuid4().hex}.download"
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), tmp_path, Config=self.transfer)
+        except Exception:
+            # 없는 key(404)와 전송 실패 모두 "로컬에 없음" 으로 본다.
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            return None
+        os.replace(tmp_path, path)
+        return path
+
+    def exists(self, key: str) -> bool:
+        if super().exists(key):
+            return True
+        if not valid_key(key):
+            return False
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception:
+            return False
+        return True
+
+    def delete(self, key: str) -> list:
+        removed = super().delete(key)
+        if valid_key(key):
+            self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        return removed
+
+    def list_files(self):
+        """버킷 객체와 아직 올리지 않은 로컬 파일을 함께 돌려준다."""
+        seen = set()
+        paginator = self.client.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket}
+        if self.prefix:
+            kwargs["Prefix"] = self.prefix + "/"
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get("Contents", ()):
+                key = obj["Key"].rsplit("/", 1)[-1]
+                seen.add(key)
+                yield key, obj["Size"], obj["LastModified"].timestamp()
+        for key, size, mtime in super().list_files():
+            if key not in seen:
+                yield key, size, mtime
+
+    def trim_cache(self, max_age: float = 24 * 3600) -> int:
+        """버킷에 올라가 있고 max_age 초 동안 바뀌지 않은 로컬 캐시 파일을 지운다."""
+        remote = set()
+        paginator = self.client.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket}
+        if self.prefix:
+            kwargs["Prefix"] = self.prefix + "/"
+        for page in paginator.paginate(**kwargs):
+            remote.update(obj["Key"].rsplit("/", 1)[-1] for obj in page.get("Contents", ()))
+        cutoff = time.time() - max_age
+        removed = 0
+        for key, _, mtime in super().list_files():
+            if key in remote and mtime < cutoff:
+                removed += len(LocalStorage.delete(self, key))
+        return removed
+
+    def serve(self, key: str, etags, mode: str = "", accel_prefix: str = "", max_age: int = 0):
+        if super().local_path(key) is not None:
+            return super().serve(key, etags, mode, accel_prefix, max_age)
+        if not self.exists(key):
+            return "파일을 찾을 수 없음이다.", 404
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=self.presign_seconds,
+        )
+        return redirect(url, code=302)
+
+
+def create_storage(config) -> LocalStorage:
+    """STORAGE_BACKEND 설정(local / s3)에 맞는 저장소를 만든다."""
+    backend = config.get("STORAGE_BACKEND", "local")
+    if backend == "s3":
+        return S3Storage(
+            config["UPLOAD_FOLDER"],
+            config["S3_BUCKET"],
+            prefix=config.get("S3_PREFIX", ""),
+            endpoint_url=config.get("S3_ENDPOINT_URL"),
+            region=config.get("S3_REGION"),
+            multipart_chunk=config.get("S3_MULTIPART_CHUNK", 16 * 1024 * 1024),
+        )
+    if backend != "local":
+        raise StorageError(f"알 수 없는 STORAGE_BACKEND 이다: {backend}")
+    return LocalStorage(config["UPLOAD_FOLDER"])
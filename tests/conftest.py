@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 저장소 루트의 모듈(app.py 와 같은 평면 배치)을 테스트에서 바로 import 할 수 있게 한다.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
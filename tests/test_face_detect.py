@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from face_detect import get_detector
+from mosaic_api import mosaic_image
+
+
+def _synthetic_face(size: int) -> np.ndarray:
+    # Haar cascade 가 얼굴로 잡는 단순한 그림(얼굴 윤곽, 눈썹, 눈, 코, 입)이다.
+    img = np.full((size, size), 200, np.uint8)
+    c = size // 2
+    cv2.ellipse(img, (c, c), (int(size * 0.36), int(size * 0.46)), 0, 0, 360, 170, -1)
+    for dx in (-1, 1):
+        cv2.ellipse(img, (c + dx * int(size * 0.15), int(size * 0.40)), (int(size * 0.09), int(size * 0.045)), 0, 0, 360, 40, -1)
+        cv2.ellipse(img, (c + dx * int(size * 0.15), int(size * 0.31)), (int(size * 0.11), int(size * 0.025)), 0, 0, 360, 70, -1)
+    cv2.ellipse(img, (c, int(size * 0.55)), (int(size * 0.04), int(size * 0.09)), 0, 0, 360, 140, -1)
+    cv2.ellipse(img, (c, int(size * 0.72)), (int(size * 0.14), int(size * 0.04)), 0, 0, 360, 60, -1)
+    return cv2.GaussianBlur(img, (0, 0), size / 60)
+
+
+def _photo(width: int, height: int, mode: str) -> Image.Image:
+    # 축소 방식이 다르면 결과가 달라지도록 잡음이 섞인 배경 위에 얼굴을 그린다.
+    rng = np.random.default_rng(0)
+    channels = len(mode)
+    arr = rng.integers(150, 250, size=(height, width, channels), dtype=np.uint8)
+    face = _synthetic_face(min(width, height) // 2)
+    y0, x0 = height // 5, width // 3
+    arr[y0:y0 + face.shape[0], x0:x0 + face.shape[1], :3] = face[..., None]
+    return Image.fromarray(arr, mode)
+
+
+@pytest.mark.parametrize("width, height, mode", [(4999, 3001, "RGB"), (2003, 4517, "RGBA")])
+def test_tiled_face_mosaic_matches_untiled(width, height, mode):
+    img = _photo(width, height, mode)
+    assert len(get_detector().detect_image(img)) > 0
+
+    untiled = mosaic_image(img.copy(), 60, face_only=True, tiled=False)
+    tiled = mosaic_image(img.copy(), 60, face_only=True, tiled=True)
+
+    assert tiled.mode == untiled.mode == mode
+    assert tiled.tobytes() == untiled.tobytes()
+    assert untiled.tobytes() != img.tobytes()
+
+
+def test_detect_image_matches_array_detect():
+    img = _photo(4999, 3001, "RGB")
+    np.testing.assert_array_equal(get_detector().detect_image(img), get_detector().detect(np.array(img), "RGB"))
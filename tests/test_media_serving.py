@@ -0,0 +1,159 @@
+import builtins
+import re
+import tracemalloc
+
+import pytest
+from flask import Flask
+
+import media_serving
+from media_serving import CHUNK_SIZE, ETagStore, serve_media
+
+
+# 디스크를 거의 쓰지 않는 희소 파일로 "큰 동영상" 을 흉내 낸다.
+LARGE_SIZE = 2 * 1024 ** 3
+
+
+@pytest.fixture
+def media_dir(tmp_path):
+    directory = tmp_path / "media"
+    directory.mkdir()
+    (directory / "small.mp4").write_bytes(bytes(range(256)) * 4)
+    with open(directory / "large.mp4", "wb") as f:
+        f.truncate(LARGE_SIZE)
+    return directory
+
+
+@pytest.fixture
+def etags(tmp_path):
+    return ETagStore(str(tmp_path / "etags.db"))
+
+
+@pytest.fixture
+def client(media_dir, etags):
+    app = Flask(__name__)
+
+    @app.route("/media/<path:filename>")
+    def media(filename):
+        return serve_media(str(media_dir), filename, etags)
+
+    return app.test_client()
+
+
+def _stream(client, url, headers):
+    # 본문을 한 번에 모으지 않고 조각씩 읽어서 길이만 센다.
+    resp = client.get(url, headers=headers, buffered=False)
+    total = 0
+    try:
+        for chunk in resp.response:
+            total += len(chunk)
+    finally:
+        resp.close()
+    return resp, total
+
+
+class _ReadSpy:
+    """open() 이 돌려준 파일에서 read() 로 읽은 바이트 수를 센다."""
+
+    def __init__(self):
+        self.reads = []
+
+    def open(self, path, mode="r", *args, **kwargs):
+        f = builtins.open(path, mode, *args, **kwargs)
+        spy = self
+        read = f.read
+
+        def counted(size=-1):
+            data = read(size)
+            spy.reads.append(len(data))
+            return data
+
+        f.read = counted
+        return f
+
+
+def test_range_on_large_file_reads_only_the_range(client, media_dir, etags, monkeypatch):
+    # ETag 는 파일마다 한 번만 계산해서 저장해 두므로 미리 만들어 두고, Range 요청의 읽기만 센다.
+    etags.get(str(media_dir / "large.mp4"))
+    spy = _ReadSpy()
+    monkeypatch.setattr(media_serving, "open", spy.open, raising=False)
+
+    start = LARGE_SIZE // 2
+    length = 3 * CHUNK_SIZE + 123
+    resp, total = _stream(client, "/media/large.mp4", {"Range": f"bytes={start}-{start + length - 1}"})
+
+    assert resp.status_code == 206
+    assert total == length
+    assert sum(spy.reads) == length
+    assert max(spy.reads) <= CHUNK_SIZE
+
+
+def test_range_on_large_file_keeps_memory_bounded(client, media_dir, etags):
+    etags.get(str(media_dir / "large.mp4"))
+    length = 64 * 1024 ** 2
+    tracemalloc.start()
+    try:
+        resp, total = _stream(client, "/media/large.mp4", {"Range": f"bytes=1000-{1000 + length - 1}"})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert resp.status_code == 206
+    assert total == length
+    # 64MB 를 보내도 한 번에 들고 있는 건 청크 몇 개 크기이다.
+    assert peak < 8 * CHUNK_SIZE
+
+
+def test_single_range_content_length(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.headers["Content-Range"] == "bytes 10-19/1024"
+    assert resp.headers["Content-Length"] == "10"
+    assert resp.data == bytes(range(10, 20))
+
+
+def test_suffix_range(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=-4"})
+    assert resp.status_code == 206
+    assert resp.headers["Content-Range"] == "bytes 1020-1023/1024"
+    assert resp.data == bytes(range(252, 256))
+
+
+def test_unsatisfiable_range_is_416(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=5000-6000"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == "bytes */1024"
+
+
+def test_multipart_content_length_matches_body(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=0-9,100-109,-5"})
+    assert resp.status_code == 206
+    boundary = re.search(r"boundary=(\w+)", resp.headers["Content-Type"]).group(1)
+    assert int(resp.headers["Content-Length"]) == len(resp.data)
+    assert resp.data.count(f"--{boundary}\r\n".encode()) == 3
+    assert resp.data.endswith(f"\r\n--{boundary}--\r\n".encode())
+    assert b"Content-Range: bytes 100-109/1024\r\n\r\n" + bytes(range(100, 110)) in resp.data
+
+
+def test_overlapping_ranges_are_merged(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=0-9,5-19"})
+    assert resp.status_code == 206
+    assert resp.headers["Content-Range"] == "bytes 0-19/1024"
+    assert resp.headers["Content-Length"] == "20"
+
+
+def test_if_none_match_returns_304(client):
+    first = client.get("/media/small.mp4")
+    assert first.status_code == 200
+    assert first.headers["Content-Length"] == "1024"
+    etag = first.headers["ETag"]
+
+    resp = client.get("/media/small.mp4", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == etag
+
+
+def test_stale_if_range_sends_full_file(client):
+    resp = client.get("/media/small.mp4", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert resp.status_code == 200
+    assert len(resp.data) == 1024
@@ -0,0 +1,82 @@
+import os
+
+import cv2
+from PIL import Image
+
+
+# ---------------------------
+# 작업 기록용 썸네일
+# ---------------------------
+# 작업이 끝나면 결과 파일 옆에 작은 WebP 썸네일(<결과 이름>.thumb.webp)을 만든다.
+# 동영상은 앞부분의 한 프레임을 포스터로 쓴다.
+# 결과 파일 이름은 작업마다 고유하므로 썸네일도 내용이 바뀌지 않고, 오래 캐시해도 된다.
+
+THUMB_SUFFIX = ".thumb.webp"
+THUMB_SIZE = (320, 320)
+THUMB_QUALITY = 70
+
+# 동영상 포스터로 쓸 프레임 위치(초)이다. 첫 프레임은 검은 화면인 경우가 많아서 조금 뒤를 쓴다.
+POSTER_SECONDS = 1.0
+
+VIDEO_EXTS = {".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm"}
+
+
+def thumbnail_name(output_filename: str) -> str:
+    """결과 파일 이름 → 썸네일 파일 이름이다."""
+    return os.path.splitext(output_filename)[0] + THUMB_SUFFIX
+
+
+def _save_webp(img: Image.Image, thumb_path: str) -> None:
+    img.thumbnail(THUMB_SIZE, Image.LANCZOS)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+    # 읽는 쪽이 반쯤 쓴 파일을 보지 않도록 임시 파일에 쓰고 교체한다.
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    img.save(tmp_path, format="WEBP", quality=THUMB_QUALITY, method=4)
+    os.replace(tmp_path, thumb_path)
+
+
+def make_image_thumbnail(src_path: str, thumb_path: str) -> None:
+    with Image.open(src_path) as img:
+        # JPEG 은 썸네일 크기 가까이 줄여서 디코드한다.
+        img.draft("RGB", THUMB_SIZE)
+        _save_webp(img, thumb_path)
+
+
+def make_video_poster(src_path: str, thumb_path: str) -> None:
+    cap = cv2.VideoCapture(src_path)
+    if not cap.isOpened():
+        raise ValueError(f"동영상을 열 수 없음이다: {os.path.basename(src_path)}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        target = int(fps * POSTER_SECONDS)
+        if frame_count > 0:
+            target = min(target, frame_count // 2)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        ok, frame = cap.read()
+        if not ok:
+            # 위치 이동을 지원하지 않는 컨테이너면 첫 프레임을 쓴다.
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = cap.read()
+        if not ok:
+            raise ValueError(f"동영상 프레임을 읽을 수 없음이다: {os.path.basename(src_path)}")
+    finally:
+        cap.release()
+    _save_webp(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), thumb_path)
+
+
+def ensure_thumbnail(output_path: str) -> str:
+    """
+    결과 파일의 썸네일이 없으면 만들고 썸네일 경로를 돌려준다.
+    """
+    thumb_path = os.path.join(
+        os.path.dirname(output_path), thumbnail_name(os.path.basename(output_path))
+    )
+    if os.path.exists(thumb_path):
+        return thumb_path
+    if os.path.splitext(output_path)[1].lower() in VIDEO_EXTS:
+        make_video_poster(output_path, thumb_path)
+    else:
+        make_image_thumbnail(output_path, thumb_path)
+    return thumb_path
@@ -0,0 +1,532 @@
+import fcntl
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+
+from flask import Request, current_app
+from werkzeug.utils import secure_filename
+
+
+# ---------------------------
+# 스트리밍 업로드
+# ---------------------------
+# 업로드 본문을 메모리나 Werkzeug 임시 파일에 모아 두었다가 다시 복사하지 않고,
+# 멀티파트 파서가 넘겨주는 조각을 바로 업로드 폴더 안의 임시 파일에 쓴다.
+# 쓰면서 SHA-256 과 크기를 계산하고 첫 바이트로 파일 종류를 판별하므로 저장이 끝나면 추가 I/O 가 없다.
+# 저장된 임시 파일은 commit_upload() 에서 고유한 이름으로 rename 만 하고,
+# 요청이 끝날 때까지 쓰이지 않은 임시 파일은 discard_uploads() 가 지운다.
+# 수 GB 동영상은 UploadSessionStore 로 조각을 나눠 올리고 끊기면 이어서 올린다.
+
+CHUNK_SIZE = 1024 * 1024
+
+# 파일 종류 판별에 쓰는 앞부분 바이트 수이다.
+SNIFF_BYTES = 32
+
+# ZIP 로컬 파일 헤더 시그니처이다.
+ZIP_MAGIC = b"PK\x03\x04"
+
+# 완료되지 않은 이어 올리기 세션을 지우기까지의 시간(초)이다.
+SESSION_TTL = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    kind TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    received INTEGER NOT NULL DEFAULT 0,
+    media_type TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class UploadError(Exception):
+    """업로드를 받을 수 없을 때 발생한다. status 는 그대로 HTTP 응답 코드로 쓴다."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_media_type(head: bytes):
+    """
+    파일 앞부분 바이트로 (kind, mime, ext) 를 판별한다. 모르는 형식이면 None 이다.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image", "image/jpeg", ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image", "image/png", ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image", "image/gif", ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image", "image/webp", ".webp"
+    if head[:2] == b"BM":
+        return "image", "image/bmp", ".bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image", "image/tiff", ".tiff"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"qt  ":
+            return "video", "video/quicktime", ".mov"
+        if brand in (b"heic", b"heix", b"mif1", b"avif"):
+            return "image", "image/heif", ".heic"
+        return "video", "video/mp4", ".mp4"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video", "video/x-msvideo", ".avi"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        # WebM 도 Matroska 컨테이너이다. 둘 다 OpenCV 로 읽을 수 있으므로 구분하지 않는다.
+        return "video", "video/x-matroska", ".mkv"
+    return None
+
+
+def unique_filename(filename: str, ext: str = "") -> str:
+    """
+    저장용 고유 파일 이름을 만든다. 같은 이름의 파일을 동시에 올려도 서로 덮어쓰지 않는다.
+    secure_filename 이 확장자를 날려 버리면(한글 파일명 등) 판별된 확장자를 붙인다.
+    """
+    safe = display_filename(filename, ext)
+    return f"{uuid.uuid4().hex[:16]}_{safe}"
+
+
+def display_filename(filename: str, ext: str = "") -> str:
+    """
+    기록/표시용 파일 이름이다. secure_filename 결과에 확장자가 없으면 ext 를 붙인다.
+    """
+    safe = secure_filename(filename or "") or "upload"
+    if ext and not os.path.splitext(safe)[1]:
+        safe = safe + ext
+    return safe
+
+
+class HashingFile:
+    """
+    쓰기와 동시에 SHA-256, 크기, 파일 종류를 계산하는 디스크 임시 파일이다.
+    Werkzeug 멀티파트 파서가 요구하는 write / seek / read 를 제공한다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.claimed = False
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._file = open(path, "w+b")
+        self._started = self._last_write = time.perf_counter()
+
+    def write(self, data: bytes) -> int:
+        self._last_write = time.perf_counter()
+        self.size += len(data)
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def receive_seconds(self) -> float:
+        """파일을 만든 뒤 마지막 조각을 받을 때까지 걸린 시간(초)이다."""
+        return self._last_write - self._started
+
+    @property
+    def head(self) -> bytes:
+        """파일 앞부분(SNIFF_BYTES 바이트까지)이다."""
+        return self._head
+
+    @property
+    def media_type(self):
+        return sniff_media_type(self._head)
+
+    def discard(self) -> None:
+        self.close()
+        if not self.claimed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def __getattr__(self, name):
+        # seek / read / readline / tell 등은 실제 파일 객체에 넘긴다.
+        return getattr(self._file, name)
+
+
+class StreamingRequest(Request):
+    """
+    멀티파트 파일 조각을 HashingFile 로 바로 받는 Flask 요청 클래스이다.
+    app.request_class 로 지정해서 쓴다. 임시 파일은 UPLOAD_INCOMING_DIR 에 만든다.
+    본문 크기 제한은 max_content_length(MAX_CONTENT_LENGTH 또는 라우트별 값)로 Werkzeug 가 검사한다.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        directory = current_app.config["UPLOAD_INCOMING_DIR"]
+        stream = HashingFile(os.path.join(directory, f"{uuid.uuid4().hex}.part"))
+        if not hasattr(self, "_upload_files"):
+            self._upload_files = []
+        self._upload_files.append(stream)
+        return stream
+
+
+def discard_uploads(request) -> None:
+    """요청에서 만든 임시 파일 중 commit_upload() 되지 않은 것을 지운다 (teardown 에서 호출)."""
+    for stream in getattr(request, "_upload_files", ()):
+        stream.discard()
+
+
+def commit_upload(file, storage, expected_kind: str = None, prefix: str = "", max_bytes: int = None) -> dict:
+    """
+    업로드된 FileStorage 를 저장소(storage.py)의 고유한 이름(key) 자리로 옮기고 정보를 돌려준다.
+    반환값: {"filename", "stored_name", "path", "sha256", "size", "mime", "receive_seconds"}
+    expected_kind("image"/"video") 와 실제 내용이 다르면 UploadError(415) 이다.
+    max_bytes 가 있으면 파일 하나가 그보다 클 때 UploadError(413) 이다 (요청 전체가 아니라 파일마다 보는 한도).
+    원격 저장소에 올리는 것(storage.save)은 호출하는 쪽이 필요할 때 한다.
+    """
+    stream = _spooled(file, storage)
+    if max_bytes and stream.size > max_bytes:
+        stream.discard()
+        raise UploadError("업로드 파일이 너무 큽니다.", 413)
+    return _claim(stream, file.filename, storage, expected_kind, prefix)
+
+
+def _spooled(file, storage) -> "HashingFile":
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        # StreamingRequest 를 거치지 않은 업로드(테스트 클라이언트 등)는 여기서 한 번 스트리밍 저장한다.
+        stream = _spool(stream, os.path.join(storage.root, f".{uuid.uuid4().hex}.part"))
+    return stream
+
+
+def _claim(stream: "HashingFile", filename: str, storage, expected_kind: str = None, prefix: str = "") -> dict:
+    media = stream.media_type
+    if media is None or (expected_kind and media[0] != expected_kind):
+        stream.discard()
+        raise UploadError("지원하지 않는 파일 형식입니다.", 415)
+
+    kind, mime, ext = media
+    stored_name = prefix + unique_filename(filename, ext)
+    path = storage.work_path(stored_name)
+    stream.close()
+    os.replace(stream.path, path)
+    stream.claimed = True
+    return {
+        "filename": display_filename(filename, ext),
+        "stored_name": stored_name,
+        "path": path,
+        "sha256": stream.sha256,
+        "size": stream.size,
+        "mime": mime,
+        "receive_seconds": stream.receive_seconds,
+    }
+
+
+def is_zip_upload(file) -> bool:
+    """업로드된 파일이 ZIP 압축 파일인지 확인한다 (확장자가 아니라 앞부분 바이트로 판단)."""
+    stream = file.stream
+    if isinstance(stream, HashingFile):
+        return stream.head.startswith(ZIP_MAGIC)
+    head = stream.read(len(ZIP_MAGIC))
+    stream.seek(0)
+    return head.startswith(ZIP_MAGIC)
+
+
+def commit_zip_images(file, storage, max_files: int, max_member_bytes: int) -> tuple:
+    """
+    업로드된 ZIP 안의 사진을 하나씩 풀어서 commit_upload() 와 같은 정보 목록으로 돌려준다.
+    압축을 풀 때도 조각 단위로 저장소에 바로 쓰므로 압축 파일이나 사진을 메모리에 통째로 올리지 않는다.
+    반환값: (uploads, skipped) — skipped 는 사진이 아니거나 너무 커서 건너뛴 항목 이름 목록이다.
+    사진이 max_files 개를 넘으면 UploadError(413) 이다.
+    """
+    stream = _spooled(file, storage)
+    stream.close()
+    uploads, skipped = [], []
+    try:
+        try:
+            with zipfile.ZipFile(stream.path) as archive:
+                for info in archive.infolist():
+                    name = info.filename.rsplit("/", 1)[-1]
+                    # 폴더, macOS 가 붙이는 __MACOSX/._ 메타데이터, 숨김 파일은 사진이 아니다.
+                    if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                        continue
+                    if info.file_size > max_member_bytes or info.flag_bits & 0x1:
+                        # 너무 크거나 암호가 걸린 항목
+                        skipped.append(name)
+                        continue
+                    if len(uploads) >= max_files:
+                        raise UploadError(f"한 번에 최대 {max_files}장까지 올릴 수 있습니다.", 413)
+                    # ZipExtFile 은 헤더의 원래 크기까지만 풀어 주므로 압축 폭탄도 max_member_bytes 를 넘지 않는다.
+                    try:
+                        with archive.open(info) as member:
+                            part = _spool(member, os.path.join(storage.root, f".{uuid.uuid4().hex}.part"))
+                    except NotImplementedError:
+                        # 지원하지 않는 압축 방식
+                        skipped.append(name)
+                        continue
+                    part.close()
+                    try:
+                        upload = _claim(part, name, storage, "image")
+                    except UploadError:
+                        skipped.append(name)
+                        continue
+                    # 압축을 푼 시간이므로 업로드 수신 시간으로 세지 않는다.
+                    upload["receive_seconds"] = None
+                    uploads.append(upload)
+        except (zipfile.BadZipFile, zlib.error) as e:
+            raise UploadError(f"압축 파일을 읽을 수 없습니다: {e}", 400) from e
+    except BaseException:
+        for upload in uploads:
+            storage.delete(upload["stored_name"])
+        raise
+    finally:
+        # 압축 파일 자체는 남기지 않는다.
+        stream.discard()
+    return uploads, skipped
+
+
+def _spool(src, path: str) -> HashingFile:
+    out = HashingFile(path)
+    try:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+    except Exception:
+        out.discard()
+        raise
+    return out
+
+
+# ---------------------------
+# 이어 올리기 (resumable) 세션
+# ---------------------------
+# 1) create()  : 파일 이름/전체 크기를 등록하고 세션 id 를 받는다.
+# 2) append()  : "Content-Range: bytes start-end/total" 조각을 순서대로 이어 붙인다.
+#                start 가 서버가 받은 바이트 수와 다르면 409 와 함께 현재 offset 을 알려 준다.
+# 3) finish()  : 전체 크기만큼 받았으면 고유 이름으로 옮기고 해시/종류를 돌려준다.
+# 진행 상황은 SQLite 에 있으므로 서버가 재시작되거나 다른 gunicorn 워커로 가도 이어서 받을 수 있다.
+# 해시는 조각을 받을 때 프로세스 메모리에서 이어서 계산하고, 중간에 끊겨 상태가 없으면 완료 때 한 번 다시 읽는다.
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def parse_content_range(value: str):
+    """'bytes start-end/total' 을 (start, end, total) 로 바꾼다. 형식이 틀리면 UploadError 이다."""
+    match = _CONTENT_RANGE.match((value or "").strip())
+    if not match:
+        raise UploadError("Content-Range 헤더가 올바르지 않습니다.", 400)
+    start, end, total = (int(g) for g in match.groups())
+    if end < start or end >= total:
+        raise UploadError("Content-Range 범위가 올바르지 않습니다.", 416)
+    return start, end, total
+
+
+class UploadSessionStore:
+    """
+    이어 올리기 세션 저장소이다. 조각 파일은 directory 에 <id>.part 로 쌓는다.
+    """
+
+    def __init__(self, db_path: str, directory: str, max_size: int):
+        self.db_path = db_path
+        self.directory = directory
+        self.max_size = max_size
+        self._hashers = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def create(self, user_id, kind: str, filename: str, size: int) -> dict:
+        if size <= 0:
+            raise UploadError("파일 크기가 올바르지 않습니다.", 400)
+        if size > self.max_size:
+            raise UploadError("업로드 파일이 너무 큽니다.", 413)
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        open(self._part_path(upload_id), "wb").close()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO upload_sessions (id, user_id, kind, filename, size, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, user_id, kind, filename, size, now, now),
+            )
+        return self.get(upload_id)
+
+    def get(self, upload_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (upload_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _lock_part(self, upload_id: str, mode: str):
+        """
+        세션의 조각 파일을 열고 배타 flock 을 건다. 같은 세션에 대한 조각 쓰기/완료를 프로세스와 상관없이 하나씩만 하게 한다.
+        이미 다른 요청이 잡고 있으면 409, 세션이 이미 완료/삭제되어 파일이 없으면 404 이다.
+        """
+        try:
+            f = open(self._part_path(upload_id), mode)
+        except FileNotFoundError:
+            raise UploadError("업로드를 찾을 수 없습니다.", 404) from None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            raise UploadError("같은 업로드에 대한 다른 요청을 처리하는 중입니다.", 409) from None
+        return f
+
+    def _current(self, upload: dict) -> dict:
+        # 잠금을 잡은 뒤 DB 의 최신 상태를 다시 읽는다. 부르는 쪽의 upload 도 최신 offset 으로 맞춘다.
+        row = self.get(upload["id"])
+        if row is None:
+            raise UploadError("업로드를 찾을 수 없습니다.", 404)
+        upload.update(row)
+        return row
+
+    def append(self, upload: dict, start: int, total: int, stream) -> int:
+        """
+        stream 을 upload 의 start 위치부터 이어 붙이고 새 offset 을 돌려준다.
+        같은 세션에 동시에 들어온 요청은 조각 파일 flock 으로 하나만 쓰고 나머지는 409 이며,
+        offset 확인과 저장은 잠금 안에서 DB 의 최신 값으로 한다 (received 비교 후 갱신).
+        """
+        upload_id = upload["id"]
+        if total != upload["size"]:
+            raise UploadError("전체 크기가 세션과 다릅니다.", 400)
+
+        with self._lock_part(upload_id, "r+b") as out:
+            current = self._current(upload)
+            if start != current["received"]:
+                raise UploadError(f"offset {current['received']} 부터 이어서 보내야 합니다.", 409)
+
+            with self._lock:
+                state = self._hashers.pop(upload_id, None)
+            hasher = state[1] if state and state[0] == start else None
+            if hasher is None and start == 0:
+                hasher = hashlib.sha256()
+
+            received = start
+            head = b""
+            # 이전 조각이 중간에 끊겼으면 기록된 offset 뒤의 찌꺼기를 버린다.
+            out.truncate(start)
+            out.seek(start)
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > upload["size"]:
+                    raise UploadError("세션 크기보다 많은 데이터를 받았습니다.", 413)
+                if start == 0 and len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                if hasher is not None:
+                    hasher.update(chunk)
+                out.write(chunk)
+            out.flush()
+
+            media_type = current["media_type"]
+            if start == 0:
+                # 첫 조각에서 바로 종류를 판별해서 엉뚱한 파일을 수 GB 씩 받지 않게 한다.
+                media = sniff_media_type(head)
+                if media is None or media[0] != upload["kind"]:
+                    self.delete(upload_id)
+                    raise UploadError("지원하지 않는 파일 형식입니다.", 415)
+                media_type = media[1]
+
+            with self._connect() as conn:
+                updated = conn.execute(
+                    "UPDATE upload_sessions SET received = ?, media_type = ?, updated_at = ? "
+                    "WHERE id = ? AND received = ?",
+                    (received, media_type, time.time(), upload_id, start),
+                ).rowcount
+            if not updated:
+                raise UploadError("같은 업로드에 대한 다른 요청이 먼저 반영되었습니다.", 409)
+            upload["received"] = received
+            upload["media_type"] = media_type
+        if hasher is not None:
+            with self._lock:
+                self._hashers[upload_id] = (received, hasher)
+        return received
+
+    def finish(self, upload: dict, storage) -> dict:
+        """
+        다 받은 세션 파일을 저장소의 고유한 이름 자리로 옮기고 commit_upload() 와 같은 정보를 돌려준다.
+        이미 완료한 세션을 다시 완료하면 404, 다른 요청이 쓰거나 완료하는 중이면 409 이다.
+        """
+        upload_id = upload["id"]
+        part_path = self._part_path(upload_id)
+        with self._lock_part(upload_id, "rb") as f:
+            current = self._current(upload)
+            if current["received"] != current["size"]:
+                raise UploadError("아직 모든 조각을 받지 않았습니다.", 409)
+
+            with self._lock:
+                state = self._hashers.pop(upload_id, None)
+            if state and state[0] == current["size"]:
+                content_hash = state[1].hexdigest()
+            else:
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                content_hash = digest.hexdigest()
+                f.seek(0)
+
+            media = sniff_media_type(f.read(SNIFF_BYTES))
+            ext = media[2] if media else ""
+            stored_name = unique_filename(current["filename"], ext)
+            path = storage.work_path(stored_name)
+            with self._connect() as conn:
+                # 세션 행을 먼저 지워서 완료를 한 번만 인정한다.
+                if not conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,)).rowcount:
+                    raise UploadError("업로드를 찾을 수 없습니다.", 404)
+            try:
+                os.replace(part_path, path)
+            except FileNotFoundError:
+                raise UploadError("업로드를 찾을 수 없습니다.", 404) from None
+        return {
+            "filename": display_filename(current["filename"], ext),
+            "stored_name": stored_name,
+            "path": path,
+            "sha256": content_hash,
+            "size": current["size"],
+            "mime": current["media_type"],
+        }
+
+    def delete(self, upload_id: str) -> None:
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+        try:
+            os.remove(self._part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def purge_stale(self, ttl: float = SESSION_TTL) -> int:
+        """ttl 초 동안 진행이 없는 세션과 조각 파일을 지우고 지운 개수를 돌려준다."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM upload_sessions WHERE updated_at < ?", (time.time() - ttl,)
+            ).fetchall()
+        for row in rows:
+            self.delete(row["id"])
+        return len(rows)
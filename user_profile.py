@@ -0,0 +1,123 @@
+import threading
+import time
+
+from flask import g
+
+from schema import column_exists
+
+
+# ---------------------------
+# 사용자 프로필 로더
+# ---------------------------
+# 마이페이지/작업 기록/계정 변경 화면은 모두 같은 users 조회를 하는데,
+# 예전에는 라우트마다(심하면 한 요청에서 세 번) SELECT 하고 매번 SHOW COLUMNS 까지 했다.
+#   - 스키마 기능(face_image 컬럼 유무)은 시작 후 한 번만 확인한다 (detect_features, SchemaMigrator 단계).
+#   - 한 요청 안에서는 flask.g 에 memo 해서 한 번만 조회한다.
+#   - 요청 사이에는 ttl 초 동안 프로세스 메모리에 캐시하고, 이메일/비밀번호/얼굴이 바뀌면 invalidate() 로 지운다.
+# ⚠ 캐시는 gunicorn 워커 프로세스마다 따로라서 다른 워커는 최대 ttl 초 동안 예전 값을 볼 수 있다 (그래서 짧게 둔다).
+
+
+def default_profile(user_id) -> dict:
+    """DB 조회가 안 될 때 화면에 쓰는 기본 프로필이다."""
+    return {
+        "id": user_id,
+        "email": "",
+        "name": "사용자",
+        "plan": "Free",
+        "credits": 0,
+        "face_image": None,
+    }
+
+
+class UserProfileLoader:
+    """
+    user_id → 프로필 dict 로더이다. load() 는 요청 memo → TTL 캐시 → DB 순서로 찾는다.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # face_image 컬럼 유무이다. detect_features() 전에는 있다고 가정한다.
+        self.has_face_image = True
+        self._cache = {}
+        self._lock = threading.Lock()
+        # 요청 사이 캐시 적중/실패 횟수이다 (/metrics).
+        self.hits = 0
+        self.misses = 0
+
+    def detect_features(self, conn) -> None:
+        """스키마 기능을 한 번 확인한다. SchemaMigrator 단계로 등록해서 쓴다."""
+        cur = conn.cursor()
+        try:
+            self.has_face_image = column_exists(cur, "users", "face_image")
+        finally:
+            cur.close()
+
+    def _query(self, conn, user_id):
+        cur = conn.cursor()
+        try:
+            if self.has_face_image:
+                cur.execute("SELECT id, email, face_image FROM users WHERE id = %s", (user_id,))
+            else:
+                cur.execute("SELECT id, email FROM users WHERE id = %s", (user_id,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+        if not row:
+            return None
+        email = row[1] or ""
+        profile = default_profile(row[0])
+        profile.update(
+            email=email,
+            name=email.split("@")[0] if email else "사용자",
+            face_image=(row[2] or None) if len(row) > 2 else None,
+        )
+        return profile
+
+    def load(self, get_connection, user_id, logger=None) -> dict:
+        """
+        프로필을 돌려준다. 조회에 실패하면 기본 프로필을 돌려주고 캐시하지 않는다.
+        템플릿이 고쳐도 캐시에 영향이 없도록 항상 사본을 돌려준다.
+        """
+        memo = g.setdefault("_user_profiles", {})
+        if user_id in memo:
+            return dict(memo[user_id])
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[0] > now:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached and cached[0] > now:
+            profile = cached[1]
+        else:
+            try:
+                profile = self._query(get_connection(), user_id)
+            except Exception as e:
+                if logger is not None:
+                    logger.error(f"사용자 정보 조회 실패: {e}")
+                return default_profile(user_id)
+            if profile is None:
+                return default_profile(user_id)
+            self._store(user_id, profile, now)
+
+        memo[user_id] = profile
+        return dict(profile)
+
+    def _store(self, user_id, profile: dict, now: float) -> None:
+        with self._lock:
+            if len(self._cache) >= self.max_entries and user_id not in self._cache:
+                # 가장 먼저 만료될 항목을 버린다.
+                oldest = min(self._cache, key=lambda k: self._cache[k][0])
+                del self._cache[oldest]
+            self._cache[user_id] = (now + self.ttl, profile)
+
+    def invalidate(self, user_id) -> None:
+        """이메일/비밀번호/얼굴 사진이 바뀐 뒤 호출해서 이 프로세스의 캐시와 요청 memo 를 지운다."""
+        with self._lock:
+            self._cache.pop(user_id, None)
+        memo = g.get("_user_profiles")
+        if memo:
+            memo.pop(user_id, None)
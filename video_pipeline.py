@@ -0,0 +1,245 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from face_detect import get_detector, owner_mask, pixelate_boxes
+from face_tracker import FaceTracker
+from metrics import stage_timer
+from mosaic_api import block_size_for_strength, pixelate_array
+
+
+# ---------------------------
+# 스트리밍 동영상 모자이크 파이프라인
+# ---------------------------
+# 디코드 → 모자이크 → 인코드를 제너레이터로 이어서 한 번에 몇 프레임만 메모리에 둔다.
+# 결과는 VideoWriter 로 프레임마다 바로 디스크에 쓰므로 2GB 동영상도 일정한 메모리로 처리됨이다.
+# 디코드는 별도 스레드에서 미리 읽어 두고(크기 제한 큐), OpenCV 가 GIL 을 풀어 주므로 인코드와 겹쳐 돈다.
+# ⚠ OpenCV VideoWriter 는 오디오 트랙을 쓰지 않는다.
+
+# 디코드 스레드가 미리 읽어 둘 수 있는 최대 프레임 수이다.
+DEFAULT_WINDOW = 8
+
+# 얼굴 탐지를 몇 프레임마다 돌릴지 기본값이다. 1 이면 매 프레임 탐지(최고 품질)이다.
+DEFAULT_DETECT_INTERVAL = 5
+MAX_DETECT_INTERVAL = 30
+
+# 출력 확장자별 FourCC 코드이다. 모르는 확장자는 mp4v 를 쓴다.
+FOURCC_BY_EXT = {
+    ".mp4": "mp4v",
+    ".m4v": "mp4v",
+    ".mov": "mp4v",
+    ".avi": "XVID",
+    ".mkv": "XVID",
+}
+
+
+class VideoError(Exception):
+    """동영상을 열거나 쓸 수 없을 때 발생한다."""
+
+
+def read_frames(path: str, timings: dict = None):
+    """
+    동영상을 한 프레임씩 디코드해서 (index, frame) 으로 내보내는 제너레이터이다.
+    timings 가 있으면 디코드 시간을 timings["decode"] 에 더한다.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise VideoError(f"동영상을 열 수 없음이다: {os.path.basename(path)}")
+    try:
+        index = 0
+        while True:
+            with stage_timer(timings, "decode"):
+                ok, frame = cap.read()
+            if not ok:
+                break
+            yield index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def prefetch(iterable, window: int = DEFAULT_WINDOW):
+    """
+    iterable 을 백그라운드 스레드에서 미리 당겨 오되 최대 window 개까지만 쌓아 둔다.
+    소비자가 느리면 생산자가 put 에서 막히므로 메모리가 window 크기로 묶인다.
+    """
+    buf = queue.Queue(maxsize=window)
+    done = object()
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                # 소비자가 중간에 멈추면 생산자도 빠져나오도록 타임아웃을 두고 넣는다.
+                while not stop.is_set():
+                    try:
+                        buf.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            while not stop.is_set():
+                try:
+                    buf.put(done, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    thread = threading.Thread(target=produce, name="video-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buf.get()
+            if item is done:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+
+
+def parse_detect_interval(value) -> int:
+    """
+    폼에서 넘어온 detect_interval 값을 1~MAX_DETECT_INTERVAL 정수로 정규화한다.
+    """
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        interval = DEFAULT_DETECT_INTERVAL
+    return max(1, min(MAX_DETECT_INTERVAL, interval))
+
+
+def make_tracker(detect_interval: int, exclude_user_id=None, timings: dict = None) -> FaceTracker:
+    """
+    BGR 프레임용 얼굴 추적기를 만든다. exclude_user_id 가 있으면 새 트랙마다 본인 얼굴인지 한 번 판단한다.
+    timings 가 있으면 탐지와 본인 얼굴 판별 시간을 timings["detect"] 에 더한다.
+    """
+    detector = get_detector()
+    owner = None
+    if exclude_user_id is not None:
+        def owner(frame, boxes):
+            with stage_timer(timings, "detect"):
+                return owner_mask(frame, boxes, exclude_user_id, "BGR")
+
+    def detect(frame):
+        with stage_timer(timings, "detect"):
+            return detector.detect(frame, "BGR")
+
+    return FaceTracker(
+        detect,
+        detect_interval=detect_interval,
+        owner_mask=owner,
+    )
+
+
+def mosaic_frames(
+    frames,
+    blur_strength=0,
+    face_only: bool = False,
+    exclude_user_id=None,
+    tracker: FaceTracker = None,
+    timings: dict = None,
+):
+    """
+    (index, frame) 스트림의 각 프레임을 제자리에서 픽셀화한다.
+    face_only 면 tracker 가 알려 주는 얼굴 박스만 처리하고, exclude_user_id 의 등록 얼굴은 남긴다.
+    timings 가 있으면 프레임 처리(추적/탐지 포함) 시간을 timings["mosaic"] 에 더한다.
+    """
+    if face_only and tracker is None:
+        tracker = make_tracker(1, exclude_user_id, timings)
+
+    block = None
+    for index, frame in frames:
+        with stage_timer(timings, "mosaic"):
+            if face_only:
+                pixelate_boxes(frame, tracker.step(index, frame), blur_strength)
+            else:
+                if block is None:
+                    h, w = frame.shape[:2]
+                    block = block_size_for_strength(blur_strength, w, h)
+                pixelate_array(frame, block)
+        yield index, frame
+
+
+def write_frames(frames, output_path: str, fps: float, size: tuple, timings: dict = None) -> int:
+    """
+    프레임 스트림을 output_path 에 순서대로 바로 기록하고, 기록한 프레임 수를 돌려준다.
+    timings 가 있으면 인코드(+쓰기) 시간을 timings["encode"] 에 더한다. VideoWriter 는 둘을 나눠 재지 못한다.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    fourcc = cv2.VideoWriter_fourcc(*FOURCC_BY_EXT.get(ext, "mp4v"))
+    writer = cv2.VideoWriter(output_path, fourcc, fps, size)
+    if not writer.isOpened():
+        raise VideoError(f"출력 동영상을 만들 수 없음이다: {os.path.basename(output_path)}")
+    count = 0
+    try:
+        for _, frame in frames:
+            with stage_timer(timings, "encode"):
+                writer.write(frame)
+            count += 1
+    finally:
+        writer.release()
+    return count
+
+
+def probe_video(path: str) -> dict:
+    """
+    동영상의 fps, 크기, 프레임 수(컨테이너가 알려주는 값)를 읽는다.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise VideoError(f"동영상을 열 수 없음이다: {os.path.basename(path)}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return {"fps": fps, "width": width, "height": height, "frame_count": frame_count}
+
+
+def process_video_file(
+    input_path: str,
+    output_path: str,
+    blur_strength=0,
+    face_only: bool = False,
+    exclude_user_id=None,
+    detect_interval: int = DEFAULT_DETECT_INTERVAL,
+    window: int = DEFAULT_WINDOW,
+) -> dict:
+    """
+    동영상 전체를 스트리밍으로 모자이크 처리하고 처리 통계(프레임 수, 소요 시간, 처리 fps, 탐지 횟수)를 돌려준다.
+    detect_interval 프레임마다(또는 장면 전환 시) 얼굴을 탐지하고 그 사이는 추적으로 채운다.
+    timings 는 단계별 누적 시간(초)이다. 디코드는 별도 스레드에서 겹쳐 돌므로 합이 전체 시간보다 클 수 있다.
+    """
+    info = probe_video(input_path)
+    started = time.perf_counter()
+
+    timings = {}
+    tracker = make_tracker(parse_detect_interval(detect_interval), exclude_user_id, timings) if face_only else None
+    frames = prefetch(read_frames(input_path, timings), window)
+    frames = mosaic_frames(frames, blur_strength, face_only, exclude_user_id, tracker, timings)
+    count = write_frames(frames, output_path, info["fps"], (info["width"], info["height"]), timings)
+    # mosaic 구간에 들어 있는 탐지 시간을 빼서 단계끼리 겹치지 않게 한다.
+    if "mosaic" in timings:
+        timings["mosaic"] -= timings.get("detect", 0.0)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": count,
+        "seconds": round(elapsed, 3),
+        "fps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "detections": tracker.detections if tracker else 0,
+        "timings": timings,
+    }
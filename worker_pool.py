@@ -0,0 +1,245 @@
+import atexit
+import os
+import queue
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future
+
+
+# ---------------------------
+# 관리형 프로세스 풀
+# ---------------------------
+# 모자이크 디코드/처리/인코딩은 CPU 작업이라 GIL 때문에 스레드로는 병렬화가 안 됨이다.
+# 워커 프로세스마다 전용 파이프와 감시 스레드를 하나씩 두어서
+#   - 작업별 타임아웃이 지나면 해당 워커만 죽이고 새로 띄우고
+#   - 워커가 비정상 종료하면 그 작업만 실패 처리한 뒤 새로 띄운다.
+# concurrent.futures.ProcessPoolExecutor 는 워커 하나만 골라 죽일 수 없어서 직접 구현함이다.
+
+
+class WorkerTimeoutError(TimeoutError):
+    """작업이 task_timeout 안에 끝나지 않아 워커를 재시작했을 때 발생한다."""
+
+
+class WorkerCrashedError(RuntimeError):
+    """작업 도중 워커 프로세스가 죽었을 때 발생한다."""
+
+
+class RemoteError(RuntimeError):
+    """워커 안에서 난 예외를 pickle 할 수 없을 때 대신 전달하는 예외이다."""
+
+
+def _worker_main(conn, initializer) -> None:
+    """
+    워커 프로세스 본체이다. 초기화(웜업)를 마치면 ready 를 보내고 작업을 기다린다.
+    """
+    if initializer is not None:
+        initializer()
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if msg is None:
+            break
+
+        func, args, kwargs = msg
+        try:
+            reply = ("ok", func(*args, **kwargs))
+        except BaseException as e:  # noqa: BLE001 - 부모에게 그대로 넘김
+            reply = ("error", e)
+
+        try:
+            conn.send(reply)
+        except Exception:
+            # 결과나 예외 객체가 pickle 되지 않는 경우 문자열로 바꿔서 보낸다.
+            conn.send(("error", RemoteError(traceback.format_exc())))
+
+
+class _WorkerSlot:
+    """
+    워커 프로세스 하나와 그 프로세스에 작업을 넘겨주는 감시 스레드 한 쌍이다.
+    """
+
+    def __init__(self, pool: "WorkerPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.thread = threading.Thread(
+            target=self._run, name=f"mosaic-worker-{index}", daemon=True
+        )
+
+    def launch(self) -> None:
+        ctx = self.pool._ctx
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.pool.initializer),
+            name=f"mosaic-worker-{self.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self.process = process
+        self.conn = parent_conn
+
+    def wait_ready(self) -> None:
+        # 웜업이 끝날 때까지 기다려서 첫 요청이 import/모델 로딩 비용을 내지 않게 한다.
+        if not self.conn.poll(self.pool.start_timeout):
+            self.kill()
+            raise WorkerCrashedError(f"워커 {self.index} 초기화 시간이 초과되었음이다.")
+        try:
+            self.conn.recv()
+        except EOFError as e:
+            self.kill()
+            raise WorkerCrashedError(f"워커 {self.index} 초기화 중 종료되었음이다.") from e
+
+    def spawn(self) -> None:
+        self.launch()
+        self.wait_ready()
+
+    def kill(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+        if self.process is not None:
+            self.process.join(timeout=5)
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def restart(self) -> None:
+        self.kill()
+        self.pool.restarts += 1
+        self.spawn()
+
+    def _run(self) -> None:
+        tasks = self.pool._tasks
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+
+            future, func, args, kwargs, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                self._execute(future, func, args, kwargs, timeout)
+            except Exception as e:
+                # 재시작까지 실패한 경우에도 호출자는 반드시 결과를 받아야 한다.
+                if not future.done():
+                    future.set_exception(e)
+
+    def _execute(self, future: Future, func, args, kwargs, timeout) -> None:
+        if self.process is None or not self.process.is_alive():
+            self.restart()
+
+        try:
+            self.conn.send((func, args, kwargs))
+        except (BrokenPipeError, EOFError, OSError):
+            self.restart()
+            self.conn.send((func, args, kwargs))
+
+        if not self.conn.poll(timeout):
+            self.restart()
+            future.set_exception(
+                WorkerTimeoutError(f"모자이크 작업이 {timeout}초 안에 끝나지 않았음이다.")
+            )
+            return
+
+        try:
+            status, payload = self.conn.recv()
+        except (EOFError, OSError):
+            exitcode = self.process.exitcode if self.process else None
+            self.restart()
+            future.set_exception(
+                WorkerCrashedError(f"모자이크 워커가 비정상 종료되었음이다. exitcode={exitcode}")
+            )
+            return
+
+        if status == "ok":
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+
+
+class WorkerPool:
+    """
+    크기 고정 프로세스 풀이다.
+    size 기본값은 CPU 코어 수이고 (app.py 는 코어 수를 gunicorn 워커 수로 나눈 MOSAIC_WORKERS 를 넘긴다), submit() 은 concurrent.futures.Future 를 돌려준다.
+    """
+
+    def __init__(
+        self,
+        size: int = None,
+        task_timeout: float = 60,
+        initializer=None,
+        start_timeout: float = 30,
+        mp_context: str = "spawn",
+    ):
+        self.size = size or os.cpu_count() or 1
+        self.task_timeout = task_timeout
+        self.initializer = initializer
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        # 감시 스레드가 있는 부모에서 fork 하면 락 상태가 복사될 수 있어서 spawn 을 기본으로 한다.
+        self._ctx = multiprocessing.get_context(mp_context)
+        self._tasks = queue.Queue()
+        self._slots = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        """
+        워커를 모두 띄우고 웜업이 끝날 때까지 기다린다. 여러 번 불러도 한 번만 실행된다.
+        """
+        with self._lock:
+            if self._started:
+                return
+            slots = [_WorkerSlot(self, i) for i in range(self.size)]
+            # 전부 먼저 띄운 뒤 웜업을 기다려서 초기화가 병렬로 진행되게 한다.
+            for slot in slots:
+                slot.launch()
+            for slot in slots:
+                slot.wait_ready()
+            for slot in slots:
+                slot.thread.start()
+            self._slots = slots
+            self._started = True
+            atexit.register(self.shutdown)
+
+    def submit(self, func, *args, timeout: float = None, **kwargs) -> Future:
+        """
+        func(*args, **kwargs) 를 워커에서 실행하도록 큐에 넣는다.
+        func 와 인자는 pickle 가능해야 한다 (모듈 최상위 함수 + 경로 같은 작은 값).
+        """
+        self.start()
+        future = Future()
+        self._tasks.put((future, func, args, kwargs, timeout or self.task_timeout))
+        return future
+
+    def queue_depth(self) -> int:
+        """아직 워커에 배정되지 않은 작업 수이다."""
+        return self._tasks.qsize()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            for _ in self._slots:
+                self._tasks.put(None)
+            for slot in self._slots:
+                slot.thread.join(timeout=5)
+                if slot.conn is not None:
+                    try:
+                        slot.conn.send(None)
+                        slot.process.join(timeout=1)
+                    except (BrokenPipeError, OSError):
+                        pass
+                slot.kill()
+            self._slots = []
+            self._started = False